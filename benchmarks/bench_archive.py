@@ -0,0 +1,55 @@
+"""
+Minutely archive (db_archive.py) vs plain price_minutely rows on the same synthetic database, with prices rounded
+to cents like real quotes: file size, archive bytes per bar, and the time of get_minutely_per_ticker (the archive
+decodes BLOBs with numpy instead of building one python tuple per row). Run from the project root:
+
+    python benchmarks/bench_archive.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.db_class import FinanceDB
+from src.db_migrate import archive_minutely
+from src.db_synthetic import generate_synthetic_db
+
+
+def best_time(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    num_tickers = 50
+    tickers = ['SYN%05d' % i for i in range(0, num_tickers, 5)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for schema_version in [1, 2]:
+            plain_path = os.path.join(tmp, 'plain_v%d.db' % schema_version)
+            archived_path = os.path.join(tmp, 'archived_v%d.db' % schema_version)
+            generate_synthetic_db(plain_path, num_tickers=num_tickers, years=1, minutely_days=120,
+                                  schema_version=schema_version, price_decimals=2)
+            shutil.copy(plain_path, archived_path)
+            rows = sum(archive_minutely(archived_path).values())
+            for label, path in [('plain', plain_path), ('archived', archived_path)]:
+                finance_db = FinanceDB(path)
+                archive_bytes = 0
+                if finance_db.archive is not None:
+                    archive_bytes = finance_db.dataframe_from_query(
+                        "SELECT SUM(length(data)) FROM price_minutely_archive").iloc[0, 0]
+                results['v%d %s' % (schema_version, label)] = (
+                    os.path.getsize(path) / 1024 ** 2, archive_bytes / rows,
+                    best_time(lambda: [finance_db.get_minutely_per_ticker(ticker) for ticker in tickers]))
+
+    print('\n%d tickers x 120 days of minutely bars; get_minutely_per_ticker of %d tickers, best of 5'
+          % (num_tickers, len(tickers)))
+    print('%-11s | %9s | %15s | %9s' % ('layout', 'file (MB)', 'archive B/bar', 'read (ms)'))
+    for label, (size, bytes_per_bar, elapsed) in results.items():
+        print('%-11s | %9.1f | %15.1f | %9.1f' % (label, size, bytes_per_bar, 1000 * elapsed))
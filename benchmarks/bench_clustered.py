@@ -0,0 +1,84 @@
+"""
+Price table layouts on a large synthetic database: rowid tables (default), rowid tables with the covering indexes
+of db_default.db_indexes, and WITHOUT ROWID tables clustered on (ticker, date) with covering indexes. Times the
+common reads: a ticker's full daily/minutely history (get_daily_per_ticker/get_minutely_per_ticker), a one week
+minutely range of a ticker, a ticker's daily close series, the minutely closes of all tickers over one day, and
+an in-SQL aggregate over a ticker's minutely history (no python row objects, so only the storage layout counts).
+Run from the project root:
+
+    python benchmarks/bench_clustered.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.db_class import DBCursor, FinanceDB
+from src.db_synthetic import generate_synthetic_db
+
+LAYOUTS = {'rowid': {},
+           'rowid + covering': {'covering_indexes': True},
+           'without rowid + covering': {'without_rowid': True, 'covering_indexes': True}}
+
+
+def best_time(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def fetch(finance_db, query, params):
+    with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def run(finance_db, tickers):
+    last_session = pd.Timestamp(fetch(finance_db, "SELECT MAX(date) FROM price_minutely", ())[0][0]).normalize()
+    week = ((last_session - pd.Timedelta(days=14)).strftime('%Y-%m-%d'),
+            (last_session - pd.Timedelta(days=7)).strftime('%Y-%m-%d'))
+    day = (last_session.strftime('%Y-%m-%d'), (last_session + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+
+    def per_ticker(read):
+        return lambda: [read(ticker) for ticker in tickers]
+
+    return {
+        'daily history': best_time(per_ticker(finance_db.get_daily_per_ticker)),
+        'minutely history': best_time(per_ticker(finance_db.get_minutely_per_ticker)),
+        'minutely week': best_time(per_ticker(lambda ticker: fetch(
+            finance_db, "SELECT * FROM price_minutely WHERE security_ticker=? AND date>=? AND date<? ORDER BY date",
+            (ticker,) + week))),
+        'daily close': best_time(per_ticker(lambda ticker: fetch(
+            finance_db, "SELECT date, close FROM price_daily WHERE security_ticker=? ORDER BY date", (ticker,)))),
+        'all tickers, one day': best_time(lambda: fetch(
+            finance_db, "SELECT date, security_ticker, close FROM price_minutely WHERE date>=? AND date<?", day)),
+        'minutely sum in sql': best_time(per_ticker(lambda ticker: fetch(
+            finance_db, "SELECT COUNT(*), SUM(close), SUM(volume) FROM price_minutely WHERE security_ticker=?",
+            (ticker,)))),
+    }
+
+
+if __name__ == '__main__':
+    num_tickers = 50
+    tickers = ['SYN%05d' % i for i in range(0, num_tickers, 5)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, layout in LAYOUTS.items():
+            db_path = os.path.join(tmp, label.replace(' ', '_') + '.db')
+            generate_synthetic_db(db_path, num_tickers=num_tickers, years=20, minutely_days=60, **layout)
+            finance_db = FinanceDB(db_path)
+            results[label] = (os.path.getsize(db_path) / 1024 ** 2, run(finance_db, tickers))
+
+    print('\n%d tickers x (20 years daily + 60 days minutely); reads of %d tickers, best of 5 (ms)'
+          % (num_tickers, len(tickers)))
+    reads = list(next(iter(results.values()))[1])
+    print('%-26s | %9s | %s' % ('layout', 'size (MB)', ' | '.join(reads)))
+    for label, (size, timings) in results.items():
+        cells = ['%*.1f' % (len(read), 1000 * timings[read]) for read in reads]
+        print('%-26s | %9.1f | %s' % (label, size, ' | '.join(cells)))
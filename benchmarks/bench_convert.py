@@ -0,0 +1,53 @@
+"""
+Micro-benchmark: dataframe -> row tuples conversion used before executemany.
+
+Compares the original FinanceDB.yfinance_timeseries_to_tuple (python list of tickers, per-element strftime,
+itertuples) with db_convert.timeseries_to_rows on synthetic minutely bars. Run from the project root:
+
+    python benchmarks/bench_convert.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.db_convert import timeseries_to_rows
+
+
+def legacy_timeseries_to_tuple(ticker, column_name, timeseries_df):
+    timeseries_df[column_name] = [ticker] * len(timeseries_df.index)
+    timeseries_df.index = timeseries_df.index.strftime("%Y-%m-%d %H:%M:%S")
+    return tuple(timeseries_df.itertuples())
+
+
+def synthetic_minutely(num_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2021-11-01 09:30', periods=num_rows, freq='min', tz='America/New_York')
+    close = 100 + rng.standard_normal(num_rows).cumsum()
+    return pd.DataFrame({'Open': close, 'High': close + 0.5, 'Low': close - 0.5, 'Close': close,
+                         'Adj Close': close, 'Volume': rng.integers(0, 100000, num_rows)}, index=index)
+
+
+def time_conversion(convert, df, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        frame = df.copy()  # legacy conversion mutates its input
+        start = time.perf_counter()
+        for _ in convert(frame):
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    repeats = 3
+    for num_rows in [10000, 100000, 1000000]:
+        df = synthetic_minutely(num_rows)
+        legacy = time_conversion(lambda frame: legacy_timeseries_to_tuple('MSFT', 'security_ticker', frame),
+                                 df, repeats)
+        vectorized = time_conversion(lambda frame: timeseries_to_rows('MSFT', frame, 'price_minutely'), df, repeats)
+        print('%8d rows | legacy: %10.0f rows/s | vectorized: %10.0f rows/s | speedup: %.1fx'
+              % (num_rows, num_rows / legacy, num_rows / vectorized, legacy / vectorized))
@@ -0,0 +1,55 @@
+"""
+Offline throughput benchmark of the download -> convert -> insert pipeline (FinanceDB.add_tickers), using
+ReplaySource with synthetic payloads and simulated network latency instead of yahoo finance. Run from the project
+root:
+
+    python benchmarks/bench_ingest.py
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.db_class import FinanceDB
+from src.db_scheduler import RequestScheduler
+from src.db_sources import ReplaySource
+
+
+def count_rows(db_path):
+    connection = sqlite3.connect(db_path)
+    rows = sum(connection.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+               for table in ['price_daily', 'price_minutely', 'actions'])
+    connection.close()
+    return rows
+
+
+def run(symbols, workers, latency, daily_batch_size=None, error_rate=0.0, seed=0):
+    source = ReplaySource(latency=latency, latency_jitter=latency / 2, error_rate=error_rate, seed=seed)
+    for symbol in symbols:
+        source.payload(symbol)  # generate synthetic payloads outside the timed section
+    # generous limits: measure the pipeline, not the pacing
+    scheduler = RequestScheduler(rate=10000, max_rate=10000, burst=10000, max_concurrency=workers)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        finance_db = FinanceDB(db_path, scheduler=scheduler, source=source)
+        start = time.perf_counter()
+        report = finance_db.add_tickers(symbols, workers=workers, daily_batch_size=daily_batch_size)
+        elapsed = time.perf_counter() - start
+        rows = count_rows(db_path)
+    failed = sum(error is not None for error in report.values())
+    return elapsed, rows, failed
+
+
+if __name__ == '__main__':
+    symbols = ['SYN%03d' % i for i in range(32)]
+    latency = 0.05
+    results = []
+    for workers, daily_batch_size in [(1, None), (4, None), (8, None), (8, 16)]:
+        elapsed, rows, failed = run(symbols, workers, latency, daily_batch_size)
+        results.append((workers, daily_batch_size, elapsed, rows, failed))
+    print('\n%d tickers, %.0f ms simulated latency per request' % (len(symbols), 1000 * latency))
+    for workers, daily_batch_size, elapsed, rows, failed in results:
+        print('workers %d | daily batch %4s | %6.2f s | %7.1f tickers/s | %9.0f rows/s | %d failed'
+              % (workers, daily_batch_size, elapsed, len(symbols) / elapsed, rows / elapsed, failed))
@@ -0,0 +1,48 @@
+"""
+FinanceDB.get_panel vs the per-ticker get_daily_per_ticker + join(how='inner') loop of the analysis notebooks, for
+panels of daily closes of a growing number of tickers on the same synthetic database. Run from the project root:
+
+    python benchmarks/bench_panel.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.db_class import FinanceDB
+from src.db_synthetic import generate_synthetic_db
+
+
+def best_time(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def join_panel(finance_db, tickers):
+    panel = None
+    for ticker in tickers:
+        df = finance_db.get_daily_per_ticker(ticker)[['date', 'close']].set_index('date')
+        panel = df.rename(columns={'close': ticker}) if panel is None else panel.join(df, how='inner', rsuffix=ticker)
+    return panel
+
+
+if __name__ == '__main__':
+    num_tickers = 400
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'panel.db')
+        generate_synthetic_db(db_path, num_tickers=num_tickers, years=20, minutely_days=1)
+        finance_db = FinanceDB(db_path)
+        tickers = ['SYN%05d' % i for i in range(num_tickers)]
+        results = {size: (best_time(lambda: join_panel(finance_db, tickers[:size])),
+                          best_time(lambda: finance_db.get_panel(tickers[:size])))
+                   for size in [10, 50, 100, 200, 400]}
+
+    print('\ndaily closes over 20 years, best of 3 (ms)')
+    print('%7s | %9s | %9s' % ('tickers', 'join loop', 'get_panel'))
+    for size, (joined, panel) in results.items():
+        print('%7d | %9.1f | %9.1f' % (size, 1000 * joined, 1000 * panel))
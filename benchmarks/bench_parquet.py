@@ -0,0 +1,73 @@
+"""
+SQLite vs the parquet price backend (db_parquet.py) on the same synthetic database: a ticker's full daily and
+minutely history (get_daily_per_ticker/get_minutely_per_ticker), the daily closes of all tickers (the column scan
+of analysis notebooks), and the daily closes of all tickers over one year (date pushdown). Run from the project
+root:
+
+    python benchmarks/bench_parquet.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.db_class import FinanceDB
+from src.db_migrate import export_parquet
+from src.db_synthetic import generate_synthetic_db
+
+
+def best_time(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(finance_db, tickers, year):
+    columns = ['date', 'security_ticker', 'close']
+    if finance_db.parquet is None:
+        def closes(*dates):
+            query = "SELECT date, security_ticker, close FROM price_daily"
+            if dates:
+                query += " WHERE date>=? AND date<?"
+            return finance_db.dataframe_from_query(query, dates)
+    else:
+        def closes(*dates):
+            return finance_db.parquet.read('price_daily', columns=columns, start=dates[0] if dates else None,
+                                           end=dates[1] if dates else None)
+
+    return {
+        'daily history': best_time(lambda: [finance_db.get_daily_per_ticker(ticker) for ticker in tickers]),
+        'minutely history': best_time(lambda: [finance_db.get_minutely_per_ticker(ticker) for ticker in tickers]),
+        'all daily closes': best_time(closes),
+        'one year of closes': best_time(lambda: closes(*year)),
+    }
+
+
+if __name__ == '__main__':
+    num_tickers = 200
+    tickers = ['SYN%05d' % i for i in range(0, num_tickers, 20)]
+    year = ('2020-01-01', '2021-01-01')
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_path = os.path.join(tmp, 'sqlite.db')
+        parquet_path = os.path.join(tmp, 'parquet.db')
+        generate_synthetic_db(sqlite_path, num_tickers=num_tickers, years=20, minutely_days=30)
+        shutil.copy(sqlite_path, parquet_path)
+        export_parquet(parquet_path)
+        results = {label: run(FinanceDB(path), tickers, year)
+                   for label, path in [('sqlite', sqlite_path), ('parquet', parquet_path)]}
+        parquet_mb = sum(os.path.getsize(os.path.join(root, filename))
+                         for root, _, filenames in os.walk(os.path.join(tmp, 'parquet_parquet'))
+                         for filename in filenames) / 1024 ** 2
+        print('\nsqlite file %.1f MB, parquet files %.1f MB' % (os.path.getsize(sqlite_path) / 1024 ** 2, parquet_mb))
+
+    print('%d tickers x (20 years daily + 30 days minutely); histories of %d tickers, best of 5 (ms)'
+          % (num_tickers, len(tickers)))
+    reads = list(results['sqlite'])
+    print('%-8s | %s' % ('backend', ' | '.join(reads)))
+    for label, timings in results.items():
+        print('%-8s | %s' % (label, ' | '.join('%*.1f' % (len(read), 1000 * timings[read]) for read in reads)))
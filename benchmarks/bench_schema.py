@@ -0,0 +1,93 @@
+"""
+Schema variants: v1 (TEXT dates) vs v2 (INTEGER UTC epoch dates), each with ticker text or integer security ids
+in the price tables. Compares file and price_minutely table/index sizes, migration time, and the time to load a
+ticker into a dataframe indexed by timezone-aware timestamps (what visualize.postprocess_db_timedata_per_ticker
+produces), for full histories and for a one week range scan. Uses synthetic databases. Run from the project root:
+
+    python benchmarks/bench_schema.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.db_class import DBCursor, FinanceDB
+from src.db_default import DB_ASSUMED_TZ
+from src.db_migrate import migrate_to_v2
+from src.db_synthetic import generate_synthetic_db
+
+
+def best_time(fn, repeat=7):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def indexed(finance_db, df):
+    # the date handling of visualize.postprocess_db_timedata_per_ticker
+    if finance_db.schema_version == 2:
+        return df.set_axis(df.index.tz_convert(DB_ASSUMED_TZ))
+    return df.set_index(pd.DatetimeIndex(df['date']).tz_localize(DB_ASSUMED_TZ))
+
+
+def range_scan(finance_db, ticker, start, end):
+    query = "SELECT * FROM price_minutely WHERE %s=? AND date>=? AND date<? ORDER BY date" % finance_db.ticker_column
+    timezone = finance_db.ticker_timezone(ticker)
+    with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+        cursor.execute(query, (finance_db.ticker_key(ticker), finance_db.encode_date(start, timezone),
+                               finance_db.encode_date(end, timezone)))
+        df = pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+    return indexed(finance_db, finance_db.ticker_frame(df, ticker))
+
+
+def table_sizes(db_path, table):
+    """
+    MB used by table and by its primary key index
+    """
+    with DBCursor(db_path, True) as cursor:
+        cursor.execute("SELECT name, SUM(pgsize) FROM dbstat WHERE name IN (?, ?) GROUP BY name",
+                       (table, 'sqlite_autoindex_%s_1' % table))
+        sizes = dict(cursor.fetchall())
+    return sizes.get(table, 0) / 1024 ** 2, sizes.get('sqlite_autoindex_%s_1' % table, 0) / 1024 ** 2
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {label: os.path.join(tmp, label.replace(' ', '_') + '.db')
+                 for label in ['v1', 'v2', 'v1 ids', 'v2 ids']}
+        migration_times = {}
+        for security_ids, suffix in [(False, ''), (True, ' ids')]:
+            generate_synthetic_db(paths['v1' + suffix], num_tickers=20, years=20, minutely_days=60,
+                                  security_ids=security_ids)
+            shutil.copy(paths['v1' + suffix], paths['v2' + suffix])
+            start = time.perf_counter()
+            migrate_to_v2(paths['v2' + suffix])
+            migration_times['v2' + suffix] = time.perf_counter() - start
+
+        ticker = 'SYN00007'
+        week_start = pd.Timestamp.today().normalize() - pd.Timedelta(days=21)
+        week_end = week_start + pd.Timedelta(days=7)
+        results = {}
+        for label, path in paths.items():
+            finance_db = FinanceDB(path)
+            results[label] = (
+                os.path.getsize(path) / 1024 ** 2,
+                *table_sizes(path, 'price_minutely'),
+                best_time(lambda: indexed(finance_db, finance_db.get_daily_per_ticker(ticker))),
+                best_time(lambda: indexed(finance_db, finance_db.get_minutely_per_ticker(ticker))),
+                best_time(lambda: range_scan(finance_db, ticker, week_start.to_pydatetime(), week_end.to_pydatetime())))
+
+        print()
+        for label, elapsed in migration_times.items():
+            print('migration to %s: %.1f s' % (label, elapsed))
+        print(' schema | file (MB) | minutely table / index (MB) | daily (ms) | minutely (ms) | minutely week (ms)')
+        for label, (size, table_mb, index_mb, daily, minutely, week) in results.items():
+            print('%7s | %9.1f | %13.1f / %11.1f | %10.1f | %13.1f | %18.2f'
+                  % (label, size, table_mb, index_mb, 1000 * daily, 1000 * minutely, 1000 * week))
@@ -0,0 +1,118 @@
+import numpy as np
+
+
+def adjustment_factors(dividends, splits, prev_closes):
+    """
+    Cumulative adjustment factors per action of a date-sorted sequence of one ticker's actions, following yahoo: a
+    split s divides earlier prices by s, a dividend d multiplies earlier adjusted closes by 1 - d / previous close.
+
+    Input
+        dividends, splits (array-like) : per action, 0 where there is none
+        prev_closes (array-like) : per action, close before the ex-date in post-split units, NaN if unknown
+
+    Returns
+        adj_factor, price_factor, volume_factor (np.ndarray)
+    """
+    dividends = np.asarray(dividends, dtype=float)
+    prev_closes = np.asarray(prev_closes, dtype=float)
+
+    split_factor = split_factors(splits)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dividend_factor = 1.0 - dividends / prev_closes
+    dividend_factor = np.where((dividends > 0) & np.isfinite(dividend_factor), dividend_factor, 1.0)
+
+    price_factor = np.cumprod(split_factor[::-1])[::-1]
+    adj_factor = np.cumprod((split_factor * dividend_factor)[::-1])[::-1]
+    return adj_factor, price_factor, 1.0 / price_factor
+
+
+def split_factors(splits):
+    """
+    Price factor 1 / s of each split ratio s, 1 where there is no split (s == 0)
+    """
+    splits = np.asarray(splits, dtype=float)
+    has_split = splits > 0
+    return np.where(has_split, 1.0 / np.where(has_split, splits, 1.0), 1.0)
+
+
+def later_split_factors(splits):
+    """
+    Per action, the product of the split factors of all strictly later actions; converts a price stored before
+    those splits into current units.
+    """
+    split_factor = split_factors(splits)
+    inclusive = np.cumprod(split_factor[::-1])[::-1]
+    return inclusive / split_factor
+
+
+def load_adjustment_factors(cursor, factor_rows):
+    # start/end are untyped so both TEXT (schema v1) and INTEGER (schema v2) dates are stored as is
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS adjustment_factors "
+                   "(start, end, adj_factor REAL, price_factor REAL, volume_factor REAL)")
+    cursor.execute("DELETE FROM temp.adjustment_factors")
+    cursor.executemany("INSERT INTO temp.adjustment_factors VALUES (?,?,?,?,?)", factor_rows)
+
+
+def readjust_for_actions(cursor, ticker, actions_df, stale_before, ohlcv=False, ticker_column='security_ticker',
+                         minutely_cursors=None):
+    """
+    Rewrites the stored prices of ticker (value of ticker_column) dated before stale_before[table] and before the new
+    actions in actions_df, in one UPDATE per price table. ohlcv also rescales OHLC and volume; minutely_cursors are
+    the partition files to update in a partitioned database. Applying the same actions twice adjusts twice.
+
+    Returns
+        rowcounts (dict) : table name -> number of rows adjusted
+    """
+    if actions_df.empty:
+        return {}
+    actions_df = actions_df.sort_values("date")
+    dates = np.array(actions_df["date"].tolist(), dtype=object)  # python str/int, as sqlite3 parameters
+    dividends = actions_df["dividends"].fillna(0).to_numpy(dtype=float)
+    splits = actions_df["stock_splits"].fillna(0).to_numpy(dtype=float)
+
+    daily_cutoff = stale_before.get('price_daily')
+    # a split and a dividend on the same ex-date: the dividend is in post-split units, so is its reference close
+    splits_since = later_split_factors(splits) * split_factors(splits)
+    prev_closes = np.full(len(dates), np.nan)
+    for i, date in enumerate(dates):
+        if dividends[i] <= 0:
+            continue
+        cursor.execute("SELECT date, close FROM price_daily WHERE %s=? AND date<? ORDER BY date DESC LIMIT 1"
+                       % ticker_column, (ticker, date))
+        row = cursor.fetchone()
+        if row is None or row[1] is None:
+            continue
+        prev_closes[i] = row[1]
+        if daily_cutoff is not None and row[0] < daily_cutoff:
+            prev_closes[i] *= splits_since[i]  # still stored in pre-split units
+
+    adj_factor, price_factor, volume_factor = adjustment_factors(dividends, splits, prev_closes)
+    starts = [None] + dates[:-1].tolist()  # the first interval is open ended
+    factor_rows = list(zip(starts, dates.tolist(), adj_factor.tolist(), price_factor.tolist(),
+                           volume_factor.tolist()))
+
+    rowcounts = {}
+    for table in ['price_daily', 'price_minutely']:
+        cutoff = stale_before.get(table)
+        if cutoff is None:
+            continue
+
+        def factor(column):
+            return ("(SELECT f.%s FROM temp.adjustment_factors f "
+                    "WHERE (f.start IS NULL OR %s.date >= f.start) AND %s.date < f.end)" % (column, table, table))
+
+        assignments = ["adjusted_close = adjusted_close * %s" % factor('adj_factor')]
+        if ohlcv:
+            assignments += ["%s = %s * %s" % (column, column, factor('price_factor'))
+                            for column in ['open', 'high', 'low', 'close']]
+            assignments.append("volume = CAST(ROUND(volume * %s) AS INTEGER)" % factor('volume_factor'))
+        table_cursors = [cursor]
+        if table == 'price_minutely' and minutely_cursors is not None:
+            table_cursors = minutely_cursors
+        rowcounts[table] = 0
+        for table_cursor in table_cursors:
+            load_adjustment_factors(table_cursor, factor_rows)
+            table_cursor.execute("UPDATE %s SET %s WHERE %s=? AND date<? AND date<?"
+                                 % (table, ', '.join(assignments), ticker_column), (ticker, dates[-1], cutoff))
+            rowcounts[table] += max(table_cursor.rowcount, 0)
+    return rowcounts
@@ -0,0 +1,282 @@
+import struct
+
+import numpy as np
+import pandas as pd
+
+from src.db_convert import format_dates
+from src.db_schema import DB_SCHEMA_DATE_TYPES
+
+ARCHIVE_TABLE = 'price_minutely_archive'
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'adjusted_close')
+ARCHIVE_MAX_DECIMALS = 6  # prices are tried as integers of 10**-decimals up to this precision
+SECONDS_PER_DAY = 86400
+
+# how a column of a chunk is stored, recorded in the chunk header
+ENCODING_DECIMAL = 0          # integers of 10**-decimals, first value then zigzag varint deltas
+ENCODING_DECIMAL_FLOAT32 = 1  # as ENCODING_DECIMAL, values were float32 (e.g. yahoo quotes) widened to float64
+ENCODING_CLOSE_FACTOR = 2     # adjusted_close = close * factor, factor stored in the header
+ENCODING_INTEGER = 3          # volume as zigzag varints
+ENCODING_RAW = 4              # float64 bytes, for anything else (NaN, full precision floats)
+
+# version, (encoding, decimals) of each price column, volume encoding, adjusted_close factor, varint section length
+CHUNK_HEADER = struct.Struct('<B10sBdI')
+
+
+def zigzag(values):
+    """
+    Maps signed integers to unsigned ones with small absolute values first (0, -1, 1, -2 -> 0, 1, 2, 3)
+    """
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def unzigzag(values):
+    values = np.asarray(values, dtype=np.uint64)
+    return ((values >> np.uint64(1)).view(np.int64)) ^ -((values & np.uint64(1)).view(np.int64))
+
+
+def varint_encode(values):
+    """
+    LEB128 varints of an array of unsigned integers, as a uint8 array
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        lengths += values >= np.uint64(1) << np.uint64(7 * k)
+    offsets = np.cumsum(lengths) - lengths
+    data = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for k in range(int(lengths.max()) if len(values) else 0):
+        rows = lengths > k
+        low_bits = (values[rows] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        data[offsets[rows] + k] = low_bits | (lengths[rows] > k + 1).astype(np.uint64) << np.uint64(7)
+    return data
+
+
+def varint_decode(data):
+    """
+    Inverse of varint_encode, returns a uint64 array
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    last_bytes = data < 0x80
+    starts = np.flatnonzero(np.concatenate(([True], last_bytes[:-1])))
+    value_index = np.cumsum(last_bytes) - last_bytes
+    positions = np.arange(len(data)) - starts[value_index]
+    shifted = (data & 0x7f).astype(np.uint64) << (7 * positions).astype(np.uint64)
+    return np.bitwise_or.reduceat(shifted, starts)
+
+
+def decimal_encoding(values):
+    """
+    Smallest number of decimals d such that values are integers of 10**-d (as float64 or widened float32)
+
+    Returns
+        encoding, decimals, integers (np.ndarray of int64), None if the values have no such representation
+    """
+    if not np.isfinite(values).all():
+        return None
+    for decimals in range(ARCHIVE_MAX_DECIMALS + 1):
+        scale = 10.0 ** decimals
+        integers = np.round(values * scale)
+        if len(values) and np.abs(integers).max() >= 2 ** 53:
+            return None
+        decoded = integers / scale
+        if np.array_equal(decoded, values):
+            return ENCODING_DECIMAL, decimals, integers.astype(np.int64)
+        if np.array_equal(decoded.astype(np.float32).astype(np.float64), values):
+            return ENCODING_DECIMAL_FLOAT32, decimals, integers.astype(np.int64)
+    return None
+
+
+def decode_decimal(integers, encoding, decimals):
+    values = integers.astype(np.float64) / 10.0 ** decimals
+    if encoding == ENCODING_DECIMAL_FLOAT32:
+        return values.astype(np.float32).astype(np.float64)
+    return values
+
+
+def encode_chunk(seconds, prices, volume):
+    """
+    Encodes the bars of one ticker and day (int64 seconds, float64 prices per ARCHIVE_PRICE_COLUMNS, volume) into
+    a BLOB of zigzag varint deltas, which decode_chunk turns back into the exact input values
+    """
+    deltas = np.diff(seconds)
+    streams = [zigzag(np.concatenate((seconds[:1], np.diff(deltas, prepend=0)))) if len(seconds) > 1
+               else zigzag(seconds)]
+    raw = []
+    encodings = []
+    factor = 1.0
+    for column in ARCHIVE_PRICE_COLUMNS:
+        values = prices[column]
+        if column == 'adjusted_close' and prices['close'][0] != 0:
+            factor = values[0] / prices['close'][0]
+            if np.array_equal(prices['close'] * factor, values):
+                encodings.append((ENCODING_CLOSE_FACTOR, 0))
+                continue
+            factor = 1.0
+        decimal = decimal_encoding(values)
+        if decimal is None:
+            encodings.append((ENCODING_RAW, 0))
+            raw.append(values.astype(np.float64))
+            continue
+        encoding, decimals, integers = decimal
+        encodings.append((encoding, decimals))
+        streams.append(zigzag(np.diff(integers, prepend=0)))
+    if np.issubdtype(volume.dtype, np.integer):
+        volume_encoding = ENCODING_INTEGER
+        streams.append(zigzag(volume))
+    else:
+        volume_encoding = ENCODING_RAW
+        raw.append(volume.astype(np.float64))
+
+    varints = varint_encode(np.concatenate(streams)).tobytes()
+    header = CHUNK_HEADER.pack(ARCHIVE_FORMAT_VERSION, bytes(np.ravel(encodings).astype(np.uint8)), volume_encoding,
+                               factor, len(varints))
+    return header + varints + b''.join(values.tobytes() for values in raw)
+
+
+def decode_chunk(data, num_rows):
+    """
+    Inverse of encode_chunk
+
+    Returns
+        seconds (np.ndarray of int64), prices (dict: column -> float64 array), volume (np.ndarray)
+    """
+    version, encodings, volume_encoding, factor, varints_length = CHUNK_HEADER.unpack_from(data)
+    if version != ARCHIVE_FORMAT_VERSION:
+        raise ValueError("Unknown archive chunk format %d" % version)
+    varints = np.frombuffer(data, dtype=np.uint8, count=varints_length, offset=CHUNK_HEADER.size)
+    integers = unzigzag(varint_decode(varints))
+    raw = np.frombuffer(data, dtype=np.float64, offset=CHUNK_HEADER.size + varints_length)
+
+    deltas = np.cumsum(integers[1:num_rows])
+    seconds = integers[0] + np.concatenate(([0], np.cumsum(deltas)))
+    position, raw_position = num_rows, 0
+    prices = {}
+    for i, column in enumerate(ARCHIVE_PRICE_COLUMNS):
+        encoding, decimals = encodings[2 * i], encodings[2 * i + 1]
+        if encoding == ENCODING_CLOSE_FACTOR:
+            prices[column] = prices['close'] * factor
+        elif encoding == ENCODING_RAW:
+            prices[column] = raw[raw_position:raw_position + num_rows]
+            raw_position += num_rows
+        else:
+            prices[column] = decode_decimal(np.cumsum(integers[position:position + num_rows]), encoding, decimals)
+            position += num_rows
+    if volume_encoding == ENCODING_INTEGER:
+        volume = integers[position:position + num_rows]
+    else:
+        volume = raw[raw_position:raw_position + num_rows]
+    return seconds, prices, volume
+
+
+class MinutelyArchive:
+    """
+    Archival storage of price_minutely as one compressed BLOB per ticker and day in ARCHIVE_TABLE, read back
+    through the normal price_minutely API. The latest day of each ticker stays in price_minutely.
+    """
+
+    COLUMNS = ('date',) + ARCHIVE_PRICE_COLUMNS + ('volume',)
+
+    def __init__(self, schema):
+        self.schema_version = schema['schema_version']
+        self.ticker_column = 'security_id' if schema['security_ids'] else 'security_ticker'
+
+    @staticmethod
+    def detect(cursor, schema):
+        """
+        Returns the MinutelyArchive of a database, None if it has no archive table
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (ARCHIVE_TABLE,))
+        return None if cursor.fetchone() is None else MinutelyArchive(schema)
+
+    def create_table(self, cursor):
+        date_type = DB_SCHEMA_DATE_TYPES[self.schema_version]
+        key_type = 'INTEGER' if self.ticker_column == 'security_id' else 'TEXT'
+        cursor.execute("CREATE TABLE IF NOT EXISTS %s (%s %s NOT NULL, start %s NOT NULL, end %s NOT NULL, "
+                       "rows INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (%s, start))"
+                       % (ARCHIVE_TABLE, self.ticker_column, key_type, date_type, date_type, self.ticker_column))
+
+    def to_seconds(self, dates):
+        """
+        Stored dates as int64 seconds (wall time for TEXT dates), None if a TEXT date does not round trip
+        """
+        if self.schema_version == 2:
+            return np.asarray(dates, dtype=np.int64)
+        dates = np.asarray(dates, dtype=str)
+        seconds = pd.to_datetime(dates, format='ISO8601').to_numpy().astype('datetime64[s]')
+        return seconds.view(np.int64) if np.array_equal(format_dates(seconds), dates) else None
+
+    def from_seconds(self, seconds):
+        if self.schema_version == 2:
+            return seconds
+        return format_dates(seconds.view('datetime64[s]'))
+
+    def encode(self, key, rows, before=None):
+        """
+        Chunks (key, start, end, rows, data) of ARCHIVE_TABLE, one per day, of the price_minutely rows of one ticker;
+        the last day and the days ending at or after before (a stored date) are left out
+        """
+        columns = dict(zip(self.COLUMNS, zip(*rows)))
+        seconds = self.to_seconds(columns['date'])
+        if seconds is None:
+            return []
+        prices = {column: np.array(columns[column], dtype=np.float64) for column in ARCHIVE_PRICE_COLUMNS}
+        volume = np.array(columns['volume'])
+        if volume.dtype == object:  # NULLs
+            volume = np.array([np.nan if value is None else value for value in columns['volume']], dtype=np.float64)
+        days = seconds // SECONDS_PER_DAY
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(days)) + 1, [len(days)]))
+        chunks = []
+        for start, end in zip(bounds[:-2], bounds[1:-1]):  # all days but the last
+            first, last = columns['date'][start], columns['date'][end - 1]
+            if before is not None and last >= before:
+                break
+            data = encode_chunk(seconds[start:end], {column: values[start:end] for column, values in prices.items()},
+                                volume[start:end])
+            chunks.append((key, first, last, int(end - start), data))
+        return chunks
+
+    def read(self, cursor, key=None, start=None, end=None):
+        """
+        Archived rows of a ticker (of every ticker if key is None) with chunks overlapping [start, end) (stored dates,
+        None for unbounded), None if nothing is archived
+        """
+        conditions, params = [], []
+        if key is not None:
+            conditions.append("%s=?" % self.ticker_column)
+            params.append(key)
+        if start is not None:
+            conditions.append("end>=?")
+            params.append(start)
+        if end is not None:
+            conditions.append("start<?")
+            params.append(end)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        cursor.execute("SELECT %s, rows, data FROM %s%s ORDER BY %s, start"
+                       % (self.ticker_column, ARCHIVE_TABLE, where, self.ticker_column), params)
+        chunks = cursor.fetchall()
+        if not chunks:
+            return None
+        decoded = [decode_chunk(data, num_rows) for _, num_rows, data in chunks]
+        df = pd.DataFrame({'date': self.from_seconds(np.concatenate([seconds for seconds, _, _ in decoded]))})
+        for column in ARCHIVE_PRICE_COLUMNS:
+            df[column] = np.concatenate([prices[column] for _, prices, _ in decoded])
+        df['volume'] = np.concatenate([volume for _, _, volume in decoded])
+        df[self.ticker_column] = np.repeat([chunk[0] for chunk in chunks], [chunk[1] for chunk in chunks])
+        return df
+
+    def restore(self, cursor, key, end):
+        """
+        Moves the chunks of a ticker starting before end (a stored date) back to price_minutely, returns the rowcount
+        """
+        df = self.read(cursor, key, end=end)
+        if df is None:
+            return 0
+        rows = list(df.astype(object).itertuples(index=False, name=None))
+        cursor.executemany("INSERT OR IGNORE INTO price_minutely VALUES (%s)" % ','.join(['?'] * len(df.columns)),
+                           rows)
+        cursor.execute("DELETE FROM %s WHERE %s=? AND start<?" % (ARCHIVE_TABLE, self.ticker_column), (key, end))
+        return len(rows)
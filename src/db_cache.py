@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+from src.db_default import DB_CACHE_DIR
+
+
+class CacheMissError(LookupError):
+    """
+    Raised in offline mode when a response is not in the cache
+    """
+
+
+class ResponseCache:
+    """
+    Opt-in on-disk cache of yfinance responses, keyed by the sha256 of (endpoint, symbol, parameters), with a TTL per
+    endpoint and least recently used eviction above max_bytes. Use
+
+        finance_db = FinanceDB(db_filename, cache=ResponseCache())
+    """
+
+    DEFAULT_TTL = {'info': 7 * 86400,
+                   'actions': 86400,
+                   'history_1d': 12 * 3600,
+                   'history_1m': 3600,
+                   'download_1d': 12 * 3600}  # seconds
+    FALLBACK_TTL = 3600
+
+    def __init__(self, cache_dir=DB_CACHE_DIR, ttl=None, max_bytes=2 * 1024 ** 3, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = dict(self.DEFAULT_TTL)
+        if ttl is not None:
+            self.ttl.update(ttl)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self.total_bytes = sum(os.path.getsize(path) for path in self.entry_paths())
+
+    @staticmethod
+    def key(endpoint, symbol, params):
+        description = json.dumps([endpoint, symbol, params], sort_keys=True, default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pkl')
+
+    def entry_paths(self):
+        for directory, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith('.pkl'):
+                    yield os.path.join(directory, filename)
+
+    def get(self, endpoint, symbol, params):
+        """
+        Returns (found, response); expired entries count as missing unless offline
+        """
+        path = self.path(self.key(endpoint, symbol, params))
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        if not self.offline and time.time() - entry['fetched_at'] > self.ttl.get(endpoint, self.FALLBACK_TTL):
+            return False, None
+        os.utime(path)  # the modification time orders entries for LRU eviction
+        return True, entry['response']
+
+    def put(self, endpoint, symbol, params, response):
+        path = self.path(self.key(endpoint, symbol, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_size = os.path.getsize(path) if os.path.isfile(path) else 0
+        temporary_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(temporary_path, 'wb') as f:
+            pickle.dump({'fetched_at': time.time(), 'response': response}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)  # atomic, concurrent readers never see a partial entry
+        with self.lock:
+            self.total_bytes += os.path.getsize(path) - old_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache is below 90% of max_bytes (call with lock held)
+        """
+        entries = []
+        for path in self.entry_paths():
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.total_bytes <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+            self.stats['evicted'] += 1
+
+    def get_or_fetch(self, endpoint, symbol, params, fetch, cache_empty=True):
+        """
+        Returns the cached response of the request, calling fetch() and storing its response on a miss.
+        Responses that are empty (len 0) are only stored if cache_empty.
+        """
+        found, response = self.get(endpoint, symbol, params)
+        if found:
+            self.stats['hits'] += 1
+            return response
+        if self.offline:
+            raise CacheMissError("Offline and no cached response for %s %s %s" % (endpoint, symbol, params))
+        self.stats['misses'] += 1
+        response = fetch()
+        if response is not None and (cache_empty or len(response) > 0):
+            self.put(endpoint, symbol, params, response)
+        return response
+
+    def clear(self):
+        with self.lock:
+            for path in list(self.entry_paths()):
+                os.remove(path)
+            self.total_bytes = 0
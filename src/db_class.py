@@ -1,12 +1,27 @@
-import yfinance as yf
 import sqlite3
+import collections
+import concurrent.futures
+import itertools
 import datetime
+import numpy as np
 import pandas as pd
 import os
-import hashlib
 from pandas.tseries.offsets import BDay
 from sqlite3 import Error
-from src.db_default import DB_TABLES, DB_DIR, DB_DEFAULT_TICKERS, DB_FROZEN_VARIANTS
+from src.db_archive import ARCHIVE_TABLE, MinutelyArchive
+from src.db_column_cache import COLUMN_CACHE_TABLES, ColumnCache
+from src.db_convert import DB_DATE_FORMAT, epoch_seconds, epochs_to_index, resolve_timezone, timeseries_to_rows
+from src.db_default import DB_DIR, DB_DEFAULT_TICKERS, DB_FROZEN_VARIANTS, DB_YFINANCE_COLUMNS
+from src.db_engine import ConnectionPool, FrozenEngine
+from src.db_integrity import file_md5, verified_md5
+from src.db_parquet import PRICE_BACKENDS, ParquetStore
+from src.db_partitions import MinutelyPartitions
+from src.db_schema import DB_TIMESERIES_TABLES, create_tables, default_schema, detect_schema, write_setting
+from src.db_scheduler import YF_SCHEDULER
+from src.db_sources import YFinanceSource
+from src.db_writer import DBWriter
+
+ITER_CHUNK_SIZE = 100000  # rows per DataFrame yielded by FinanceDB.iter_table and iter_query
 
 
 class DBCursor:
@@ -18,24 +33,36 @@ class DBCursor:
         cursor.execute()
 
     Once outside of the with statement it will commit and close the database
-    automatically too.
+    automatically too. Connections come from the database's ConnectionPool if it has one.
     """
 
     def __init__(self, db_filename, read_only):
         self.db_filename = db_filename
         self.read_only = read_only
+        self.pool = ConnectionPool.lookup(db_filename, read_only)
 
     def __enter__(self):
-        self.connection = sqlite3.connect(self.db_filename)
-        self.connection.execute("PRAGMA foreign_keys = 1")
-        if self.read_only:
-            self.connection.execute("PRAGMA query_only = ON")
+        if self.pool is not None:
+            self.connection = self.pool.acquire()
+        else:
+            self.connection = sqlite3.connect(self.db_filename)
+            self.connection.execute("PRAGMA foreign_keys = 1")
+            if self.read_only:
+                self.connection.execute("PRAGMA query_only = ON")
         self.cursor = self.connection.cursor()
         return self.cursor
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.connection.commit()
-        self.connection.close()
+        self.cursor.close()
+        try:
+            self.connection.commit()
+        except sqlite3.Error:
+            self.connection.close()
+            raise
+        if self.pool is not None:
+            self.pool.give_back(self.connection)
+        else:
+            self.connection.close()
         if exc_type is not None:
             print(exc_type, exc_value)
         return
@@ -50,91 +77,412 @@ class FinanceDB:
 
     Input
         db_filename (str) : file where database is/will be saved.
+        scheduler (RequestScheduler) : paces the yfinance requests, the shared YF_SCHEDULER by default
+        cache (ResponseCache) : optional on-disk cache of yfinance responses
+        source : market data source, YFinanceSource by default (ReplaySource for offline runs)
+        schema_version, security_ids, without_rowid, covering_indexes : schema of a new database, see db_schema.py
+        minutely_partitions (str) : 'month' or 'quarter' to store price_minutely in per-period files
+        price_backend (str) : 'parquet' to also keep the prices as per-ticker Parquet files
+        column_cache (bool) : reads a frozen database's prices from memory mapped .npy columns
     """
 
-    def __init__(self, db_filename):
+    TICKER_TABLES = ('security', 'price_daily', 'price_minutely', 'actions')  # download units of one ticker
+    # retries of empty responses that are often genuine (no splits/dividends, no bars in a minutely interval): one
+    # backed off retry still catches the empty responses of a throttled source
+    EXPECTED_EMPTY_RETRIES = 1
+
+    def __init__(self, db_filename, scheduler=None, cache=None, source=None, schema_version=None,
+                 security_ids=None, without_rowid=None, covering_indexes=None, minutely_partitions=None,
+                 price_backend=None, column_cache=False):
         self.db_dir = DB_DIR
+        self.source = YFinanceSource() if source is None else source
+        self.scheduler = YF_SCHEDULER if scheduler is None else scheduler
+        self.cache = cache
         self.db_path = os.path.join(self.db_dir, db_filename)
         flag_frozen = self.valid_frozen_db(db_filename)
         self.read_only = flag_frozen
+        if flag_frozen:
+            self.connections = FrozenEngine.register(self.db_path, True)
+        else:
+            self.connections = ConnectionPool.register(self.db_path)
         if not os.path.isdir(self.db_dir):
             os.makedirs(self.db_dir)
 
+        requested = {'schema_version': schema_version, 'security_ids': security_ids, 'without_rowid': without_rowid,
+                     'covering_indexes': covering_indexes}
         with DBCursor(self.db_path, self.read_only) as cursor:
-            for tables in DB_TABLES:
-                cursor.execute(f"CREATE TABLE IF NOT EXISTS {tables}")
+            self.schema = detect_schema(cursor) or default_schema(**requested)
+            if not self.read_only:  # frozen databases are complete and opened immutable, no schema writes
+                if covering_indexes:
+                    self.schema['covering_indexes'] = True  # indexes can be added to an existing database
+                create_tables(cursor, **self.schema)
+            self.partitions = MinutelyPartitions.detect(cursor, self.db_path, self.schema)
+            if minutely_partitions is not None and self.partitions is None and not self.read_only:
+                cursor.execute("SELECT 1 FROM price_minutely LIMIT 1")
+                if cursor.fetchone() is None:
+                    self.partitions = MinutelyPartitions(self.db_path, minutely_partitions, self.schema)
+                    write_setting(cursor, 'minutely_partitions', minutely_partitions)
+            self.parquet = ParquetStore.detect(cursor, self.db_path)
+            self.archive = MinutelyArchive.detect(cursor, self.schema)
+            if price_backend == 'parquet' and self.parquet is None and not self.read_only:
+                cursor.execute("SELECT 1 FROM price_daily UNION ALL SELECT 1 FROM price_minutely LIMIT 1")
+                if cursor.fetchone() is None:
+                    self.parquet = ParquetStore(self.db_path)
+                    write_setting(cursor, 'price_backend', price_backend)
+        for option, value in requested.items():
+            if value is not None and value != self.schema[option]:
+                raise ValueError("%s has %s=%s, not %s (see db_migrate.py)"
+                                 % (self.db_path, option, self.schema[option], value))
+        period = None if self.partitions is None else self.partitions.period
+        if minutely_partitions is not None and minutely_partitions != period:
+            raise ValueError("%s has minutely_partitions=%s, not %s (see db_migrate.partition_minutely)"
+                             % (self.db_path, period, minutely_partitions))
+        if price_backend is not None and price_backend not in PRICE_BACKENDS:
+            raise ValueError("Unknown price backend %s, expected one of %s" % (price_backend, PRICE_BACKENDS))
+        backend = 'sqlite' if self.parquet is None else 'parquet'
+        if price_backend is not None and price_backend != backend:
+            raise ValueError("%s has price_backend=%s, not %s (see db_migrate.export_parquet)"
+                             % (self.db_path, backend, price_backend))
+        self.schema_version = self.schema['schema_version']
+        self.security_ids = self.schema['security_ids']
+        self.ticker_column = 'security_id' if self.security_ids else 'security_ticker'
+        self.ticker_ids = {}  # ticker -> security_id, filled on demand
+
+        self.column_cache = None
+        self.table_columns = {}  # table -> column names, read on demand
+        if column_cache:
+            if not self.read_only:
+                raise ValueError("%s is not a frozen database, column_cache needs one of DB_FROZEN_VARIANTS"
+                                 % self.db_path)
+            md5sum = [variant['md5sum'] for variant in DB_FROZEN_VARIANTS.values()
+                      if variant['db_filename'] == db_filename][0]
+            self.column_cache = ColumnCache(self.db_path, md5sum, self.schema_version)
+            if not self.column_cache.is_built():
+                self.build_column_cache()
+
+    def close(self):
+        """
+        Closes the idle pooled connections to the database, e.g. before replacing the file; the next query opens
+        a new one
+        """
+        self.connections.close_idle()
 
-    def add_default_tickers(self):
-        for symbol in DB_DEFAULT_TICKERS:
-            self.add_ticker(symbol)
+    def add_default_tickers(self, workers=1):
+        self.add_tickers(DB_DEFAULT_TICKERS, workers=workers)
         print("Finished adding default tickers.")
 
     def add_ticker(self, symbol):
-        yf_ticker = yf.Ticker(symbol)
-        ticker_info = yf_ticker.info
+        ticker_data = self.fetch_ticker_data(symbol)
+        # one ticker: the bulk-load pragmas of add_tickers would cost more to switch than they save
+        with DBWriter(self.db_path, self.read_only, bulk_load=False) as writer:
+            writer.write_ticker(ticker_data)
+        if ticker_data['errors']:
+            print(symbol, "add_ticker() failed for tables:", ticker_data['errors'])
+        else:
+            print(symbol, "add_ticker() data downloaded and populated in tables.")
+
+    def add_tickers(self, symbols, workers=4, daily_batch_size=None, transaction_batch_size=16, tables=None,
+                    journal_table=None):
+        """
+        Downloads several tickers concurrently (workers threads, at most 2 * workers tickers held in memory) and writes
+        them in the order of symbols through one DBWriter. daily_batch_size batches the daily downloads (see
+        download_daily_batch), a failed batch falls back to one request per ticker; tables and journal_table are passed
+        on to fetch_ticker_data and DBWriter.
+
+        Returns
+            report (dict) : symbol -> None if the ticker was added, otherwise the error message(s)
+        """
+        symbols = list(symbols)
+        batch_size = daily_batch_size or max(len(symbols), 1)
+        report = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor, \
+                DBWriter(self.db_path, self.read_only, batch_size=transaction_batch_size,
+                         journal_table=journal_table) as writer:
+            for batch_start in range(0, len(symbols), batch_size):
+                batch = symbols[batch_start:batch_start + batch_size]
+                daily_histories, batch_error = {}, None
+                if daily_batch_size:
+                    try:
+                        daily_histories = self.download_daily_batch(batch)
+                    except Exception as e:
+                        # fall back to one daily history request per ticker in fetch_ticker_data
+                        batch_error = "daily batch download failed, %s: %s" % (type(e).__name__, e)
+                        print("add_tickers() %s; requesting the daily histories one ticker at a time" % batch_error)
+
+                def fetch(symbol):
+                    return self.fetch_ticker_data(symbol, daily_histories.get(symbol),
+                                                  None if tables is None else tables[symbol])
+
+                for symbol, future in self.submit_in_order(executor, batch, fetch, 2 * workers):
+                    try:
+                        ticker_data = future.result()
+                        writer.write_ticker(ticker_data)
+                        if ticker_data['errors']:
+                            raise RuntimeError("; ".join("%s (%s)" % (error, table)
+                                                         for table, error in ticker_data['errors'].items()))
+                        report[symbol] = None
+                        print(symbol, "add_tickers() data downloaded and populated in tables.")
+                    except Exception as e:
+                        report[symbol] = "%s: %s" % (type(e).__name__, e)
+                        if batch_error is not None:
+                            report[symbol] += " (after %s)" % batch_error
+                        print(symbol, "add_tickers() failed:", report[symbol])
+
+        failed = [symbol for symbol, error in report.items() if error is not None]
+        print("add_tickers() added %d of %d tickers." % (len(report) - len(failed), len(report)))
+        if failed:
+            print("Failed tickers:", failed)
+        return report
+
+    @staticmethod
+    def submit_in_order(executor, symbols, fetch, window):
+        """
+        Submits fetch(symbol) to the executor and yields (symbol, future) in the order of symbols, keeping at most
+        window futures (and so downloaded results) outstanding at a time.
+        """
+        pending = collections.deque()
+        symbols = iter(symbols)
+        for symbol in itertools.islice(symbols, window):
+            pending.append((symbol, executor.submit(fetch, symbol)))
+        while pending:
+            yield pending.popleft()
+            for symbol in itertools.islice(symbols, 1):
+                pending.append((symbol, executor.submit(fetch, symbol)))
+
+    def add_daily_bulk(self, symbols, batch_size=50):
+        """
+        Fills price_daily for tickers already in the security table using one multi-symbol download per batch.
+
+        Returns
+            report (dict) : symbol -> number of rows downloaded, or an error message if the ticker was skipped
+        """
+        present = set(self.get_present_tickers())
+        report = {}
+        for symbol in symbols:
+            if symbol not in present:
+                report[symbol] = "not in security table, use add_ticker/add_tickers first"
+        symbols = [symbol for symbol in symbols if symbol in present]
+        timezones = self.ticker_timezones()
+
+        for batch_start in range(0, len(symbols), batch_size):
+            batch = symbols[batch_start:batch_start + batch_size]
+            daily_histories = self.download_daily_batch(batch)
+            with DBWriter(self.db_path, self.read_only) as writer:
+                for symbol in batch:
+                    if symbol not in daily_histories:
+                        report[symbol] = "no daily data returned"
+                        continue
+                    daily_data = self.yfinance_timeseries_to_rows(symbol, daily_histories[symbol], 'price_daily',
+                                                                  timezones[symbol])
+                    writer.insert_timeseries('price_daily', symbol, daily_data)
+                    report[symbol] = len(daily_histories[symbol].index)
+            print("add_daily_bulk() populated price_daily for batch:", batch)
+        return report
+
+    def download_daily_batch(self, symbols, **download_kwargs):
+        """
+        Downloads the daily history of several symbols in one request and splits it into one dataframe per symbol,
+        dropping the rows (and symbols) without data
+
+        Returns
+            daily_histories (dict) : symbol -> dataframe
+        """
+        symbols = list(symbols)
+        kwargs = dict(period='max', interval='1d', group_by='ticker', auto_adjust=False, actions=False,
+                      threads=True, progress=False)
+        kwargs.update(download_kwargs)
+        wide = self.request_download(symbols, **kwargs)
+
+        daily_histories = {}
+        if wide is None or wide.empty:
+            return daily_histories
+        columns = DB_YFINANCE_COLUMNS['price_daily']
+        for symbol in symbols:
+            if isinstance(wide.columns, pd.MultiIndex):
+                if symbol not in wide.columns.get_level_values(0):
+                    continue
+                frame = wide[symbol]
+            elif len(symbols) == 1:
+                frame = wide
+            else:
+                continue
+            if not set(columns).issubset(frame.columns):
+                continue
+            frame = frame[columns].dropna(how='all')
+            if frame.empty:
+                continue
+            if not frame['Volume'].isna().any():
+                frame = frame.astype({'Volume': 'int64'})
+            daily_histories[symbol] = frame
+        return daily_histories
+
+    def fetch_ticker_data(self, symbol, daily_history=None, tables=None):
+        """
+        Downloads the tables (all of TICKER_TABLES by default) of one symbol without touching the database, so it
+        is safe to call from worker threads. Failed downloads are left out, with their errors in ticker_data['errors'].
+
+        Returns
+            ticker_data (dict) : table name -> row tuple (exchange, security) or rows (price_daily, actions);
+                                 price_minutely holds one set of rows per download interval
+        """
+        ticker_data = {'symbol': symbol, 'errors': {}}
+        timezone = None  # exchange timezone of symbol, for timezone-naive data in schema v2
+        for table in (self.TICKER_TABLES if tables is None else tables):
+            if timezone is None and table != 'security' and self.schema_version == 2:
+                timezone = self.ticker_timezone(symbol)
+            try:
+                if table == 'security':
+                    ticker_info = self.request_info(symbol)
+                    ticker_data['exchange'], ticker_data['security'] = self.security_rows(symbol, ticker_info)
+                    timezone = resolve_timezone(ticker_data['exchange'][1])
+                elif table == 'price_daily':
+                    time_series_daily = daily_history
+                    if time_series_daily is None:
+                        time_series_daily = self.request_history(symbol, period='max', interval='1d',
+                                                                 auto_adjust=False, actions=False)
+                    ticker_data['price_daily'] = self.yfinance_timeseries_to_rows(symbol, time_series_daily,
+                                                                                  'price_daily', timezone)
+                elif table == 'price_minutely':
+                    minutely_data = []
+                    for date in self.minutely_data_download_intervals():
+                        time_series_minutely = self.request_history(symbol, self.EXPECTED_EMPTY_RETRIES,
+                                                                    start=date[0], end=date[1], interval='1m',
+                                                                    auto_adjust=False, actions=False)
+                        minutely_data.append(self.yfinance_timeseries_to_rows(symbol, time_series_minutely,
+                                                                              'price_minutely', timezone))
+                    ticker_data['price_minutely'] = minutely_data
+                elif table == 'actions':
+                    ticker_data['actions'] = self.yfinance_timeseries_to_rows(symbol, self.request_actions(symbol),
+                                                                              'actions', timezone)
+                else:
+                    raise ValueError("Unknown table %s, expected one of %s" % (table, self.TICKER_TABLES))
+            except Exception as e:
+                ticker_data['errors'][table] = "%s: %s" % (type(e).__name__, e)
+
+        return ticker_data
+
+    def request(self, endpoint, symbol, params, fetch, empty_retries=None):
+        """
+        Every data source request goes through here: served from the response cache if one is configured, otherwise run
+        through the request scheduler. empty_retries overrides the scheduler's retries of empty responses.
+        """
+        def scheduled_fetch():
+            return self.scheduler.call(fetch, empty_retries=empty_retries)
+
+        if self.cache is None:
+            return scheduled_fetch()
+        return self.cache.get_or_fetch(endpoint, symbol, params, scheduled_fetch,
+                                       cache_empty=empty_retries is not None)
+
+    def request_info(self, symbol):
+        return self.request('info', symbol, {}, lambda: self.source.info(symbol))
+
+    def request_history(self, symbol, empty_retries=None, **history_kwargs):
+        endpoint = 'history_%s' % history_kwargs.get('interval', '1d')
+        return self.request(endpoint, symbol, history_kwargs, lambda: self.source.history(symbol, **history_kwargs),
+                            empty_retries=empty_retries)
+
+    def request_actions(self, symbol):
+        return self.request('actions', symbol, {}, lambda: self.source.actions(symbol),
+                            empty_retries=self.EXPECTED_EMPTY_RETRIES)
+
+    def request_download(self, symbols, **download_kwargs):
+        endpoint = 'download_%s' % download_kwargs.get('interval', '1d')
+        return self.request(endpoint, sorted(symbols), download_kwargs,
+                            lambda: self.source.download(symbols, **download_kwargs))
+
+    @staticmethod
+    def security_rows(symbol, ticker_info):
+        """
+        Rows of the exchange and security tables from a yfinance info dict
+        """
+        exchange_attributes = (ticker_info.get('exchange', "NULL"),
+                               ticker_info.get('exchangeTimezoneName', "NULL"),
+                               ticker_info.get('exchangeTimezoneShortName', "NULL"))
+
+        security_attributes = (symbol,
+                               ticker_info.get('shortName', "NULL"),
+                               ticker_info.get('longName', "NULL"),
+                               ticker_info.get('exchange', "NULL"),
+                               ticker_info.get('currency', "NULL"),
+                               ticker_info.get('quoteType', "NULL"),
+                               ticker_info.get('sector', "NULL"),
+                               ticker_info.get('industry', "NULL"),
+                               ticker_info.get('market', "NULL"),
+                               ticker_info.get('country', "NULL"),
+                               ticker_info.get('fullTimeEmployees', "NULL"),
+                               ticker_info.get('website', "NULL"))
+        return exchange_attributes, security_attributes
+
+    def yfinance_timeseries_to_rows(self, ticker, timeseries_df, table, timezone=None):
+        """
+        Used to convert yfinance timeseries data (pandas dataframe) to a lazy iterator of row tuples for table, see
+        db_convert.timeseries_to_rows
+        """
+        return timeseries_to_rows(ticker, timeseries_df, table, schema_version=self.schema_version,
+                                  timezone=timezone)
+
+    def ticker_timezones(self):
+        """
+        Returns
+            timezones (dict) : ticker -> exchange timezone (DB_ASSUMED_TZ where unknown)
+        """
         with DBCursor(self.db_path, self.read_only) as cursor:
-            # populate exchange table
-            exchange_attributes = (ticker_info.get('exchange', "NULL"),
-                                   ticker_info.get('exchangeTimezoneName', "NULL"),
-                                   ticker_info.get('exchangeTimezoneShortName', "NULL"))
-            cursor.execute("PRAGMA table_info(exchange)")
-            wildcards = ','.join(['?'] * len(cursor.fetchall()))
-            cursor.execute("INSERT OR IGNORE INTO exchange VALUES (%s)" % wildcards, exchange_attributes)
-
-            # populate security table
-            security_attributes = (symbol,
-                                   ticker_info.get('shortName', "NULL"),
-                                   ticker_info.get('longName', "NULL"),
-                                   ticker_info.get('exchange', "NULL"),
-                                   ticker_info.get('currency', "NULL"),
-                                   ticker_info.get('quoteType', "NULL"),
-                                   ticker_info.get('sector', "NULL"),
-                                   ticker_info.get('industry', "NULL"),
-                                   ticker_info.get('market', "NULL"),
-                                   ticker_info.get('country', "NULL"),
-                                   ticker_info.get('fullTimeEmployees', "NULL"),
-                                   ticker_info.get('website', "NULL"))
-            cursor.execute("PRAGMA table_info(security)")
-            wildcards = ','.join(['?'] * len(cursor.fetchall()))
-            cursor.execute("INSERT OR REPLACE INTO security VALUES (%s)" % wildcards, security_attributes)
-
-            # populate price_daily table
-            time_series_daily = yf.download(symbol, period='max', interval='1d', threads='False', progress=False)
-            daily_data = self.yfinance_timeseries_to_tuple(symbol, 'security_ticker', time_series_daily)
-            cursor.execute("PRAGMA table_info(price_daily)")
-            wildcards = ','.join(['?'] * len(cursor.fetchall()))
-            cursor.executemany("INSERT OR IGNORE INTO price_daily VALUES (%s)" % wildcards, daily_data)
-
-            # populate price_minutely table
-            date_intervals = self.minutely_data_download_intervals()
-            for date in date_intervals:
-                time_series_minutely = yf.download(symbol, start=date[0], end=date[1], interval='1m',
-                                                   threads='False', progress=False)
-
-                minutely_data = self.yfinance_timeseries_to_tuple(symbol, 'security_ticker', time_series_minutely)
-                cursor.execute("PRAGMA table_info(price_minutely)")
-                wildcards = ','.join(['?'] * len(cursor.fetchall()))
-                cursor.executemany("INSERT OR IGNORE INTO price_minutely VALUES (%s)" % wildcards, minutely_data)
-
-            # populate actions table
-            actions = yf_ticker.actions
-            actions_data = self.yfinance_timeseries_to_tuple(symbol, 'security_ticker', actions)
-            cursor.execute("PRAGMA table_info(actions)")
-            wildcards = ','.join(['?'] * len(cursor.fetchall()))
-            cursor.executemany("INSERT OR IGNORE INTO actions VALUES (%s)" % wildcards, actions_data)
-
-        print(symbol, "add_ticker() data downloaded and populated in tables.")
-
-    def yfinance_timeseries_to_tuple(self, ticker, column_name, timeseries_df):
-        """
-        Used to convert yfinance timeseries data (pandas dataframe) to tuple of tuples
-        """
-        timeseries_df[column_name] = [ticker] * len(timeseries_df.index)
-        timeseries_df.index = timeseries_df.index.strftime("%Y-%m-%d %H:%M:%S")
-        timeseries_df_formatted = timeseries_df.itertuples()
-        output = tuple(timeseries_df_formatted)
+            cursor.execute("SELECT s.ticker, e.exchange_timezone FROM security s "
+                           "LEFT JOIN exchange e ON s.exchange = e.exchange_name")
+            output = cursor.fetchall()
+        return {ticker: resolve_timezone(timezone) for ticker, timezone in output}
 
-        return output
+    def ticker_timezone(self, ticker):
+        with DBCursor(self.db_path, self.read_only) as cursor:
+            cursor.execute("SELECT e.exchange_timezone FROM security s "
+                           "JOIN exchange e ON s.exchange = e.exchange_name WHERE s.ticker=?", (ticker,))
+            row = cursor.fetchone()
+        return resolve_timezone(None if row is None else row[0])
+
+    def encode_date(self, date, timezone=None):
+        """
+        A datetime (exchange wall time if naive) as stored in the date column of this database's schema version
+        """
+        if self.schema_version == 2:
+            return int(epoch_seconds([date], timezone)[0])
+        return date.strftime(DB_DATE_FORMAT)
+
+    def ticker_key(self, ticker):
+        """
+        Value identifying ticker in the price and actions tables (column ticker_column): the ticker itself, or its
+        security_id (None if unknown) in databases with integer security ids
+        """
+        if not self.security_ids:
+            return ticker
+        if ticker not in self.ticker_ids:
+            with DBCursor(self.db_path, self.read_only) as cursor:
+                cursor.execute("SELECT ticker, security_id FROM security")
+                self.ticker_ids = dict(cursor.fetchall())
+        return self.ticker_ids.get(ticker)
+
+    def tickers_by_key(self):
+        """
+        Returns
+            tickers (dict) : value of ticker_column -> ticker
+        """
+        with DBCursor(self.db_path, self.read_only) as cursor:
+            cursor.execute("SELECT ticker, %s FROM security" % ('security_id' if self.security_ids else 'ticker'))
+            output = cursor.fetchall()
+        return {key: ticker for ticker, key in output}
+
+    def ticker_frame(self, df, ticker):
+        """
+        Gives a per ticker query result the columns of a schema v1 database: security_id is replaced by a
+        security_ticker column. In schema v2 the epoch date column becomes a DatetimeIndex in the exchange timezone
+        of ticker.
+        """
+        if self.security_ids:
+            df.pop('security_id')
+            df['security_ticker'] = ticker
+        if self.schema_version == 2:
+            df.index = epochs_to_index(df.pop('date'), self.ticker_timezone(ticker))
+        return df
 
     def minutely_data_download_intervals(self, optional_start=(datetime.datetime.today() - datetime.timedelta(29))):
         """
@@ -177,33 +525,364 @@ class FinanceDB:
             except Error as e:
                 print(e)
 
-    def dataframe_from_query(self, query):
+    def dataframe_from_query(self, query, params=()):
         with DBCursor(self.db_path, self.read_only) as cursor:
-            cursor.execute(query)
+            cursor.execute(query, params)
             output = cursor.fetchall()
             cols = list(map(lambda x: x[0], cursor.description))
             df = pd.DataFrame(output, columns=cols)
         return df
 
+    def minutely_dataframe_from_query(self, query, params=(), start=None, end=None):
+        """
+        dataframe_from_query for queries on price_minutely. In a time partitioned database, the query only reads
+        the partitions holding dates in [start, end) (as stored, None for unbounded), see MinutelyPartitions.fetch
+        """
+        if self.partitions is None:
+            return self.dataframe_from_query(query, params)
+        with DBCursor(self.db_path, self.read_only) as cursor:
+            cols, output = self.partitions.fetch(cursor, query, params, start, end)
+        return pd.DataFrame(output, columns=cols)
+
+    def parquet_or_query(self, table, query, params=(), tickers=None, columns=None, start=None, end=None):
+        """
+        Rows of a price table from the parquet backend if the database has one (tickers: ticker names, None for
+        all; columns and dates in [start, end) as in ParquetStore.read), else from the SQLite query
+        """
+        df = None if self.parquet is None else self.parquet.read(table, tickers, columns, start, end)
+        if df is not None:
+            return df
+        if table == 'price_minutely':
+            return self.minutely_dataframe_from_query(query, params, start, end)
+        return self.dataframe_from_query(query, params)
+
+    def with_archived(self, df, key=None, start=None, end=None):
+        """
+        Adds the archived price_minutely rows of a ticker (value of ticker_column, None for all tickers) to the
+        query result df, see db_archive.py; with a key, only those with dates in [start, end) (as stored, None
+        for unbounded). The rows of one ticker stay sorted by date.
+        """
+        if self.archive is None:
+            return df
+        with DBCursor(self.db_path, self.read_only) as cursor:
+            archived = self.archive.read(cursor, key, start, end)
+        if archived is None:
+            return df
+        archived = archived[list(df.columns)]
+        if key is not None:
+            archived = self.date_window(archived, start, end)
+        elif start is not None or end is not None:  # rows of several tickers, not sorted by date
+            archived = archived[((archived['date'] >= start) if start is not None else True)
+                                & ((archived['date'] < end) if end is not None else True)].reset_index(drop=True)
+        if df.empty:
+            return archived
+        df = pd.concat([archived, df], ignore_index=True)
+        if key is not None and not df['date'].is_monotonic_increasing:  # days restored by DBWriter.readjust
+            df = df.sort_values('date', kind='stable', ignore_index=True)
+        return df
+
     def get_table(self, tablename):
         query = "SELECT * FROM %s" % tablename
+        if tablename == 'price_minutely':
+            return self.with_archived(self.parquet_or_query(tablename, query))
+        if tablename == 'price_daily':
+            return self.parquet_or_query(tablename, query)
         df = self.dataframe_from_query(query)
         return df
 
-    def get_daily_per_ticker(self, ticker):
-        query = "SELECT * FROM price_daily WHERE security_ticker='%s' ORDER BY date" % ticker
-        df = self.dataframe_from_query(query)
-        return df
+    def iter_query(self, query, params=(), chunk_size=ITER_CHUNK_SIZE):
+        """
+        Streams the result of a query as DataFrames of at most chunk_size rows (cursor.fetchmany), so memory stays
+        bounded whatever the size of the result. The query holds one connection and read transaction until the
+        generator is exhausted or closed.
+        """
+        with DBCursor(self.db_path, self.read_only) as cursor:
+            cursor.execute(query, params)
+            cols = [column[0] for column in cursor.description]
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield pd.DataFrame(rows, columns=cols)
+            except GeneratorExit:  # closed early, not an error
+                return
 
-    def get_minutely_per_ticker(self, ticker):
-        query = "SELECT * FROM price_minutely WHERE security_ticker='%s' ORDER BY date" % ticker
-        df = self.dataframe_from_query(query)
-        return df
+    def iter_table(self, tablename, chunk_size=ITER_CHUNK_SIZE):
+        """
+        Streams a table as DataFrames of at most chunk_size rows, the bounded memory version of get_table. Price and
+        actions tables are read in keyset pages of the (ticker, date) primary key.
+        """
+        if tablename not in DB_TIMESERIES_TABLES:
+            yield from self.iter_query("SELECT * FROM %s" % tablename, chunk_size=chunk_size)
+            return
+        if tablename == 'price_minutely' and (self.partitions is not None or self.archive is not None):
+            yield from self.rechunk(self.iter_minutely_by_ticker(chunk_size), chunk_size)
+            return
+        last = ()
+        while True:
+            query = "SELECT * FROM %s%s ORDER BY %s, date LIMIT %d" % (
+                tablename, " WHERE (%s, date) > (?, ?)" % self.ticker_column if last else '', self.ticker_column,
+                chunk_size)
+            df = self.dataframe_from_query(query, last)
+            if not df.empty:
+                yield df
+            if len(df) < chunk_size:
+                return
+            last = (df[self.ticker_column].iloc[-1:].tolist()[0], df['date'].iloc[-1:].tolist()[0])
 
-    def get_actions_per_ticker(self, ticker):
-        query = "SELECT * FROM actions WHERE security_ticker='%s' ORDER BY date" % ticker
-        df = self.dataframe_from_query(query)
-        return df
+    def iter_minutely_by_ticker(self, chunk_size=ITER_CHUNK_SIZE):
+        """
+        The price_minutely rows of a database with minutely partitions or an archive, ticker by ticker in date order,
+        as DataFrames of at most chunk_size rows
+        """
+        if self.partitions is None:
+            paths = [self.db_path]
+        else:
+            paths = [self.partitions.path(key) for key in self.partitions.keys()]
+        for key in sorted(self.tickers_by_key()):
+            groups = []  # [first start, first start of the next group] of archived chunks of <= chunk_size rows
+            if self.archive is not None:
+                with DBCursor(self.db_path, self.read_only) as cursor:
+                    cursor.execute("SELECT start, rows FROM %s WHERE %s=? ORDER BY start"
+                                   % (ARCHIVE_TABLE, self.ticker_column), (key,))
+                    chunks = cursor.fetchall()
+                rows = 0
+                for start, num_rows in chunks:
+                    if not groups or rows + num_rows > chunk_size:
+                        if groups:
+                            groups[-1][1] = start
+                        groups.append([start, None])
+                        rows = 0
+                    rows += num_rows
+            after = None  # date of the last row in price_minutely yielded
+            for first, following in groups + [[None, None]]:
+                for path in paths:
+                    for df in self.iter_ticker_pages(path, key, after, first, chunk_size):
+                        after = df['date'].iloc[-1:].tolist()[0]
+                        yield df
+                if first is not None:
+                    with DBCursor(self.db_path, self.read_only) as cursor:
+                        yield self.archive.read(cursor, key, first, following)
+
+    def iter_ticker_pages(self, path, key, after=None, before=None, chunk_size=ITER_CHUNK_SIZE):
+        """
+        Keyset pages of the price_minutely rows of a ticker (value of ticker_column) in the database file path,
+        with dates in (after, before) (None for unbounded)
+        """
+        while True:
+            conditions, params = ["%s=?" % self.ticker_column], [key]
+            for condition, bound in [("date>?", after), ("date<?", before)]:
+                if bound is not None:
+                    conditions.append(condition)
+                    params.append(bound)
+            with DBCursor(path, self.read_only) as cursor:
+                cursor.execute("SELECT * FROM price_minutely WHERE %s ORDER BY date LIMIT %d"
+                               % (' AND '.join(conditions), chunk_size), params)
+                df = pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+            if not df.empty:
+                yield df
+            if len(df) < chunk_size:
+                return
+            after = df['date'].iloc[-1:].tolist()[0]
+
+    @staticmethod
+    def rechunk(frames, chunk_size):
+        """
+        Regroups a stream of DataFrames into DataFrames of chunk_size rows (the last one smaller)
+        """
+        pending, size = [], 0
+        for df in frames:
+            pending.append(df)
+            size += len(df)
+            while size >= chunk_size:
+                merged = pd.concat(pending, ignore_index=True)
+                yield merged.iloc[:chunk_size]
+                pending, size = [merged.iloc[chunk_size:]], size - chunk_size
+        if size:
+            yield pd.concat(pending, ignore_index=True)
+
+    def build_column_cache(self):
+        """
+        Writes the ColumnCache of a frozen database from the price tables, one ticker at a time
+        """
+        tickers = self.tickers_by_key()
+
+        def frames():
+            for table in COLUMN_CACHE_TABLES:
+                query = "SELECT * FROM %s WHERE %s=? ORDER BY date" % (table, self.ticker_column)
+                for key, ticker in tickers.items():
+                    if table == 'price_minutely':
+                        yield table, ticker, self.with_archived(self.minutely_dataframe_from_query(query, (key,)), key)
+                    else:
+                        yield table, ticker, self.dataframe_from_query(query, (key,))
+
+        skipped = self.column_cache.build(frames())
+        print("Built column cache", self.column_cache.directory)
+        if skipped:
+            print("Not cached, read from SQLite:", skipped)
+
+    def column_names(self, table):
+        """
+        Column names of table, read once with PRAGMA table_info
+        """
+        if table not in self.table_columns:
+            with DBCursor(self.db_path, self.read_only) as cursor:
+                cursor.execute("PRAGMA table_info(%s)" % table)
+                self.table_columns[table] = [row[1] for row in cursor.fetchall()]
+        return self.table_columns[table]
+
+    def cached_frame(self, table, ticker):
+        """
+        The rows of ticker in a price table from the column cache, None if there is none or it misses the ticker
+        """
+        if self.column_cache is None or table not in COLUMN_CACHE_TABLES:
+            return None
+        return self.column_cache.frame(table, ticker, self.column_names(table), self.ticker_column,
+                                       self.ticker_key(ticker))
+
+    def stored_date(self, date, ticker):
+        """
+        A bound of a date range (datetime or string, exchange wall time of ticker if naive; None for unbounded) as
+        stored in the date column
+        """
+        if date is None:
+            return None
+        date = pd.Timestamp(date)
+        if date.tzinfo is not None and self.schema_version == 1:
+            date = date.tz_convert(self.ticker_timezone(ticker))
+        if date.tzinfo is None and self.schema_version == 2:
+            return self.encode_date(date, self.ticker_timezone(ticker))
+        return self.encode_date(date)
+
+    @staticmethod
+    def date_window(df, start=None, end=None):
+        """
+        Rows of df (sorted by date) with dates in [start, end) (as stored, None for unbounded)
+        """
+        first = 0 if start is None else df['date'].searchsorted(start)
+        last = len(df) if end is None else df['date'].searchsorted(end)
+        return df.iloc[first:last].reset_index(drop=True)
+
+    def ticker_rows(self, table, ticker, start=None, end=None, columns=None, limit=None):
+        """
+        Rows of ticker in price_daily, price_minutely or actions with dates in [start, end) (exchange wall time of
+        ticker if naive, None for unbounded), sorted by date. columns (besides date and the ticker column) and limit
+        are pushed into the read.
+        """
+        names = self.column_names(table)
+        if columns is not None:
+            unknown = sorted(set(columns) - set(names))
+            if unknown:
+                raise ValueError("%s has no columns %s" % (table, unknown))
+            columns = [name for name in names if name in columns or name in ('date', self.ticker_column)]
+        start, end = self.stored_date(start, ticker), self.stored_date(end, ticker)
+        key = self.ticker_key(ticker)
+
+        df = self.cached_frame(table, ticker)
+        if df is not None:
+            df = self.date_window(df, start, end)
+        else:
+            conditions, params = ["%s=?" % self.ticker_column], [key]
+            for condition, bound in [("date>=?", start), ("date<?", end)]:
+                if bound is not None:
+                    conditions.append(condition)
+                    params.append(bound)
+            query = "SELECT %s FROM %s WHERE %s ORDER BY date" % (', '.join(columns or ['*']), table,
+                                                                  ' AND '.join(conditions))
+            if limit is not None:
+                query += " LIMIT %d" % limit
+            if table == 'actions':
+                df = self.dataframe_from_query(query, params)
+            else:
+                df = self.parquet_or_query(table, query, params, [ticker], columns, start, end)
+            if table == 'price_minutely' and key is not None:  # None: not in the security table
+                df = self.with_archived(df, key, start, end)
+        if columns is not None:
+            df = df[columns]
+        if limit is not None:
+            df = df.iloc[:limit]
+        return self.ticker_frame(df, ticker)
+
+    def get_daily_per_ticker(self, ticker, start=None, end=None, columns=None, limit=None):
+        return self.ticker_rows('price_daily', ticker, start, end, columns, limit)
+
+    def get_minutely_per_ticker(self, ticker, start=None, end=None, columns=None, limit=None):
+        return self.ticker_rows('price_minutely', ticker, start, end, columns, limit)
+
+    def get_actions_per_ticker(self, ticker, start=None, end=None, columns=None, limit=None):
+        return self.ticker_rows('actions', ticker, start, end, columns, limit)
+
+    def get_panel(self, tickers, field='close', start=None, end=None, how='inner', interval='days'):
+        """
+        One field of several tickers (the panel's columns) aligned on their dates, read in one query
+
+        Input
+            how (str) : 'inner' keeps the dates every ticker has a row for, 'outer' all dates (NaN where missing)
+            interval (str) : 'days' (price_daily) or 'minutes' (price_minutely)
+        """
+        tables = {'days': 'price_daily', 'minutes': 'price_minutely'}
+        if interval not in tables:
+            raise ValueError("Unknown interval %s, expected one of %s" % (interval, list(tables)))
+        if how not in ('inner', 'outer'):
+            raise ValueError("Unknown how %s, expected 'inner' or 'outer'" % how)
+        table = tables[interval]
+        if field not in self.column_names(table) or field in ('date', self.ticker_column):
+            raise ValueError("%s has no price column %s" % (table, field))
+        tickers = list(dict.fromkeys(tickers))
+        keys = [self.ticker_key(ticker) for ticker in tickers]
+        known = [key for key in keys if key is not None]
+        # naive bounds are in the exchange wall time of each ticker, so tickers of different timezones get their own
+        bounds = {key: (self.stored_date(start, ticker), self.stored_date(end, ticker))
+                  for ticker, key in zip(tickers, keys) if key is not None}
+        groups = {}  # (start, end) as stored -> keys
+        for key, key_bounds in bounds.items():
+            groups.setdefault(key_bounds, []).append(key)
+
+        conditions, params = [], []
+        for (group_start, group_end), group_keys in groups.items():
+            group_conditions = ["%s IN (%s)" % (self.ticker_column, ','.join(['?'] * len(group_keys)))]
+            params += group_keys
+            for condition, bound in [("date>=?", group_start), ("date<?", group_end)]:
+                if bound is not None:
+                    group_conditions.append(condition)
+                    params.append(bound)
+            conditions.append('(%s)' % ' AND '.join(group_conditions))
+        where = ' OR '.join(conditions) or '0'  # no known tickers: no rows
+        query = "SELECT date, %s, %s FROM %s WHERE %s" % (self.ticker_column, field, table, where)
+        # the parquet and archive reads take one window, the union of the tickers' windows
+        starts, ends = [bound[0] for bound in groups], [bound[1] for bound in groups]
+        start = None if None in starts or not starts else min(starts)
+        end = None if None in ends or not ends else max(ends)
+        df = self.parquet_or_query(table, query, params, tickers, ['date', self.ticker_column, field], start, end)
+        if table == 'price_minutely' and known:
+            df = self.with_archived(df, None, start, end)
+            df = df[df[self.ticker_column].isin(known)]
+        if len(groups) > 1:
+            row_keys = df[self.ticker_column]
+            in_window = np.ones(len(df), dtype=bool)
+            if start is not None:
+                in_window &= (df['date'] >= row_keys.map({key: bound[0] for key, bound in bounds.items()})).to_numpy()
+            if end is not None:
+                in_window &= (df['date'] < row_keys.map({key: bound[1] for key, bound in bounds.items()})).to_numpy()
+            df = df[in_window]
+
+        date_codes, dates = pd.factorize(df['date'], sort=True)
+        positions = pd.Index(keys).get_indexer(df[self.ticker_column])
+        matrix = np.full((len(dates), len(tickers)), np.nan)
+        matrix[date_codes, positions] = df[field].to_numpy(dtype=float, na_value=np.nan)
+        if how == 'inner':
+            complete = np.bincount(date_codes, minlength=len(dates)) == len(tickers)  # (ticker, date) is unique
+            matrix, dates = matrix[complete], dates[complete]
+
+        if self.schema_version == 2:
+            all_timezones = self.ticker_timezones()
+            timezones = {all_timezones.get(ticker) for ticker in tickers}
+            index = epochs_to_index(dates, timezones.pop() if len(timezones) == 1 else 'UTC')
+        else:
+            index = pd.DatetimeIndex(pd.to_datetime(np.asarray(dates, dtype=object), format=DB_DATE_FORMAT),
+                                     name='date')
+        return pd.DataFrame(matrix, index=index, columns=tickers, copy=False)
 
     def get_present_tickers(self):
         with DBCursor(self.db_path, self.read_only) as cursor:
@@ -213,97 +892,177 @@ class FinanceDB:
         return output
 
     def dbfile_md5(self, file_name):
-        hash_md5 = hashlib.md5()
-        with open(file_name, "rb") as f:
-            for chnk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chnk)
-        return hash_md5.hexdigest()
+        return file_md5(file_name)
 
     def valid_frozen_db(self, db_filename):
+        """
+        Whether db_filename is a frozen variant, raising if the file does not match its md5sum. The file is hashed
+        only if it changed since the last successful check (see db_integrity.verified_md5).
+        """
         flag_frozen = False
         for key in DB_FROZEN_VARIANTS.keys():
             if DB_FROZEN_VARIANTS[key]["db_filename"] == db_filename:
-                md5 = self.dbfile_md5(self.db_path)
-                if not DB_FROZEN_VARIANTS[key]["md5sum"] == md5:
+                if not verified_md5(self.db_path, DB_FROZEN_VARIANTS[key]["md5sum"]):
                     raise ValueError("Frozen DB name provided, but DB file inconsistent with prepackaged DB.")
                 else:
                     flag_frozen = True
         return flag_frozen
 
-    def __TODO_actions_since_date(self, ticker, date):
-        yf_ticker = yf.Ticker(ticker)
-        actions = yf_ticker.actions
-        data = self.yfinance_timeseries_to_tuple(ticker, 'security_ticker', actions)
+    def high_water_marks(self, table):
+        """
+        Returns
+            latest (dict) : ticker -> datetime.datetime (exchange wall time) of its newest row in table
+        """
+        query = "SELECT %s, MAX(date) FROM %s GROUP BY %s" % (self.ticker_column, table, self.ticker_column)
+        if table == 'price_minutely' and self.partitions is not None:
+            df = self.minutely_dataframe_from_query(query)
+            # groups of partitions come in chronological order, so the last maximum of a ticker is its newest date
+            output = list(dict(zip(df.iloc[:, 0].tolist(), df.iloc[:, 1].tolist())).items())
+        else:
+            with DBCursor(self.db_path, self.read_only) as cursor:
+                cursor.execute(query)
+                output = cursor.fetchall()
+        if self.security_ids:
+            tickers = self.tickers_by_key()
+            output = [(tickers[key], date) for key, date in output]
+        if self.schema_version == 2:
+            timezones = self.ticker_timezones()
+            return {ticker: epochs_to_index([date], timezones.get(ticker))[0].tz_localize(None).to_pydatetime()
+                    for ticker, date in output}
+        return {ticker: datetime.datetime.strptime(date, DB_DATE_FORMAT) for ticker, date in output}
+
+    def actions_since_date(self, ticker, date=None, timezone=None):
+        """
+        Actions (dividends/splits) strictly after date (exchange wall time in timezone), all actions if date is None
+        """
+        actions = self.request_actions(ticker)
+        data = self.yfinance_timeseries_to_rows(ticker, actions, 'actions', timezone)
         cols = ["date", "dividends", "stock_splits", "security_ticker"]
         actions_df = pd.DataFrame(data, columns=cols)
-        actions_since = actions_df[actions_df["date"] > date.strftime("%Y-%m-%d")]
+        if date is None:
+            return actions_df
+        actions_since = actions_df[actions_df["date"] > self.encode_date(date, timezone)]
 
         return actions_since
 
-    def __TODO_fetch_minutely_starting_at(self, ticker, start):
+    def fetch_minutely_starting_at(self, ticker, start, timezone=None):
+        """
+        Minutely rows from the day of start until today, one set of rows per download interval
+        """
         # must be run within 29 days to maintain continuity with existing dataset
-
         assert start > datetime.datetime.today() - datetime.timedelta(29)
         date_intervals = self.minutely_data_download_intervals(start)
 
+        data = []
         for date in date_intervals:
-            time_series_minutely = yf.download(ticker, start=date[0], end=date[1], interval='1m', threads='true',
-                                               progress=False)
-            data = self.yfinance_timeseries_to_tuple(ticker, 'security_ticker', time_series_minutely)
-
-            return data
+            time_series_minutely = self.request_history(ticker, self.EXPECTED_EMPTY_RETRIES, start=date[0],
+                                                        end=date[1], interval='1m', auto_adjust=False, actions=False)
+            data.append(self.yfinance_timeseries_to_rows(ticker, time_series_minutely, 'price_minutely', timezone))
 
-    def __TODO_fetch_daily_between(self, ticker, start, end):
-
-        time_series_daily = yf.download(ticker, start=start.strftime('%Y-%m-%d'), end=end.strftime('%Y-%m-%d'),
-                                        interval='1d', threads='true', progress=False)
-        data = self.yfinance_timeseries_to_tuple(ticker, 'security_ticker', time_series_daily)
         return data
 
-    def __TODO_update(self):
+    def fetch_daily_between(self, ticker, start, end, timezone=None):
         """
-        Perform update of actions/daily-price/minutely-price and account for stock splits + dividends
-        Work in progress
+        Daily rows from the day of start (full history if None) to the day of end, both inclusive
         """
+        end = (end + datetime.timedelta(1)).strftime('%Y-%m-%d')  # yfinance end date is exclusive
+        if start is None:
+            time_series_daily = self.request_history(ticker, period='max', interval='1d', auto_adjust=False,
+                                                     actions=False)
+        else:
+            time_series_daily = self.request_history(ticker, self.EXPECTED_EMPTY_RETRIES,
+                                                     start=start.strftime('%Y-%m-%d'), end=end, interval='1d',
+                                                     auto_adjust=False, actions=False)
+        data = self.yfinance_timeseries_to_rows(ticker, time_series_daily, 'price_daily', timezone)
+        return data
 
-        tickers_present = self.get_present_tickers()
-        today = datetime.datetime.today()
-        for ticker in tickers_present:
+    @staticmethod
+    def start_of_day(date):
+        return date.replace(hour=0, minute=0, second=0, microsecond=0)
 
-            latest_daily = datetime.datetime.strptime(self.get_daily_per_ticker(ticker)["date"].iloc[-1],
-                                                      "%Y-%m-%d %H:%M:%S")
-            latest_minutely = datetime.datetime.strptime(self.get_minutely_per_ticker(ticker)["date"].iloc[-1],
-                                                         "%Y-%m-%d %H:%M:%S")
+    def fetch_ticker_update(self, symbol, latest, timezone=None):
+        """
+        Downloads only the rows of symbol that are newer than its high-water marks latest (table name -> datetime).
+        Safe to call from worker threads.
 
-            actions_since = self.__TODO_actions_since_date(ticker, latest_daily)
+        Returns
+            ticker_data (dict) : as fetch_ticker_data, plus new_actions (actions newer than the stored actions and
+                                 prices) and stale_before (table name -> date before which stored rows predate them)
+        """
+        today = datetime.datetime.today()
+        stale_before = {}
+        ticker_data = {'symbol': symbol, 'stale_before': stale_before}
 
-            if actions_since.empty:
+        # re-download the day of the high-water mark too, its bar may have been partial when stored
+        latest_daily = latest.get('price_daily')
+        ticker_data['price_daily'] = self.fetch_daily_between(symbol, latest_daily, today, timezone)
+        if latest_daily is not None:
+            stale_before['price_daily'] = self.encode_date(self.start_of_day(latest_daily), timezone)
 
-                if today > latest_daily + datetime.timedelta(1):
+        earliest_minutely = today - datetime.timedelta(28)
+        latest_minutely = latest.get('price_minutely')
+        if latest_minutely is None or latest_minutely < earliest_minutely:
+            if latest_minutely is not None:
+                print(symbol, "updating this late (>29 days since last update) will break timeseries continuity.")
+                stale_before['price_minutely'] = self.encode_date(self.start_of_day(earliest_minutely), timezone)
+            latest_minutely = earliest_minutely
+        else:
+            stale_before['price_minutely'] = self.encode_date(self.start_of_day(latest_minutely), timezone)
+        ticker_data['price_minutely'] = self.fetch_minutely_starting_at(symbol, latest_minutely, timezone)
 
-                    # do daily updates
-                    daily_data = self.__TODO_fetch_daily_between(ticker, latest_daily, today)
+        actions_df = self.actions_since_date(symbol, latest.get('actions'), timezone)
+        ticker_data['actions'] = actions_df.itertuples(index=False, name=None)
+        # stored prices were downloaded already adjusted for the actions up to their newest date, which may be
+        # missing from the actions table (empty actions response, add_daily_bulk, legacy import)
+        if latest_daily is not None:
+            actions_df = actions_df[actions_df["date"] > self.encode_date(latest_daily, timezone)]
+        ticker_data['new_actions'] = actions_df
 
-                    with DBCursor(self.db_path, self.read_only) as cursor:
-                        cursor.execute("PRAGMA table_info(price_daily)")
-                        wildcards = ','.join(['?'] * len(cursor.fetchall()))
-                        cursor.executemany("INSERT OR IGNORE INTO price_daily VALUES (%s)" % wildcards, daily_data)
+        return ticker_data
 
-                    # do minutely updates
-                    if today - datetime.timedelta(1) < latest_daily + datetime.timedelta(29):
+    def readjust_for_actions(self, ticker, actions_df, ohlcv=False):
+        """
+        Re-adjusts all stored prices of ticker that predate the given actions. Each set of actions must only be applied
+        once.
+        """
+        end_of_time = '9999' if self.schema_version == 1 else 2 ** 62  # after every stored date
+        stale_before = {'price_daily': end_of_time, 'price_minutely': end_of_time}
+        with DBWriter(self.db_path, self.read_only, bulk_load=False) as writer:
+            rowcounts = writer.readjust(ticker, actions_df, stale_before, ohlcv=ohlcv)
+        return rowcounts
 
-                        minutely_data = self.__TODO_fetch_minutely_starting_at(ticker, today - datetime.timedelta(1))
+    def update(self, workers=4, transaction_batch_size=16, adjust_ohlcv=False):
+        """
+        Incremental update of price_daily, price_minutely and actions for every ticker in the security table: only rows
+        after the high-water marks are downloaded, and the stored rows are re-adjusted for new splits/dividends.
 
-                        with DBCursor(self.db_path, self.read_only) as cursor:
-                            cursor.execute("PRAGMA table_info(price_minutely)")
-                            wildcards = ','.join(['?'] * len(cursor.fetchall()))
-                            cursor.executemany("INSERT OR IGNORE INTO price_minutely VALUES (%s)" % wildcards,
-                                               minutely_data)
+        Returns
+            report (dict) : ticker -> {table name: rows written} if the ticker was updated, otherwise the error message
+        """
+        latest_per_table = {table: self.high_water_marks(table)
+                            for table in ['price_daily', 'price_minutely', 'actions']}
+        tickers_present = self.get_present_tickers()
+        timezones = self.ticker_timezones()
 
-                    else:
-                        print("Updating this late (>29 days since last update) will break timeseries continuity.")
+        def fetch(symbol):
+            latest = {table: latest_per_table[table][symbol]
+                      for table in latest_per_table if symbol in latest_per_table[table]}
+            return self.fetch_ticker_update(symbol, latest, timezones.get(symbol))
 
-                else:
-                    print(ticker, " data already up to date.")
+        report = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor, \
+                DBWriter(self.db_path, self.read_only, batch_size=transaction_batch_size) as writer:
+            for symbol, future in self.submit_in_order(executor, tickers_present, fetch, 2 * workers):
+                try:
+                    report[symbol] = writer.write_ticker(future.result(), conflict='REPLACE',
+                                                         adjust_ohlcv=adjust_ohlcv)
+                    print(symbol, "update() rows written:", report[symbol])
+                except Exception as e:
+                    report[symbol] = "%s: %s" % (type(e).__name__, e)
+                    print(symbol, "update() failed:", report[symbol])
 
-            # TODO: else (create multiplication sequence to do serial dividend/split updates)
+        failed = [symbol for symbol, outcome in report.items() if isinstance(outcome, str)]
+        print("update() updated %d of %d tickers." % (len(report) - len(failed), len(report)))
+        if failed:
+            print("Failed tickers:", failed)
+        return report
@@ -0,0 +1,102 @@
+import os
+import shutil
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from src.db_convert import format_dates
+
+COLUMN_CACHE_TABLES = ('price_daily', 'price_minutely')
+
+
+class ColumnCache:
+    """
+    Opt-in cache of a frozen database as one .npy file per table, ticker and column under
+    <db name>_columns/<md5sum>/, read back memory mapped. Tickers that cannot be stored losslessly are read from SQLite.
+    """
+
+    def __init__(self, db_path, md5sum, schema_version=1):
+        self.directory = os.path.join(os.path.splitext(db_path)[0] + '_columns', md5sum)
+        self.text_dates = schema_version == 1
+        self.arrays = {}  # (table, ticker) -> {column: memory mapped array}, opened on first read
+        self.text_dates_cache = {}  # (table, ticker) -> DB_DATE_FORMAT strings, schema v1 only
+
+    def ticker_dir(self, table, ticker, directory=None):
+        return os.path.join(directory or self.directory, table, urllib.parse.quote(ticker, safe=''))
+
+    def is_built(self):
+        return os.path.isdir(self.directory)
+
+    @staticmethod
+    def date_seconds(dates):
+        """
+        Stored dates as int64 seconds, None if a text date does not round trip through DB_DATE_FORMAT
+        """
+        if pd.api.types.is_integer_dtype(dates.dtype):
+            return dates.to_numpy(dtype=np.int64)
+        seconds = pd.to_datetime(dates, format='ISO8601').to_numpy().astype('datetime64[s]')
+        if not np.array_equal(format_dates(seconds), dates.to_numpy(dtype=str)):
+            return None
+        return seconds.view(np.int64)
+
+    def build(self, frames):
+        """
+        Writes the cache from (table, ticker, rows ordered by date) frames into a temporary directory renamed into place
+
+        Returns
+            skipped (list) : (table, ticker) left to SQLite
+        """
+        building = '%s.%d.tmp' % (self.directory, os.getpid())
+        shutil.rmtree(building, ignore_errors=True)  # left by an interrupted build of a process with the same pid
+        skipped = []
+        for table, ticker, df in frames:
+            dates = self.date_seconds(df['date'])
+            if dates is None or any(df[column].dtype == object for column in df.columns[1:-1]):
+                skipped.append((table, ticker))
+                continue
+            ticker_dir = self.ticker_dir(table, ticker, building)
+            os.makedirs(ticker_dir)
+            np.save(os.path.join(ticker_dir, 'date.npy'), dates)
+            for column in df.columns[1:-1]:  # without date and the ticker column
+                np.save(os.path.join(ticker_dir, column + '.npy'), df[column].to_numpy())
+        os.makedirs(building, exist_ok=True)
+        try:
+            os.rename(building, self.directory)
+        except OSError:  # built meanwhile by another process
+            shutil.rmtree(building)
+        return skipped
+
+    def columns(self, table, ticker):
+        """
+        Memory mapped, read-only columns of a ticker's rows (column name -> array), None if the ticker is not cached
+        """
+        if (table, ticker) not in self.arrays:
+            ticker_dir = self.ticker_dir(table, ticker)
+            if not os.path.isdir(ticker_dir):
+                return None
+            # plain ndarray views (of the np.memmap), so dataframes built on them hold ordinary arrays
+            self.arrays[(table, ticker)] = {
+                filename[:-len('.npy')]: np.load(os.path.join(ticker_dir, filename), mmap_mode='r').view(np.ndarray)
+                for filename in os.listdir(ticker_dir) if filename.endswith('.npy')}
+        return self.arrays[(table, ticker)]
+
+    def frame(self, table, ticker, column_names, ticker_column, key):
+        """
+        The query result of the ticker's rows rebuilt from the cache, None if the ticker is not cached
+        """
+        arrays = self.columns(table, ticker)
+        if arrays is None:
+            return None
+        data = {}
+        for column in column_names:
+            if column == ticker_column:
+                data[column] = np.full(len(arrays['date']), key, dtype=object)
+            elif column == 'date' and self.text_dates:
+                if (table, ticker) not in self.text_dates_cache:
+                    self.text_dates_cache[(table, ticker)] = pd.array(
+                        format_dates(arrays['date'].view('datetime64[s]')), dtype=pd.StringDtype(na_value=np.nan))
+                data[column] = self.text_dates_cache[(table, ticker)]
+            else:
+                data[column] = arrays[column]
+        return pd.DataFrame(data, copy=False)
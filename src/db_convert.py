@@ -0,0 +1,100 @@
+import itertools
+import zoneinfo
+import numpy as np
+import pandas as pd
+
+from src.db_default import DB_ASSUMED_TZ, DB_YFINANCE_COLUMNS
+
+DB_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'  # format of the TEXT date column in price_daily, price_minutely, actions
+ROWS_CHUNK_SIZE = 10000  # number of rows converted from numpy to python objects at a time
+
+
+def format_dates(index):
+    """
+    index.strftime(DB_DATE_FORMAT) (exchange wall time, timezone dropped) in one numpy pass
+    """
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    dates = np.datetime_as_string(index.values.astype('datetime64[s]'), unit='s')  # 'YYYY-MM-DDTHH:MM:SS'
+    dates = np.ascontiguousarray(dates, dtype='<U19')
+    characters = dates.view(np.uint32).reshape(len(dates), 19)
+    characters[:, 10] = ord(' ')
+    return dates
+
+
+def resolve_timezone(timezone):
+    """
+    Returns timezone if it is a valid IANA name (e.g. from the exchange table), DB_ASSUMED_TZ otherwise
+    """
+    try:
+        zoneinfo.ZoneInfo(timezone)
+    except (TypeError, ValueError, zoneinfo.ZoneInfoNotFoundError):
+        return DB_ASSUMED_TZ
+    return timezone
+
+
+def epoch_seconds(index, timezone=None):
+    """
+    Seconds since the UTC epoch (schema v2 dates) of a DatetimeIndex; naive timestamps are wall time in timezone
+    (DB_ASSUMED_TZ if None)
+    """
+    index = pd.DatetimeIndex(index)
+    if index.tz is None:
+        index = index.tz_localize(resolve_timezone(timezone), ambiguous=np.zeros(len(index), dtype=bool),
+                                  nonexistent='shift_forward')
+    return index.tz_convert('UTC').tz_localize(None).values.astype('datetime64[s]').astype(np.int64)
+
+
+def epochs_to_index(epochs, timezone):
+    """
+    Inverse of epoch_seconds: a DatetimeIndex named date in the given (exchange) timezone
+    """
+    epochs = np.asarray(epochs, dtype=np.int64)
+    index = pd.DatetimeIndex(epochs.astype('datetime64[s]'), name='date').tz_localize('UTC')
+    return index.tz_convert(resolve_timezone(timezone))
+
+
+def encode_dates(index, schema_version=1, timezone=None):
+    """
+    Dates of index as stored in the date column: DB_DATE_FORMAT strings (schema v1) or epoch seconds (schema v2)
+    """
+    if schema_version == 2:
+        return epoch_seconds(index, timezone)
+    return format_dates(index)
+
+
+def column_values(timeseries_df, column):
+    """
+    Returns the numpy values of a column without copying the dataframe. Handles the (field, ticker) multi-index
+    columns returned by yf.download for a single symbol; missing columns are returned as NULLs.
+    """
+    labels = timeseries_df.columns
+    if isinstance(labels, pd.MultiIndex):
+        labels = labels.get_level_values(0)
+    positions = np.flatnonzero(labels == column)
+    if len(positions) == 0:
+        return np.full(len(timeseries_df.index), None, dtype=object)
+    return timeseries_df.iloc[:, positions[0]].to_numpy()
+
+
+def timeseries_to_rows(ticker, timeseries_df, table, chunk_size=ROWS_CHUNK_SIZE, schema_version=1, timezone=None):
+    """
+    Converts yfinance timeseries data (pandas dataframe) to a lazy iterator of rows
+    (date, *DB_YFINANCE_COLUMNS[table], ticker) of table, with dates encoded for schema_version
+    """
+    if len(timeseries_df.index) == 0:
+        return iter(())
+    dates = encode_dates(timeseries_df.index, schema_version, timezone)
+    values = [column_values(timeseries_df, column) for column in DB_YFINANCE_COLUMNS[table]]
+    return _iter_rows(ticker, dates, values, chunk_size)
+
+
+def _iter_rows(ticker, dates, values, chunk_size):
+    num_rows = len(dates)
+    for start in range(0, num_rows, chunk_size):
+        stop = min(start + chunk_size, num_rows)
+        columns = [dates[start:stop].tolist()]
+        columns.extend(column[start:stop].tolist() for column in values)
+        columns.append(itertools.repeat(ticker))
+        yield from zip(*columns)
@@ -8,14 +8,38 @@ sys.path.append(PROJECT_ROOT)
 
 # file io - specific file locations
 DB_DIR = PROJECT_ROOT + os.sep + 'financial_db'  # db_path files are stored here
+DB_CACHE_DIR = DB_DIR + os.sep + 'yfinance_cache'  # default location of the optional yfinance response cache
 
 # various src file defaults
 DB_ASSUMED_TZ = 'US/Eastern'  # TODO currently used in visualize.py; assumed all database times are in US/Eastern
 DB_DEFAULT_TICKERS = ['MSFT', 'AAPL', 'HUT', 'HUT.TO', 'SPY', 'CADUSD=X', 'BTC-USD', 'ETH-USD', 'ETHX-U.TO']  # TODO remove this usage from db_class.py
 
+
 # schema for the database class
-DB_TABLES = ['''security (
-                    ticker TEXT PRIMARY KEY,
+def db_tables(date_type='TEXT', security_ids=False, without_rowid=False):
+    """
+    Builds the CREATE TABLE bodies of the schema (see db_schema.py for the variants in use)
+
+    Input
+        date_type (str) : 'TEXT' for exchange wall time dates (schema v1), 'INTEGER' for UTC epoch seconds (v2)
+        security_ids (bool) : price and actions tables reference an integer security_id instead of the ticker
+        without_rowid (bool) : price tables are WITHOUT ROWID tables, clustered on (ticker, date)
+    """
+    clustered = ' WITHOUT ROWID' if without_rowid else ''
+    if security_ids:
+        security_key = '''security_id INTEGER PRIMARY KEY,
+                    ticker TEXT UNIQUE NOT NULL,'''
+        reference = '''security_id INTEGER NOT NULL,
+                    CONSTRAINT %s PRIMARY KEY (security_id, date),
+                    FOREIGN KEY(security_id) REFERENCES security (security_id)'''
+    else:
+        security_key = '''ticker TEXT PRIMARY KEY,'''
+        reference = '''security_ticker TEXT,
+                    CONSTRAINT %s PRIMARY KEY (security_ticker, date),
+                    FOREIGN KEY(security_ticker) REFERENCES security (ticker)'''
+
+    return [f'''security (
+                    {security_key}
                     name_short TEXT,
                     name_long TEXT,
                     exchange TEXT,
@@ -29,44 +53,60 @@ DB_TABLES = ['''security (
                     website TEXT,
                     FOREIGN KEY(exchange) REFERENCES exchange (exchange_name)
                     ) ''',
-             '''exchange (
+            '''exchange (
                     exchange_name TEXT PRIMARY KEY,
                     exchange_timezone TEXT,
                     exchange_timezone_short TEXT
                     )''',
-             '''price_daily (
-                    date TEXT,
+            f'''price_daily (
+                    date {date_type},
                     open REAL,
                     high REAL,
                     low REAL,
                     close REAL,
                     adjusted_close REAL,
                     volume INTEGER,
-                    security_ticker TEXT,
-                    CONSTRAINT price_day_key PRIMARY KEY (security_ticker, date),
-                    FOREIGN KEY(security_ticker) REFERENCES security (ticker)
-                    )''',
-             '''price_minutely (
-                    date TEXT,
+                    {reference % 'price_day_key'}
+                    ){clustered}''',
+            f'''price_minutely (
+                    date {date_type},
                     open REAL,
                     high REAL,
                     low REAL,
                     close REAL,
                     adjusted_close REAL,
                     volume INTEGER,
-                    security_ticker TEXT,
-                    CONSTRAINT price_min_key PRIMARY KEY (security_ticker, date),
-                    FOREIGN KEY(security_ticker) REFERENCES security (ticker)
-                    )''',
-             '''actions (
-                    date TEXT,
+                    {reference % 'price_min_key'}
+                    ){clustered}''',
+            f'''actions (
+                    date {date_type},
                     dividends REAL,
                     stock_splits REAL,
-                    security_ticker TEXT,
-                    CONSTRAINT actions_key PRIMARY KEY (security_ticker, date),
-                    FOREIGN KEY(security_ticker) REFERENCES security (ticker)
+                    {reference % 'actions_key'}
                     )'''
-             ]
+            ]
+
+
+def db_indexes(security_ids=False, without_rowid=False):
+    """
+    Builds the CREATE INDEX bodies of the optional covering indexes of the price tables: by date across tickers, and
+    by (ticker, date) with the common fields for rowid tables
+    """
+    ticker_column = 'security_id' if security_ids else 'security_ticker'
+    indexes = []
+    for table in ['price_daily', 'price_minutely']:
+        indexes.append(f"{table}_date_idx ON {table} (date, {ticker_column}, close, adjusted_close, volume)")
+        if not without_rowid:
+            indexes.append(f"{table}_close_idx ON {table} ({ticker_column}, date, close, adjusted_close, volume)")
+    return indexes
+
+
+DB_TABLES = db_tables()
+
+# yfinance dataframe columns, in the order of the matching DB_TABLES columns (security_ticker is appended last)
+DB_YFINANCE_COLUMNS = {'price_daily': ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'],
+                       'price_minutely': ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'],
+                       'actions': ['Dividends', 'Stock Splits']}
 
 # info for various "frozen" versions of the database intended to be read-only
 DB_FROZEN_VARIANTS = {
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import threading
+import urllib.request
+
+CONNECTION_POOL_SIZE = 4  # idle connections kept per database, enough for the usual small thread pools
+FROZEN_MMAP_SIZE = 2 ** 31 - 2 ** 16  # bytes, sqlite's default SQLITE_MAX_MMAP_SIZE (larger values are clamped)
+
+
+def file_identity(path):
+    """
+    (device, inode) of path, None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Connection remembering the file_identity of the database file it opened
+    """
+
+    file_identity = None
+
+
+class ConnectionPool:
+    """
+    Idle connections to one database, reused across DBCursor blocks instead of connecting per query. Pools are
+    registered by (db_path, read_only), where DBCursor looks them up. Connections to a file since deleted or replaced
+    at db_path are closed instead of reused.
+    """
+
+    pools = {}  # (db_path, read_only) -> ConnectionPool
+    pools_lock = threading.Lock()
+
+    def __init__(self, db_path, read_only=False, size=CONNECTION_POOL_SIZE):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def register(cls, db_path, read_only=False):
+        """
+        Returns the pool of a database, created on first use
+        """
+        with ConnectionPool.pools_lock:
+            if (db_path, read_only) not in ConnectionPool.pools:
+                ConnectionPool.pools[(db_path, read_only)] = cls(db_path, read_only)
+            return ConnectionPool.pools[(db_path, read_only)]
+
+    @staticmethod
+    def lookup(db_path, read_only):
+        return ConnectionPool.pools.get((db_path, read_only))
+
+    @staticmethod
+    def release(db_path):
+        """
+        Closes the idle connections of every pool of db_path
+        """
+        for (path, _), pool in list(ConnectionPool.pools.items()):
+            if path == db_path:
+                pool.close_idle()
+
+    def connect(self):
+        connection = sqlite3.connect(self.db_path, check_same_thread=False, factory=PooledConnection)
+        connection.execute("PRAGMA foreign_keys = 1")
+        if self.read_only:
+            connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    def acquire(self):
+        identity = file_identity(self.db_path)
+        stale = []
+        with self.lock:
+            while self.idle:
+                connection = self.idle.pop()
+                if connection.file_identity == identity:
+                    break
+                stale.append(connection)
+            else:
+                connection = None
+        for stale_connection in stale:
+            stale_connection.close()
+        if connection is None:
+            connection = self.connect()
+            connection.file_identity = file_identity(self.db_path)  # after connect, which creates a missing file
+        return connection
+
+    def give_back(self, connection):
+        identity = file_identity(self.db_path)
+        with self.lock:
+            if len(self.idle) < self.size and connection.file_identity == identity:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def close_idle(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+class FrozenEngine(ConnectionPool):
+    """
+    Connection pool of a validated frozen database, opened read-only with immutable=1 (no locking) and mmap_size set
+    """
+
+    def __init__(self, db_path, read_only=True, size=CONNECTION_POOL_SIZE, mmap_size=FROZEN_MMAP_SIZE):
+        super().__init__(db_path, read_only, size)
+        self.uri = 'file:%s?mode=ro&immutable=1' % urllib.request.pathname2url(os.path.abspath(db_path))
+        self.mmap_size = mmap_size
+
+    def connect(self):
+        connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False, factory=PooledConnection)
+        connection.execute("PRAGMA mmap_size = %d" % self.mmap_size)
+        connection.execute("PRAGMA query_only = ON")
+        return connection
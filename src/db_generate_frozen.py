@@ -1,21 +1,78 @@
 import os
-import random
-import time
+import sqlite3
 
-from db_default import DB_DIR
-from db_class import FinanceDB
+from src.db_class import DBCursor, FinanceDB
+from src.db_default import DB_DIR
+from src.db_engine import ConnectionPool
 
+BUILD_JOURNAL_TABLE = 'build_journal'  # side table listing the (ticker, table) units already written
 
-def generate_frozen_db(ticker_list, db_filename='default_finance_generated_frozen.db', sleep=True):
-    # file must not already exist
-    db_path = DB_DIR + os.sep + db_filename
-    assert not os.path.isfile(db_path)
+
+def read_build_journal(finance_db):
+    """
+    Returns the set of (ticker, table) units recorded as complete, None if the db has no build journal
+    """
+    with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (BUILD_JOURNAL_TABLE,))
+        if cursor.fetchone() is None:
+            return None
+        cursor.execute("SELECT security_ticker, unit FROM %s" % BUILD_JOURNAL_TABLE)
+        completed = set(cursor.fetchall())
+    return completed
+
+
+def generate_frozen_db(ticker_list, db_filename='default_finance_generated_frozen.db', workers=4, source=None,
+                       scheduler=None):
+    """
+    Builds a frozen db one (ticker, table) unit at a time, journaling the completed units in BUILD_JOURNAL_TABLE
+    with their rows; calling it again with the same arguments resumes an interrupted build. source and scheduler are
+    passed on to FinanceDB.
+
+    Returns
+        db_path, db_checksum (None if the build is not complete yet)
+    """
+    db_path = os.path.join(DB_DIR, db_filename)
+    resume = os.path.isfile(db_path)
     # generate and fill the db
-    finance_db = FinanceDB(db_filename)
+    finance_db = FinanceDB(db_filename, source=source, scheduler=scheduler)
+    completed = read_build_journal(finance_db)
+    if resume and completed is None and not finance_db.get_present_tickers():
+        resume = False  # interrupted before its journal was created, nothing was written yet
+    if resume:
+        # an existing file must be an interrupted build
+        assert completed is not None, '%s exists and is not an interrupted build' % db_path
+        print('Resuming build of', db_path, 'with %d units already complete' % len(completed))
+    else:
+        completed = set()
+
+    pending = {}
     for ticker in ticker_list:
-        finance_db.add_ticker(ticker)
-        if sleep:
-            time.sleep(random.randrange(1, 15))  # sleep for random number of seconds
+        tables = [table for table in FinanceDB.TICKER_TABLES if (ticker, table) not in completed]
+        if tables:
+            pending[ticker] = tables
+    finance_db.add_tickers(list(pending), workers=workers, tables=pending, journal_table=BUILD_JOURNAL_TABLE)
+    print('Request scheduler stats:', finance_db.scheduler.stats)
+
+    completed = read_build_journal(finance_db) or set()
+    missing = [(ticker, table) for ticker in ticker_list for table in FinanceDB.TICKER_TABLES
+               if (ticker, table) not in completed]
+    if missing:
+        print('Build incomplete, %d units missing:' % len(missing))
+        for ticker, table in missing:
+            print('\t%s: %s' % (ticker, table))
+        print('Call generate_frozen_db again with the same arguments to resume.')
+        return db_path, None
+
+    with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+        cursor.execute("DROP TABLE %s" % BUILD_JOURNAL_TABLE)
+    # a build resumed after a crash finds (and DBWriter restores) the WAL mode of the crashed one: the frozen file
+    # must hold every page itself, so checkpoint and leave WAL on the only open connection before VACUUM
+    ConnectionPool.release(db_path)
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    connection.execute("PRAGMA journal_mode = DELETE")
+    connection.execute("VACUUM")
+    connection.close()
     # get checksum
     db_checksum = finance_db.dbfile_md5(db_path)
     print('Generated db path:', db_path)
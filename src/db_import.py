@@ -0,0 +1,228 @@
+import os
+import sys
+import time
+
+from src.db_class import DBCursor, FinanceDB
+from src.db_writer import DBWriter
+
+LEGACY_LAYOUTS = ('local_ms', 'local_tz', 'local_jr', 'src')
+LEGACY_MS_SUFFIXES = ('_days', '_minutes', '_actions')
+PRICE_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'adjusted_close', 'volume']
+ACTIONS_COLUMNS = ['date', 'dividends', 'stock_splits']
+
+
+def legacy_date(column):
+    """
+    SQL expression of a legacy date column (exchange wall time) as DB_DATE_FORMAT text
+    """
+    return "substr(replace(%s, 'T', ' ') || ' 00:00:00', 1, 19)" % column
+
+
+def blob_int64(value):
+    """
+    Integer stored as the 8 little-endian bytes of a numpy int64 (local_jr wrote numpy records through sqlite3)
+    """
+    return int.from_bytes(value, 'little', signed=True) if isinstance(value, bytes) else value
+
+
+def quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def detect_layout(cursor):
+    """
+    Layout of the database ATTACHed as legacy:
+        local_ms : per ticker tables '<ticker>_days', '<ticker>_minutes' and '<ticker>_actions', plus tickers
+        local_tz : daily_info and minutely_info, one row per ticker and date with Year/Month/Day(/Hour/Minute)
+        local_jr : security_price and security_price_intraday
+        src      : the DB_TABLES schema of db_default.py
+
+    Returns
+        layout (str) : one of LEGACY_LAYOUTS, None if the database matches none
+    """
+    cursor.execute("SELECT name FROM legacy.sqlite_master WHERE type='table'")
+    tables = {row[0] for row in cursor.fetchall()}
+    if 'price_daily' in tables and 'security' in tables:
+        return 'src'
+    if 'security_price' in tables:
+        return 'local_jr'
+    if 'daily_info' in tables or 'minutely_info' in tables:
+        return 'local_tz'
+    if any(table.endswith(LEGACY_MS_SUFFIXES) for table in tables):
+        return 'local_ms'
+    return None
+
+
+def legacy_columns(cursor, table):
+    cursor.execute("PRAGMA legacy.table_info(%s)" % quote(table))
+    return [row[1] for row in cursor.fetchall()]
+
+
+def layout_selects(cursor, layout):
+    """
+    SELECTs of the legacy rows in the DB_TABLES column order (ticker last), NULL for the columns a layout does not
+    have; legacy closes without an adjusted close are yfinance history() closes, already adjusted, and used for both
+
+    Returns
+        selects (dict) : 'security', 'exchange', 'price_daily', 'price_minutely', 'actions' -> list of SELECTs
+    """
+    selects = {'security': [], 'exchange': [], 'price_daily': [], 'price_minutely': [], 'actions': []}
+    cursor.execute("SELECT name FROM legacy.sqlite_master WHERE type='table'")
+    tables = {row[0] for row in cursor.fetchall()}
+
+    if layout == 'local_ms':
+        if 'tickers' in tables:
+            selects['exchange'].append("SELECT DISTINCT exchange FROM legacy.tickers WHERE exchange IS NOT NULL")
+            selects['security'].append("SELECT symbol, longName, exchange, currency, quoteType, market "
+                                       "FROM legacy.tickers")
+        for table in sorted(tables):
+            if not table.endswith(LEGACY_MS_SUFFIXES):
+                continue
+            ticker, suffix = table.rsplit('_', 1)
+            ticker_sql = "'%s'" % ticker.replace("'", "''")
+            selects['security'].append("SELECT %s, NULL, NULL, NULL, NULL, NULL" % ticker_sql)
+            if suffix == 'actions':
+                selects['actions'].append("SELECT %s, dividend, split, %s FROM legacy.%s"
+                                          % (legacy_date('date'), ticker_sql, quote(table)))
+            else:
+                selects['price_daily' if suffix == 'days' else 'price_minutely'].append(
+                    "SELECT %s, open, high, low, close, close, volume, %s FROM legacy.%s"
+                    % (legacy_date('date'), ticker_sql, quote(table)))
+
+    elif layout == 'local_tz':
+        for table, target, date_column, time_format, time_columns in [
+                ('daily_info', 'price_daily', 'Date', '%04d-%02d-%02d 00:00:00', 'Year, Month, Day'),
+                ('minutely_info', 'price_minutely', 'Datetime', '%04d-%02d-%02d %02d:%02d:00',
+                 'Year, Month, Day, Hour, Minute')]:
+            if table not in tables:
+                continue
+            columns = legacy_columns(cursor, table)
+            date = legacy_date(date_column) if date_column in columns \
+                else "printf('%s', %s)" % (time_format, time_columns)
+            selects['security'].append("SELECT DISTINCT Ticker, NULL, NULL, NULL, NULL, NULL FROM legacy.%s"
+                                       % table)
+            selects[target].append("SELECT %s, Open, High, Low, Close, Close, Volume, Ticker FROM legacy.%s"
+                                   % (date, table))
+            if target == 'price_daily' and 'Dividends' in columns:
+                selects['actions'].append('SELECT %s, Dividends, "Stock Splits", Ticker FROM legacy.%s '
+                                          'WHERE Dividends != 0 OR "Stock Splits" != 0' % (date, table))
+
+    elif layout == 'local_jr':
+        # rows written from yf.download records landed shifted by one column: volume holds the adjusted close and
+        # adj_close the volume as numpy int64 bytes
+        shifted = "typeof(adj_close) = 'blob'"
+        selects['exchange'].append("SELECT acronym FROM legacy.exchange WHERE acronym IS NOT NULL UNION "
+                                   "SELECT exchange FROM legacy.security WHERE exchange IS NOT NULL")
+        selects['security'].append("SELECT ticker, NULLIF(company, 'NULL'), exchange, NULLIF(currency, 'NULL'), "
+                                   "NULL, NULL FROM legacy.security")
+        for table, target, date_column in [('security_price', 'price_daily', 'date'),
+                                           ('security_price_intraday', 'price_minutely', 'time')]:
+            if table in tables:
+                selects['security'].append("SELECT DISTINCT security_ticker, NULL, NULL, NULL, NULL, NULL "
+                                           "FROM legacy.%s" % table)
+                selects[target].append(
+                    "SELECT %s, open, high, low, close, CASE WHEN %s THEN volume ELSE adj_close END, "
+                    "CASE WHEN %s THEN blob_int64(adj_close) ELSE volume END, security_ticker FROM legacy.%s"
+                    % (legacy_date(date_column), shifted, shifted, table))
+
+    elif layout == 'src':
+        price_columns = legacy_columns(cursor, 'price_daily')
+        cursor.execute("SELECT type FROM pragma_table_info('price_daily', 'legacy') WHERE name='date'")
+        if cursor.fetchone()[0].upper() == 'INTEGER':
+            raise ValueError("Only schema v1 databases can be imported, the legacy file is schema v2")
+        if 'security_id' in price_columns:
+            source, ticker = "legacy.%s t JOIN legacy.security s ON s.security_id = t.security_id", 's.ticker'
+        else:
+            source, ticker = "legacy.%s t", 't.security_ticker'
+        selects['exchange'].append("SELECT exchange_name FROM legacy.exchange UNION "
+                                   "SELECT exchange FROM legacy.security WHERE exchange IS NOT NULL")
+        selects['security'].append("SELECT ticker, name_long, exchange, currency, type, market FROM legacy.security")
+        for table, columns in [('price_daily', PRICE_COLUMNS), ('price_minutely', PRICE_COLUMNS),
+                               ('actions', ACTIONS_COLUMNS)]:
+            if table in tables:
+                selects[table].append("SELECT %s, %s FROM %s" % (', '.join('t.' + column for column in columns),
+                                                                 ticker, source % table))
+    return selects
+
+
+def import_legacy(db_filename, legacy_path, layout=None, conflict='IGNORE'):
+    """
+    Copies a database of one of the LEGACY_LAYOUTS (detected if layout is None) into the schema v1 database
+    db_filename, one INSERT ... SELECT per table in a single transaction; conflict ('IGNORE' or 'REPLACE') applies to
+    rows already present
+
+    Returns
+        rowcounts (dict) : table name -> number of rows written
+    """
+    finance_db = FinanceDB(db_filename)
+    if finance_db.read_only:
+        raise ValueError("%s is a frozen database, import into a copy instead" % finance_db.db_path)
+    if finance_db.schema_version != 1:
+        raise ValueError("%s is schema v2, import into a schema v1 database and migrate it" % finance_db.db_path)
+    if finance_db.partitions is not None or finance_db.archive is not None:
+        raise ValueError("%s stores price_minutely in partitions or an archive" % finance_db.db_path)
+    if not os.path.isfile(legacy_path):
+        raise ValueError("No database %s" % legacy_path)
+    if conflict not in ('IGNORE', 'REPLACE'):
+        raise ValueError("Unknown conflict resolution %s, expected IGNORE or REPLACE" % conflict)
+
+    start = time.perf_counter()
+    connection = finance_db.connections.connect()
+    connection.isolation_level = None  # ATTACH is refused in a transaction, BEGIN/COMMIT are explicit
+    rowcounts = {}
+    try:
+        connection.execute("PRAGMA cache_size = %d" % DBWriter.BULK_LOAD_PRAGMAS['cache_size'])
+        connection.create_function('blob_int64', 1, blob_int64, deterministic=True)
+        connection.execute("ATTACH DATABASE ? AS legacy", (legacy_path,))
+        connection.execute("BEGIN")
+        cursor = connection.cursor()
+        layout = layout or detect_layout(cursor)
+        if layout not in LEGACY_LAYOUTS:
+            raise ValueError("%s matches none of the layouts %s" % (legacy_path, LEGACY_LAYOUTS))
+        selects = layout_selects(cursor, layout)
+        for select in selects['exchange']:
+            cursor.execute("INSERT OR IGNORE INTO main.exchange (exchange_name) %s" % select)
+        rowcounts['security'] = 0
+        for select in selects['security']:
+            cursor.execute("INSERT OR IGNORE INTO main.security "
+                           "(ticker, name_long, exchange, currency, type, market) %s" % select)
+            rowcounts['security'] += max(cursor.rowcount, 0)
+
+        for table, columns in [('price_daily', PRICE_COLUMNS), ('price_minutely', PRICE_COLUMNS),
+                               ('actions', ACTIONS_COLUMNS)]:
+            rowcounts[table] = 0
+            if not selects[table]:
+                continue
+            ticker_value = 's.security_id' if finance_db.security_ids else 'r.ticker'
+            changes = connection.total_changes  # rowcount is not set for statements starting with WITH
+            cursor.execute("WITH legacy_rows (%s, ticker) AS (%s) "
+                           "INSERT OR %s INTO main.%s (%s, %s) SELECT %s, %s FROM legacy_rows r%s "
+                           "WHERE r.date IS NOT NULL ORDER BY %s, r.date"
+                           % (', '.join(columns), ' UNION ALL '.join(selects[table]), conflict, table,
+                              ', '.join(columns), finance_db.ticker_column,
+                              ', '.join('r.' + column for column in columns), ticker_value,
+                              ' JOIN main.security s ON s.ticker = r.ticker' if finance_db.security_ids else '',
+                              ticker_value))
+            rowcounts[table] = connection.total_changes - changes
+            print(table, "imported, %d rows." % rowcounts[table])
+        connection.execute("COMMIT")
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+    if finance_db.parquet is not None:
+        with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+            finance_db.parquet.export_tickers(cursor, finance_db.tickers_by_key())
+    print('Imported %s (%s layout) into %s in %.1f s'
+          % (legacy_path, layout, finance_db.db_path, time.perf_counter() - start))
+    return rowcounts
+
+
+if __name__ == '__main__':
+    # python -m src.db_import <db_filename> <legacy database path> [layout]
+    db_filename = sys.argv[1]
+    assert os.path.isfile(sys.argv[2]), 'No database %s' % sys.argv[2]
+    import_legacy(db_filename, sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+from src.db_default import DB_DIR, DB_FROZEN_VARIANTS
+
+FILE_HASH_CHUNK_SIZE = 8 * 1024 ** 2  # bytes read at a time, large reads keep md5 (not the syscalls) the bottleneck
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+def file_md5(path, chunk_size=FILE_HASH_CHUNK_SIZE):
+    """
+    md5 hex digest of a file, read chunk_size bytes at a time into one reused buffer
+    """
+    hash_md5 = hashlib.md5()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            num_bytes = f.readinto(buffer)
+            if not num_bytes:
+                break
+            hash_md5.update(view[:num_bytes])
+    return hash_md5.hexdigest()
+
+
+def file_signature(path):
+    """
+    (size, mtime, inode) of a file: if any changes, the file may have changed and has to be hashed again
+    """
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+
+def manifest_path(path):
+    return path + MANIFEST_SUFFIX
+
+
+def read_manifest(path):
+    try:
+        with open(manifest_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path, md5):
+    """
+    Records that the file with its current signature hashes to md5. Best effort: frozen databases may sit in a
+    read-only directory, where every check then hashes the file.
+    """
+    manifest = dict(file_signature(path), md5=md5)
+    try:
+        with open(manifest_path(path) + '.tmp', 'w') as f:
+            json.dump(manifest, f)
+        os.replace(manifest_path(path) + '.tmp', manifest_path(path))
+    except OSError:
+        pass
+
+
+def verified_md5(path, expected_md5):
+    """
+    Whether a file hashes to expected_md5, hashing it only if it changed since the last successful check (manifest)
+    """
+    manifest = read_manifest(path)
+    if manifest is not None and manifest.get('md5') == expected_md5 \
+            and all(manifest.get(field) == value for field, value in file_signature(path).items()):
+        return True
+    md5 = file_md5(path)
+    if md5 == expected_md5:
+        write_manifest(path, md5)
+    return md5 == expected_md5
+
+
+def verify_file(path, expected_md5=None, chunk_size=FILE_HASH_CHUNK_SIZE):
+    """
+    Full re-verification of a file, ignoring its manifest; the manifest is refreshed if the file is valid
+
+    Returns
+        report (dict) : md5, valid (None without expected_md5), size (bytes), seconds, mb_per_s
+    """
+    start = time.perf_counter()
+    md5 = file_md5(path, chunk_size)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(path)
+    valid = None if expected_md5 is None else md5 == expected_md5
+    if valid:
+        write_manifest(path, md5)
+    return {'md5': md5, 'valid': valid, 'size': size, 'seconds': elapsed,
+            'mb_per_s': size / 1024 ** 2 / elapsed if elapsed > 0 else float('inf')}
+
+
+def verify_frozen_variants(db_dir=DB_DIR):
+    """
+    Re-verifies every DB_FROZEN_VARIANTS file present in db_dir and prints the throughput
+
+    Returns
+        reports (dict) : variant label -> verify_file report
+    """
+    reports = {}
+    for label, variant in DB_FROZEN_VARIANTS.items():
+        path = os.path.join(db_dir, variant['db_filename'])
+        if not os.path.isfile(path):
+            continue
+        reports[label] = verify_file(path, variant['md5sum'])
+        report = reports[label]
+        print('%s: %s, %.1f MB in %.2f s (%.0f MB/s)' % (label, 'valid' if report['valid'] else 'INVALID',
+                                                         report['size'] / 1024 ** 2, report['seconds'],
+                                                         report['mb_per_s']))
+    return reports
+
+
+if __name__ == '__main__':
+    # python -m src.db_integrity [db_dir]
+    verify_frozen_variants(sys.argv[1] if len(sys.argv) > 1 else DB_DIR)
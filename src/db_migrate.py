@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.db_archive import ARCHIVE_TABLE, MinutelyArchive
+from src.db_class import DBCursor, FinanceDB
+from src.db_convert import epoch_seconds
+from src.db_default import DB_DIR
+from src.db_parquet import ParquetStore
+from src.db_partitions import MinutelyPartitions
+from src.db_schema import DB_TIMESERIES_TABLES, create_tables, table_definition, write_setting
+from src.db_writer import DBWriter
+
+MIGRATION_CHUNK_SIZE = 100000  # rows held in memory at a time
+
+
+def text_dates_to_epochs(dates, tickers, timezones):
+    """
+    Schema v1 TEXT dates of a chunk of rows to schema v2 epoch seconds, in the exchange timezone of each ticker
+    (timezones: value of the ticker column -> timezone)
+    """
+    dates = np.asarray(dates, dtype=object)
+    tickers = np.asarray(tickers, dtype=object)
+    epochs = np.empty(len(dates), dtype=np.int64)
+    for ticker in pd.unique(tickers):
+        rows = tickers == ticker
+        epochs[rows] = epoch_seconds(pd.to_datetime(dates[rows], format='ISO8601'), timezones.get(ticker))
+    return epochs
+
+
+def migrate_to_v2(db_filename, chunk_size=MIGRATION_CHUNK_SIZE, vacuum=True):
+    """
+    Converts a schema v1 database (TEXT dates) in place to schema v2 (INTEGER seconds since the UTC epoch), in one
+    transaction
+
+    Returns
+        rowcounts (dict) : table name -> number of rows migrated
+    """
+    finance_db = FinanceDB(db_filename)
+    if finance_db.read_only:
+        raise ValueError("%s is a frozen database, migrate a copy instead" % finance_db.db_path)
+    if finance_db.partitions is not None:
+        raise ValueError("%s has partitioned minutely storage, migrate before partitioning" % finance_db.db_path)
+    if finance_db.archive is not None:
+        raise ValueError("%s has archived minutely bars, migrate before archiving" % finance_db.db_path)
+    if finance_db.schema_version == 2:
+        print(finance_db.db_path, "is already schema v2.")
+        return {}
+    timezones = finance_db.ticker_timezones()
+    tickers = finance_db.tickers_by_key()
+    timezones = {key: timezones[ticker] for key, ticker in tickers.items()}
+    schema = dict(finance_db.schema, schema_version=2)  # same layout options
+
+    rowcounts = {}
+    start = time.perf_counter()
+    with DBWriter(finance_db.db_path, finance_db.read_only) as writer:
+        reader = writer.connection.cursor()
+        for table in DB_TIMESERIES_TABLES:
+            migrated_table = table + '_v2'
+            writer.cursor.execute("CREATE TABLE %s %s" % (migrated_table, table_definition(table, **schema)))
+            reader.execute("SELECT * FROM %s ORDER BY %s, date" % (table, finance_db.ticker_column))
+            rowcounts[table] = 0
+            while True:
+                rows = reader.fetchmany(chunk_size)
+                if not rows:
+                    break
+                columns = list(zip(*rows))
+                columns[0] = text_dates_to_epochs(columns[0], columns[-1], timezones).tolist()
+                rowcounts[table] += writer.insert(migrated_table, zip(*columns), conflict='ABORT')
+            writer.cursor.execute("DROP TABLE %s" % table)
+            writer.cursor.execute("ALTER TABLE %s RENAME TO %s" % (migrated_table, table))
+            print(table, "migrated, %d rows." % rowcounts[table])
+        create_tables(writer.cursor, **schema)  # indexes of the replaced tables
+    if vacuum:
+        with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+            cursor.execute("VACUUM")
+
+    print('Migrated %s to schema v2 in %.1f s' % (finance_db.db_path, time.perf_counter() - start))
+    if finance_db.parquet is not None:
+        export_parquet(db_filename)  # the files hold the stored dates
+    return rowcounts
+
+
+def partition_minutely(db_filename, period='month', vacuum=True):
+    """
+    Moves the price_minutely rows of an existing database into one SQLite file per month or quarter (see
+    db_partitions.py); an interrupted conversion leaves the database as it was
+
+    Returns
+        rowcounts (dict) : partition -> number of rows moved
+    """
+    finance_db = FinanceDB(db_filename)
+    if finance_db.read_only:
+        raise ValueError("%s is a frozen database, partition a copy instead" % finance_db.db_path)
+    if finance_db.partitions is not None:
+        print(finance_db.db_path, "already has %sly minutely partitions." % finance_db.partitions.period)
+        return {}
+    if finance_db.archive is not None:
+        raise ValueError("%s has archived minutely bars, partitions would not hold them" % finance_db.db_path)
+    partitions = MinutelyPartitions(finance_db.db_path, period, finance_db.schema)
+    with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+        cursor.execute("SELECT MIN(date), MAX(date) FROM price_minutely")
+        first, last = cursor.fetchone()
+    keys = []
+    if first is not None:
+        keys.append(partitions.key(first))
+        while keys[-1] != partitions.key(last):
+            keys.append(partitions.key(partitions.bounds(keys[-1])[1]))
+
+    rowcounts = {}
+    start = time.perf_counter()
+    os.makedirs(partitions.directory, exist_ok=True)
+    connection = sqlite3.connect(finance_db.db_path, isolation_level=None)  # ATTACH is refused in a transaction
+    try:
+        for key in keys:
+            with DBCursor(partitions.path(key), False) as partition_cursor:
+                partitions.create_table(partition_cursor)
+            connection.execute("ATTACH DATABASE ? AS partition", (partitions.path(key),))
+            connection.execute("BEGIN")
+            cursor = connection.execute("INSERT OR REPLACE INTO partition.price_minutely "
+                                        "SELECT * FROM main.price_minutely WHERE date>=? AND date<? ORDER BY %s, date"
+                                        % finance_db.ticker_column, partitions.bounds(key))
+            rowcounts[key] = max(cursor.rowcount, 0)
+            connection.execute("COMMIT")
+            connection.execute("DETACH DATABASE partition")
+            print(key, "partition written, %d rows." % rowcounts[key])
+        connection.execute("BEGIN")
+        connection.execute("DELETE FROM price_minutely")
+        write_setting(connection.cursor(), 'minutely_partitions', period)
+        connection.execute("COMMIT")
+        if vacuum:
+            connection.execute("VACUUM")
+    finally:
+        connection.close()
+
+    print('Moved %d minutely rows of %s into %d partitions in %.1f s'
+          % (sum(rowcounts.values()), finance_db.db_path, len(keys), time.perf_counter() - start))
+    return rowcounts
+
+
+def export_parquet(db_filename):
+    """
+    Exports the price tables of an existing database to per-ticker Parquet files and switches its price reads to them
+
+    Returns
+        rowcounts (dict) : table name -> number of rows exported
+    """
+    finance_db = FinanceDB(db_filename)
+    if finance_db.read_only:
+        raise ValueError("%s is a frozen database, export a copy instead" % finance_db.db_path)
+    if finance_db.archive is not None:
+        raise ValueError("%s has archived minutely bars, the parquet files would not hold them" % finance_db.db_path)
+    store = ParquetStore(finance_db.db_path)
+    start = time.perf_counter()
+    with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+        rowcounts = store.export_tickers(cursor, finance_db.tickers_by_key(), finance_db.partitions)
+        write_setting(cursor, 'price_backend', 'parquet')
+
+    print('Exported %s to %s in %.1f s, rows: %s'
+          % (finance_db.db_path, store.directory, time.perf_counter() - start, rowcounts))
+    return rowcounts
+
+
+def archive_minutely(db_filename, before=None, vacuum=True):
+    """
+    Moves the price_minutely rows of every ticker into the compressed archive table (see db_archive.py), except each
+    ticker's latest day and the days ending at or after before (a stored date)
+
+    Returns
+        rowcounts (dict) : ticker -> number of rows archived
+    """
+    finance_db = FinanceDB(db_filename)
+    if finance_db.read_only:
+        raise ValueError("%s is a frozen database, archive a copy instead" % finance_db.db_path)
+    if finance_db.partitions is not None or finance_db.parquet is not None:
+        raise ValueError("%s stores price_minutely in partitions or parquet files" % finance_db.db_path)
+    archive = MinutelyArchive(finance_db.schema)
+    query = "SELECT * FROM price_minutely WHERE %s=? ORDER BY date" % finance_db.ticker_column
+    delete = "DELETE FROM price_minutely WHERE %s=? AND date>=? AND date<=?" % finance_db.ticker_column
+
+    rowcounts = {}
+    start = time.perf_counter()
+    size_before = os.path.getsize(finance_db.db_path)
+    with DBWriter(finance_db.db_path, finance_db.read_only) as writer:
+        archive.create_table(writer.cursor)
+        for key, ticker in finance_db.tickers_by_key().items():
+            writer.cursor.execute(query, (key,))
+            chunks = archive.encode(key, writer.cursor.fetchall(), before)
+            writer.cursor.executemany("INSERT OR REPLACE INTO %s VALUES (?,?,?,?,?)" % ARCHIVE_TABLE, chunks)
+            writer.cursor.executemany(delete, [chunk[:3] for chunk in chunks])
+            rowcounts[ticker] = sum(chunk[3] for chunk in chunks)
+            writer.commit()
+    if vacuum:
+        with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+            cursor.execute("VACUUM")
+
+    print('Archived %d minutely rows of %s in %.1f s, file %.1f MB -> %.1f MB'
+          % (sum(rowcounts.values()), finance_db.db_path, time.perf_counter() - start, size_before / 1024 ** 2,
+             os.path.getsize(finance_db.db_path) / 1024 ** 2))
+    return rowcounts
+
+
+if __name__ == '__main__':
+    # python -m src.db_migrate <db_filename>  (file name in DB_DIR, or an absolute path)
+    # python -m src.db_migrate <db_filename> partition [month|quarter]
+    # python -m src.db_migrate <db_filename> parquet
+    # python -m src.db_migrate <db_filename> archive [before, a stored date]
+    db_filename = sys.argv[1] if len(sys.argv) > 1 else 'default_finance.db'
+    assert os.path.isfile(os.path.join(DB_DIR, db_filename)), 'No database %s' % db_filename
+    if len(sys.argv) > 2 and sys.argv[2] == 'partition':
+        partition_minutely(db_filename, sys.argv[3] if len(sys.argv) > 3 else 'month')
+    elif len(sys.argv) > 2 and sys.argv[2] == 'parquet':
+        export_parquet(db_filename)
+    elif len(sys.argv) > 2 and sys.argv[2] == 'archive':
+        archive_minutely(db_filename, sys.argv[3] if len(sys.argv) > 3 else None)
+    else:
+        migrate_to_v2(db_filename)
@@ -0,0 +1,195 @@
+import itertools
+import os
+import urllib.parse
+
+from src.db_schema import read_setting
+
+PRICE_BACKENDS = ('sqlite', 'parquet')
+PARQUET_TABLES = ('price_daily', 'price_minutely')
+PARQUET_ROW_GROUP_SIZE = 16384  # rows; date filters skip whole row groups using their min/max statistics
+PARQUET_PART_ROWS = 16 * PARQUET_ROW_GROUP_SIZE  # rows per file, an append rewrites at most one older file
+PARQUET_MAX_SMALL_PARTS = 16  # trailing files under PARQUET_PART_ROWS rows before an append merges them
+PARQUET_COMPRESSION = 'zstd'
+ARROW_TYPES = {'TEXT': 'string', 'REAL': 'float64', 'INTEGER': 'int64'}  # sqlite declared type -> arrow type
+
+
+def import_pyarrow():
+    """
+    pyarrow is only needed by the parquet price backend, so it is imported on first use
+    """
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("The parquet price backend needs pyarrow: pip install pyarrow") from e
+    return pyarrow, pyarrow.dataset, pyarrow.parquet
+
+
+class ParquetStore:
+    """
+    Copy of price_daily and price_minutely as Parquet files per table and ticker, <db name>_parquet/<table>/<ticker>/,
+    for analysis reads. SQLite stays the system of record; DBWriter appends the rows it wrote to these files and
+    re-exports the tickers it readjusted.
+    """
+
+    def __init__(self, db_path):
+        self.directory = os.path.splitext(db_path)[0] + '_parquet'
+
+    @staticmethod
+    def detect(cursor, db_path):
+        """
+        Returns the ParquetStore of a database, None if its prices are only read from SQLite
+        """
+        return ParquetStore(db_path) if read_setting(cursor, 'price_backend') == 'parquet' else None
+
+    def ticker_dir(self, table, ticker):
+        # tickers such as ^GSPC or EURUSD=X are escaped into portable directory names
+        return os.path.join(self.directory, table, urllib.parse.quote(ticker, safe=''))
+
+    def parts(self, table, ticker):
+        """
+        Files of ticker in table, in date order
+        """
+        ticker_dir = self.ticker_dir(table, ticker)
+        if not os.path.isdir(ticker_dir):
+            return []
+        return [os.path.join(ticker_dir, filename) for filename in sorted(os.listdir(ticker_dir))
+                if filename.endswith('.parquet')]
+
+    def next_part(self, table, ticker, parts):
+        number = int(os.path.basename(parts[-1])[:-len('.parquet')]) + 1 if parts else 0
+        return os.path.join(self.ticker_dir(table, ticker), '%08d.parquet' % number)
+
+    def tickers(self, table):
+        """
+        Tickers with a file for table
+        """
+        table_dir = os.path.join(self.directory, table)
+        if not os.path.isdir(table_dir):
+            return []
+        return sorted(ticker for ticker in map(urllib.parse.unquote, os.listdir(table_dir))
+                      if self.parts(table, ticker))
+
+    @staticmethod
+    def arrow_schema(cursor, table):
+        """
+        Arrow schema matching the columns and declared types of table in the SQLite database
+        """
+        pyarrow = import_pyarrow()[0]
+        cursor.execute("PRAGMA table_info(%s)" % table)
+        return pyarrow.schema([(row[1], ARROW_TYPES[row[2].upper()]) for row in cursor.fetchall()])
+
+    @staticmethod
+    def arrow_table(schema, rows):
+        pyarrow = import_pyarrow()[0]
+        if not rows:
+            return schema.empty_table()
+        columns = [pyarrow.array(column, type=field.type) for column, field in zip(zip(*rows), schema)]
+        return pyarrow.Table.from_arrays(columns, schema=schema)
+
+    def write_parts(self, table, ticker, arrow_table, parts):
+        """
+        Writes arrow_table (sorted by date) after parts, as files of at most PARQUET_PART_ROWS rows
+        """
+        parquet = import_pyarrow()[2]
+        parts = list(parts)
+        os.makedirs(self.ticker_dir(table, ticker), exist_ok=True)
+        for offset in range(0, arrow_table.num_rows, PARQUET_PART_ROWS):
+            path = self.next_part(table, ticker, parts)
+            parquet.write_table(arrow_table.slice(offset, PARQUET_PART_ROWS), path + '.tmp',
+                                row_group_size=PARQUET_ROW_GROUP_SIZE, compression=PARQUET_COMPRESSION)
+            os.replace(path + '.tmp', path)
+            parts.append(path)
+
+    @staticmethod
+    def date_range(path):
+        """
+        First and last date of a file, from the row group statistics (files are sorted by date)
+        """
+        metadata = import_pyarrow()[2].read_metadata(path)
+        column = metadata.schema.names.index('date')
+        return (metadata.row_group(0).column(column).statistics.min,
+                metadata.row_group(metadata.num_row_groups - 1).column(column).statistics.max)
+
+    def write(self, table, ticker, schema, rows):
+        """
+        Replaces the files of ticker in table with rows (sorted by date), returns the rowcount
+        """
+        stale = self.parts(table, ticker)
+        self.write_parts(table, ticker, self.arrow_table(schema, rows), stale)
+        for path in stale:
+            os.remove(path)
+        return len(rows)
+
+    def append(self, table, ticker, schema, rows, since):
+        """
+        Replaces the rows of ticker in table dated since or later with rows (sorted by date), written after the other
+        files: only the file holding both older and replaced rows is rewritten, without the replaced ones. Once
+        PARQUET_MAX_SMALL_PARTS trailing files are under PARQUET_PART_ROWS rows they are merged. Returns the rowcount.
+        """
+        pyarrow, dataset, parquet = import_pyarrow()
+        parts = self.parts(table, ticker)
+        kept = parts[:]
+        stale, older = [], []
+        while kept and self.date_range(kept[-1])[1] >= since:
+            stale.append(kept.pop())
+        if stale and self.date_range(stale[-1])[0] < since:
+            older.append(parquet.read_table(stale[-1]).filter(dataset.field('date') < since))
+        small = list(itertools.takewhile(lambda path: parquet.read_metadata(path).num_rows < PARQUET_PART_ROWS,
+                                         reversed(kept)))
+        if len(small) >= PARQUET_MAX_SMALL_PARTS:
+            older = [parquet.read_table(path) for path in reversed(small)] + older
+            stale += small
+        if older:
+            self.write_parts(table, ticker, pyarrow.concat_tables(older), parts)
+        # the next append usually replaces the latest of these rows, so they get files of their own
+        self.write_parts(table, ticker, self.arrow_table(schema, rows), self.parts(table, ticker))
+        for path in stale:
+            os.remove(path)
+        return len(rows)
+
+    def export_tickers(self, cursor, tickers, partitions=None, since=None):
+        """
+        Re-exports the price rows of tickers (dict: value of the ticker column -> ticker) from the database of cursor.
+        since (dict: value of the ticker column -> {table: date}) limits the export to the rows dated since or later,
+        appended (see append); tables without a date are skipped.
+        """
+        rowcounts = {}
+        for table in PARQUET_TABLES:
+            schema = self.arrow_schema(cursor, table)
+            rowcounts[table] = 0
+            for key, ticker in tickers.items():
+                start = None if since is None else since.get(key, {}).get(table)
+                if since is not None and start is None:
+                    continue
+                condition = '' if start is None else ' AND date>=?'
+                query = "SELECT * FROM %s WHERE %s=?%s ORDER BY date" % (table, schema.names[-1], condition)
+                params = (key,) if start is None else (key, start)
+                if table == 'price_minutely' and partitions is not None:
+                    rows = partitions.fetch(cursor, query, params, start)[1]
+                else:
+                    cursor.execute(query, params)
+                    rows = cursor.fetchall()
+                if start is None:
+                    rowcounts[table] += self.write(table, ticker, schema, rows)
+                else:
+                    rowcounts[table] += self.append(table, ticker, schema, rows, start)
+        return rowcounts
+
+    def read(self, table, tickers=None, columns=None, start=None, end=None):
+        """
+        Rows of table for tickers (all if None) with dates in [start, end) (as stored, None for unbounded), projected on
+        columns (all if None); None if no ticker has a file
+        """
+        dataset = import_pyarrow()[1]
+        tickers = self.tickers(table) if tickers is None else tickers
+        paths = [path for ticker in tickers for path in self.parts(table, ticker)]
+        if not paths:
+            return None
+        condition = None
+        for bound, include in [(start, lambda date: dataset.field('date') >= date),
+                               (end, lambda date: dataset.field('date') < date)]:
+            if bound is not None:
+                condition = include(bound) if condition is None else condition & include(bound)
+        return dataset.dataset(paths, format='parquet').to_table(columns=columns, filter=condition).to_pandas()
@@ -0,0 +1,161 @@
+import calendar
+import datetime
+import os
+import re
+
+from src.db_convert import DB_DATE_FORMAT
+from src.db_default import db_indexes
+from src.db_schema import read_setting, table_definition
+
+PARTITION_PERIODS = ('month', 'quarter')
+MAX_ATTACHED_PARTITIONS = 9  # sqlite attaches at most 10 databases per connection (SQLITE_MAX_ATTACHED), keep one spare
+
+
+def execute_temp_ddl(cursor, statement):
+    """
+    Executes a statement changing only the TEMP schema, also on read-only (query_only) connections, which otherwise
+    refuse it; no database file is written
+    """
+    query_only = cursor.execute("PRAGMA query_only").fetchone()[0]
+    if query_only:
+        cursor.execute("PRAGMA query_only = OFF")
+    try:
+        cursor.execute(statement)
+    finally:
+        if query_only:
+            cursor.execute("PRAGMA query_only = ON")
+
+
+class MinutelyPartitions:
+    """
+    Time partitioned storage of price_minutely: one SQLite file per month (or quarter) in <db name>_minutely/,
+    ATTACHed by readers behind a TEMP view named price_minutely. The table in the main database stays empty.
+    """
+
+    FILENAME_PATTERN = re.compile(r'^price_minutely_(\d{4}_(?:\d{2}|q[1-4]))\.db$')
+
+    def __init__(self, db_path, period, schema):
+        if period not in PARTITION_PERIODS:
+            raise ValueError("Unknown partition period %s, expected one of %s" % (period, PARTITION_PERIODS))
+        self.directory = os.path.splitext(db_path)[0] + '_minutely'
+        self.period = period
+        self.schema = schema
+
+    @staticmethod
+    def detect(cursor, db_path, schema):
+        """
+        Returns the MinutelyPartitions of a database, None if it keeps price_minutely in one table
+        """
+        period = read_setting(cursor, 'minutely_partitions')
+        return None if period is None else MinutelyPartitions(db_path, period, schema)
+
+    def key(self, date):
+        """
+        Partition of a date as stored (DB_DATE_FORMAT string or epoch seconds)
+        """
+        if isinstance(date, str):
+            year, month = int(date[:4]), int(date[5:7])
+        else:
+            utc = datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc)
+            year, month = utc.year, utc.month
+        if self.period == 'month':
+            return '%04d_%02d' % (year, month)
+        return '%04d_q%d' % (year, (month - 1) // 3 + 1)
+
+    def bounds(self, key):
+        """
+        First date of the partition and first date after it, as stored in this schema version
+        """
+        year, part = key.split('_')
+        year = int(year)
+        if part.startswith('q'):
+            month, months = 3 * (int(part[1:]) - 1) + 1, 3
+        else:
+            month, months = int(part), 1
+        start = datetime.datetime(year, month, 1)
+        end = datetime.datetime(year + (month + months - 1) // 12, (month + months - 1) % 12 + 1, 1)
+        if self.schema['schema_version'] == 2:
+            return calendar.timegm(start.timetuple()), calendar.timegm(end.timetuple())
+        return start.strftime(DB_DATE_FORMAT), end.strftime(DB_DATE_FORMAT)
+
+    def path(self, key):
+        return os.path.join(self.directory, 'price_minutely_%s.db' % key)
+
+    def keys(self):
+        """
+        Existing partitions in chronological order
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        matches = [self.FILENAME_PATTERN.match(filename) for filename in os.listdir(self.directory)]
+        return sorted(match.group(1) for match in matches if match is not None)
+
+    def overlapping(self, start=None, end=None):
+        """
+        Existing partitions holding dates in [start, end) (dates as stored, None for unbounded)
+        """
+        keys = []
+        for key in self.keys():
+            key_start, key_end = self.bounds(key)
+            if (start is None or start < key_end) and (end is None or end > key_start):
+                keys.append(key)
+        return keys
+
+    def create_table(self, cursor):
+        """
+        Creates price_minutely (and its covering indexes) in a partition file opened by cursor. Partitions have no
+        foreign keys, sqlite cannot reference the security table of another file.
+        """
+        definition = table_definition('price_minutely', **self.schema)
+        lines = [line for line in definition.split('\n') if 'FOREIGN KEY' not in line]
+        for i in range(len(lines) - 1, 0, -1):
+            if lines[i].strip().startswith(')'):
+                lines[i - 1] = lines[i - 1].rstrip().rstrip(',')
+                break
+        cursor.execute("CREATE TABLE IF NOT EXISTS price_minutely %s" % '\n'.join(lines))
+        if self.schema['covering_indexes']:
+            for index in db_indexes(self.schema['security_ids'], self.schema['without_rowid']):
+                if ' ON price_minutely ' in index:
+                    cursor.execute("CREATE INDEX IF NOT EXISTS %s" % index)
+
+    def attach(self, cursor, keys):
+        """
+        ATTACHes the partitions keys (at most MAX_ATTACHED_PARTITIONS) to the connection of cursor and (re)creates
+        the TEMP view price_minutely as their UNION ALL
+        """
+        if len(keys) > MAX_ATTACHED_PARTITIONS:
+            raise ValueError("Can attach at most %d partitions at once, got %d"
+                             % (MAX_ATTACHED_PARTITIONS, len(keys)))
+        selects = []
+        for key in keys:
+            cursor.execute("ATTACH DATABASE ? AS minutely_%s" % key, (self.path(key),))
+            selects.append("SELECT * FROM minutely_%s.price_minutely" % key)
+        execute_temp_ddl(cursor, "DROP VIEW IF EXISTS temp.price_minutely")
+        execute_temp_ddl(cursor, "CREATE TEMP VIEW price_minutely AS %s"
+                         % ' UNION ALL '.join(selects or ["SELECT * FROM main.price_minutely"]))
+
+    def detach(self, cursor, keys):
+        execute_temp_ddl(cursor, "DROP VIEW IF EXISTS temp.price_minutely")
+        for key in keys:
+            cursor.execute("DETACH DATABASE minutely_%s" % key)
+
+    def fetch(self, cursor, query, params=(), start=None, end=None):
+        """
+        Runs a query on price_minutely over the partitions holding dates in [start, end) (as stored, None for
+        unbounded), a group of attached partitions at a time
+
+        Returns
+            columns (list), rows (list of tuples)
+        """
+        keys = self.overlapping(start, end)
+        rows = []
+        for i in range(0, max(len(keys), 1), MAX_ATTACHED_PARTITIONS):
+            group = keys[i:i + MAX_ATTACHED_PARTITIONS]
+            self.attach(cursor, group)
+            try:  # detached also on errors, the connection may be long-lived (see db_engine.py)
+                cursor.execute(query, params)
+                rows.extend(cursor.fetchall())
+                columns = [column[0] for column in cursor.description]
+            finally:
+                self.detach(cursor, group)
+        return columns, rows
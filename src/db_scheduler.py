@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+
+import pandas as pd
+
+
+class ThrottledError(Exception):
+    """
+    Raised by RequestScheduler.call when a request is still throttled after all retries
+    """
+
+
+class RequestScheduler:
+    """
+    Paces requests to a rate limited source (yahoo finance) with a token bucket and a concurrency limit, retrying
+    throttled and empty responses with jittered exponential backoff. The rate adapts (AIMD) to throttling.
+    """
+
+    THROTTLE_MARKERS = ('429', 'too many requests', 'rate limit', 'ratelimit')
+
+    def __init__(self, rate=2.0, min_rate=0.2, max_rate=20.0, rate_increase=0.1, burst=4, max_concurrency=4,
+                 max_retries=5, empty_retries=2, backoff_base=1.0, backoff_max=60.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+        self.burst = burst
+        self.max_retries = max_retries
+        self.empty_retries = empty_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+        self.stats = {'requests': 0, 'throttled': 0, 'empty': 0, 'failed': 0}
+
+    def acquire(self):
+        """
+        Blocks until a token is available and the scheduler is not paused
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.stats['requests'] += 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.rate_increase)
+
+    def on_throttled(self, delay):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.stats['throttled'] += 1
+
+    def is_throttled(self, error):
+        description = ("%s %s" % (type(error).__name__, error)).lower()
+        return any(marker in description for marker in self.THROTTLE_MARKERS)
+
+    @staticmethod
+    def is_empty(response):
+        if response is None:
+            return True
+        if isinstance(response, (pd.DataFrame, pd.Series)):
+            return response.empty
+        if isinstance(response, dict):
+            return len(response) == 0
+        return False
+
+    def call(self, fn, *args, empty_retries=None, **kwargs):
+        """
+        Runs fn(*args, **kwargs) under the rate and concurrency limits, retrying throttled and empty responses (up to
+        empty_retries, self.empty_retries if None)
+        """
+        empty_retries = self.empty_retries if empty_retries is None else empty_retries
+        empty_attempts = 0
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            with self.slots:
+                try:
+                    response = fn(*args, **kwargs)
+                except Exception as e:
+                    if not self.is_throttled(e):
+                        self.stats['failed'] += 1
+                        raise
+                    if attempt == self.max_retries:
+                        raise ThrottledError("Still throttled after %d retries: %s" % (attempt, e)) from e
+                    self.on_throttled(self.backoff_delay(attempt))
+                    continue
+
+            if self.is_empty(response) and empty_attempts < empty_retries:
+                empty_attempts += 1
+                self.stats['empty'] += 1
+                time.sleep(self.backoff_delay(empty_attempts))
+                continue
+            self.on_success()
+            return response
+        return response
+
+
+# scheduler shared by every yfinance request made through FinanceDB
+YF_SCHEDULER = RequestScheduler()
@@ -0,0 +1,88 @@
+from src.db_default import db_indexes, db_tables
+
+DB_SCHEMA_DATE_TYPES = {1: 'TEXT',      # date as TEXT exchange wall time, DB_DATE_FORMAT
+                        2: 'INTEGER'}   # date as INTEGER seconds since the UTC epoch
+DB_DEFAULT_SCHEMA_VERSION = 1
+DB_TIMESERIES_TABLES = ('price_daily', 'price_minutely', 'actions')  # tables with a date column
+
+# layout options of a schema (see db_default.db_tables and db_default.db_indexes), all off by default
+DB_SCHEMA_OPTIONS = ('security_ids', 'without_rowid', 'covering_indexes')
+
+SETTINGS_TABLE = 'db_settings'  # key/value settings of a database, e.g. minutely_partitions -> period
+
+
+def default_schema(schema_version=None, **options):
+    """
+    Schema description of a new database; options left as None are off
+
+    Returns
+        schema (dict) : schema_version -> int, each of DB_SCHEMA_OPTIONS -> bool
+    """
+    schema = {'schema_version': schema_version or DB_DEFAULT_SCHEMA_VERSION}
+    for option in DB_SCHEMA_OPTIONS:
+        schema[option] = bool(options.get(option))
+    return schema
+
+
+def schema_tables(schema_version=DB_DEFAULT_SCHEMA_VERSION, security_ids=False, without_rowid=False,
+                  covering_indexes=False):
+    """
+    CREATE TABLE bodies of a schema version with the given layout options
+    """
+    if schema_version not in DB_SCHEMA_DATE_TYPES:
+        raise ValueError("Unknown schema version %s, expected one of %s"
+                         % (schema_version, list(DB_SCHEMA_DATE_TYPES)))
+    return db_tables(DB_SCHEMA_DATE_TYPES[schema_version], security_ids, without_rowid)
+
+
+def detect_schema(cursor):
+    """
+    Schema of an existing database, from the columns and definition of price_daily and its indexes
+
+    Returns
+        schema (dict) : as default_schema, None if the database has no price_daily table yet
+    """
+    cursor.execute("PRAGMA table_info(price_daily)")
+    column_types = {row[1]: row[2].upper() for row in cursor.fetchall()}
+    if not column_types:
+        return None
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='price_daily'")
+    definition = cursor.fetchone()[0].upper()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name='price_daily_date_idx'")
+    return {'schema_version': 2 if column_types.get('date') == 'INTEGER' else 1,
+            'security_ids': 'security_id' in column_types,
+            'without_rowid': definition.rstrip().endswith('WITHOUT ROWID'),
+            'covering_indexes': cursor.fetchone() is not None}
+
+
+def create_tables(cursor, schema_version=DB_DEFAULT_SCHEMA_VERSION, security_ids=False, without_rowid=False,
+                  covering_indexes=False):
+    for tables in schema_tables(schema_version, security_ids, without_rowid):
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {tables}")
+    if covering_indexes:
+        for index in db_indexes(security_ids, without_rowid):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index}")
+
+
+def table_definition(table, schema_version, security_ids=False, without_rowid=False, covering_indexes=False):
+    """
+    Column definitions (the CREATE TABLE body) of table in the given schema
+    """
+    for definition in schema_tables(schema_version, security_ids, without_rowid):
+        if definition.split('(')[0].strip() == table:
+            return definition[definition.index('('):]
+    raise ValueError("Unknown table %s" % table)
+
+
+def read_setting(cursor, key):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (SETTINGS_TABLE,))
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute("SELECT value FROM %s WHERE key=?" % SETTINGS_TABLE, (key,))
+    row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def write_setting(cursor, key, value):
+    cursor.execute("CREATE TABLE IF NOT EXISTS %s (key TEXT PRIMARY KEY, value TEXT)" % SETTINGS_TABLE)
+    cursor.execute("INSERT OR REPLACE INTO %s VALUES (?,?)" % SETTINGS_TABLE, (key, value))
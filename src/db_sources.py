@@ -0,0 +1,188 @@
+import datetime
+import os
+import pickle
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from src.db_default import DB_YFINANCE_COLUMNS
+
+
+class YFinanceSource:
+    """
+    Live yahoo finance data. A data source provides the four requests FinanceDB makes:
+        info(symbol)                  -> dict like yf.Ticker(symbol).info
+        history(symbol, **kwargs)     -> dataframe like yf.Ticker(symbol).history(**kwargs)
+        actions(symbol)               -> dataframe like yf.Ticker(symbol).actions
+        download(symbols, **kwargs)   -> (ticker, field) multi-index dataframe like yf.download(symbols, **kwargs)
+    """
+
+    def info(self, symbol):
+        return yf.Ticker(symbol).info
+
+    def history(self, symbol, **history_kwargs):
+        return yf.Ticker(symbol).history(**history_kwargs)
+
+    def actions(self, symbol):
+        return yf.Ticker(symbol).actions
+
+    def download(self, symbols, **download_kwargs):
+        return yf.download(symbols, **download_kwargs)
+
+
+def synthetic_ohlcv(index, rng, start_price=100.0, volatility=0.02, decimals=None):
+    """
+    Geometric random walk OHLCV bars on index, in the column layout of yfinance history (auto_adjust=False).
+    If decimals is given, OHLC prices are rounded to it like exchange quotes (e.g. 2 for a one cent tick).
+    """
+    num_bars = len(index)
+    log_returns = rng.normal(0.0, volatility, num_bars)
+    close = start_price * np.exp(np.cumsum(log_returns))
+    open_ = np.concatenate([[start_price], close[:-1]])
+    spread = np.abs(rng.normal(0.0, volatility / 2, num_bars)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.maximum(np.minimum(open_, close) - spread, 0.01 * close)
+    volume = rng.integers(1000, 1000000, num_bars)
+    if decimals is not None:
+        open_, high, low, close = (np.round(prices, decimals) for prices in (open_, high, low, close))
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Adj Close': close,
+                         'Volume': volume}, index=index)
+
+
+class ReplaySource:
+    """
+    Offline data source: payloads recorded to replay_dir by record(), or synthetic ones, with optional latency and
+    injected errors, throttling and empty responses
+    """
+
+    PAYLOAD_KEYS = ('info', 'daily', 'minutely', 'actions')
+
+    def __init__(self, replay_dir=None, synthetic=True, synthetic_years=10, latency=0.0, latency_jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, empty_rate=0.0, seed=None):
+        self.replay_dir = replay_dir
+        self.synthetic = synthetic
+        self.synthetic_years = synthetic_years
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.empty_rate = empty_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.payloads = {}
+
+    @staticmethod
+    def record(symbols, replay_dir, source=None):
+        """
+        Downloads the payloads of symbols from source (live yfinance by default) and saves them for replay
+        """
+        source = YFinanceSource() if source is None else source
+        if not os.path.isdir(replay_dir):
+            os.makedirs(replay_dir)
+        today = datetime.datetime.today()
+        for symbol in symbols:
+            minutely = [source.history(symbol, start=(today - datetime.timedelta(days)).strftime('%Y-%m-%d'),
+                                       end=(today - datetime.timedelta(days - 7)).strftime('%Y-%m-%d'),
+                                       interval='1m', auto_adjust=False, actions=False)
+                        for days in [28, 21, 14, 7]]
+            payload = {'info': source.info(symbol),
+                       'daily': source.history(symbol, period='max', interval='1d', auto_adjust=False,
+                                               actions=False),
+                       'minutely': pd.concat(minutely).sort_index(),
+                       'actions': source.actions(symbol)}
+            with open(os.path.join(replay_dir, symbol + '.pkl'), 'wb') as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            print(symbol, "recorded for replay.")
+
+    def synthetic_payload(self, symbol):
+        rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+        today = pd.Timestamp.today().normalize()
+        daily_index = pd.bdate_range(end=today - pd.Timedelta(days=1), periods=252 * self.synthetic_years,
+                                     tz='America/New_York', name='Date')
+        daily = synthetic_ohlcv(daily_index, rng)
+
+        sessions = pd.bdate_range(end=today - pd.Timedelta(days=1), periods=20)
+        minutes = [pd.date_range(session + pd.Timedelta(hours=9, minutes=30), periods=390, freq='min')
+                   for session in sessions]
+        minutely_index = pd.DatetimeIndex(np.concatenate(minutes), name='Datetime').tz_localize('America/New_York')
+        minutely = synthetic_ohlcv(minutely_index, rng, start_price=daily['Close'].iloc[-1], volatility=0.001)
+
+        action_dates = daily_index[rng.choice(len(daily_index), size=4, replace=False)].sort_values()
+        actions = pd.DataFrame({'Dividends': [0.25, 0.0, 0.3, 0.35], 'Stock Splits': [0.0, 2.0, 0.0, 0.0]},
+                               index=action_dates)
+
+        info = {'symbol': symbol, 'shortName': symbol, 'longName': '%s Synthetic Inc.' % symbol,
+                'exchange': 'SYN', 'exchangeTimezoneName': 'America/New_York', 'exchangeTimezoneShortName': 'EST',
+                'currency': 'USD', 'quoteType': 'EQUITY', 'market': 'synthetic_market'}
+        return {'info': info, 'daily': daily, 'minutely': minutely, 'actions': actions}
+
+    def payload(self, symbol):
+        with self.lock:
+            if symbol in self.payloads:
+                return self.payloads[symbol]
+        payload = None
+        path = None if self.replay_dir is None else os.path.join(self.replay_dir, symbol + '.pkl')
+        if path is not None and os.path.isfile(path):
+            with open(path, 'rb') as f:
+                payload = pickle.load(f)
+        elif self.synthetic:
+            payload = self.synthetic_payload(symbol)
+        if payload is None:
+            raise KeyError("No replay payload for %s" % symbol)
+        with self.lock:
+            self.payloads[symbol] = payload
+        return payload
+
+    def simulate_network(self):
+        """
+        Sleeps for the configured latency and rolls the injected failures; returns True for an empty response
+        """
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.latency_jitter)
+            roll = self.random.random()
+        time.sleep(delay)
+        if roll < self.throttle_rate:
+            raise IOError("HTTP Error 429: Too Many Requests (replay)")
+        if roll < self.throttle_rate + self.error_rate:
+            raise IOError("Injected replay error")
+        return roll < self.throttle_rate + self.error_rate + self.empty_rate
+
+    def info(self, symbol):
+        empty = self.simulate_network()
+        return {} if empty else dict(self.payload(symbol)['info'])
+
+    def history(self, symbol, period=None, start=None, end=None, interval='1d', **history_kwargs):
+        empty = self.simulate_network()
+        frame = self.payload(symbol)['daily' if interval == '1d' else 'minutely']
+        if empty:
+            return frame.iloc[:0].copy()
+        index = frame.index.tz_localize(None) if frame.index.tz is not None else frame.index
+        mask = np.ones(len(frame.index), dtype=bool)
+        if start is not None:
+            mask &= index >= pd.Timestamp(start)
+        if end is not None:
+            mask &= index < pd.Timestamp(end)
+        return frame[mask].copy()
+
+    def actions(self, symbol):
+        empty = self.simulate_network()
+        frame = self.payload(symbol)['actions']
+        return frame.iloc[:0].copy() if empty else frame.copy()
+
+    def download(self, symbols, group_by='ticker', **download_kwargs):
+        empty = self.simulate_network()
+        frames = {}
+        for symbol in symbols:
+            try:
+                daily = self.payload(symbol)['daily']
+            except KeyError:
+                continue
+            frames[symbol] = daily.tz_localize(None)[DB_YFINANCE_COLUMNS['price_daily']]
+        if empty or not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis=1).sort_index()
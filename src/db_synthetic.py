@@ -0,0 +1,115 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.db_adjust import adjustment_factors
+from src.db_class import FinanceDB
+from src.db_convert import timeseries_to_rows
+from src.db_sources import synthetic_ohlcv
+from src.db_writer import DBWriter
+
+SYNTHETIC_EXCHANGE = ('SYN', 'America/New_York', 'EST')
+SPLIT_RATIOS = np.array([2.0, 3.0, 4.0, 0.5])  # 0.5: 1-for-2 reverse split
+
+
+def synthetic_actions(daily_index, rng, dividend_probability=0.5, splits_per_year=0.05):
+    """
+    Quarterly dividends (as a fraction of price) for a dividend_probability share of tickers, and random splits
+
+    Returns
+        days (np.ndarray), dividend_yields (np.ndarray), splits (np.ndarray) sorted by day
+    """
+    num_days = len(daily_index)
+    dividend_days = np.zeros(0, dtype=int)
+    if rng.random() < dividend_probability:
+        dividend_days = np.arange(rng.integers(0, 63), num_days, 63)  # about every quarter
+    num_splits = rng.poisson(splits_per_year * num_days / 252)
+    split_days = np.sort(rng.choice(np.arange(1, num_days), size=min(num_splits, num_days - 1), replace=False))
+
+    days = np.union1d(dividend_days, split_days)
+    dividend_yields = np.where(np.isin(days, dividend_days), rng.uniform(0.002, 0.01, len(days)), 0.0)
+    splits = np.where(np.isin(days, split_days), rng.choice(SPLIT_RATIOS, len(days)), 0.0)
+    return days, dividend_yields, splits
+
+
+def synthetic_ticker_data(symbol, rng, daily_index, minutely_sessions, schema_version=1, price_decimals=None):
+    """
+    Synthetic ticker_data (see FinanceDB.fetch_ticker_data) with consistent adjusted closes for its actions, prices
+    rounded to price_decimals if given
+    """
+    daily = synthetic_ohlcv(daily_index, rng, start_price=rng.uniform(5, 500), decimals=price_decimals)
+
+    minutes = [pd.date_range(session + pd.Timedelta(hours=9, minutes=30), periods=390, freq='min')
+               for session in minutely_sessions]
+    minutely_index = pd.DatetimeIndex(np.concatenate(minutes)).tz_localize('America/New_York')
+    minutely = synthetic_ohlcv(minutely_index, rng, start_price=daily['Close'].iloc[-1], volatility=0.001,
+                               decimals=price_decimals)
+
+    days, dividend_yields, splits = synthetic_actions(daily_index, rng)
+    close = daily['Close'].to_numpy()
+    prev_closes = close[np.maximum(days - 1, 0)]
+    dividends = np.round(dividend_yields * prev_closes, 4)
+    if len(days):
+        # Close is already split-continuous (as yahoo's is), so Adj Close only adds the dividend factors
+        adj_factor, _, _ = adjustment_factors(dividends, np.zeros(len(days)), prev_closes)
+        event_dates = daily_index[days]
+        for frame in [daily, minutely]:
+            # rows before event i are scaled by the cumulative factor of events i, i + 1, ...
+            next_event = np.searchsorted(event_dates.asi8, frame.index.asi8, side='right')
+            factor = np.append(adj_factor, 1.0)[next_event]
+            frame['Adj Close'] = frame['Close'].to_numpy() * factor
+    actions = pd.DataFrame({'Dividends': dividends, 'Stock Splits': splits}, index=daily_index[days])
+
+    exchange_row, security_row = FinanceDB.security_rows(symbol, {
+        'shortName': symbol, 'longName': '%s Synthetic Inc.' % symbol, 'exchange': SYNTHETIC_EXCHANGE[0],
+        'exchangeTimezoneName': SYNTHETIC_EXCHANGE[1], 'exchangeTimezoneShortName': SYNTHETIC_EXCHANGE[2],
+        'currency': 'USD', 'quoteType': 'EQUITY', 'market': 'synthetic_market'})
+    return {'symbol': symbol,
+            'exchange': exchange_row,
+            'security': security_row,
+            'price_daily': timeseries_to_rows(symbol, daily, 'price_daily', schema_version=schema_version),
+            'price_minutely': [timeseries_to_rows(symbol, minutely, 'price_minutely', schema_version=schema_version)],
+            'actions': timeseries_to_rows(symbol, actions, 'actions', schema_version=schema_version)}
+
+
+def generate_synthetic_db(db_filename, num_tickers=100, years=10, minutely_days=30, seed=0, prefix='SYN',
+                          transaction_batch_size=16, price_decimals=None, **schema):
+    """
+    Writes num_tickers synthetic tickers with years of daily bars, minutely_days of minutely bars and actions through
+    DBWriter; schema holds the FinanceDB schema options of a new database
+
+    Returns
+        db_path, rowcounts (dict: table name -> rows written)
+    """
+    finance_db = FinanceDB(db_filename, **schema)
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+    daily_index = pd.bdate_range(end=end, periods=252 * years, tz='America/New_York')
+    minutely_sessions = pd.bdate_range(end=end, periods=minutely_days)
+
+    rowcounts = {'price_daily': 0, 'price_minutely': 0, 'actions': 0}
+    start = time.perf_counter()
+    with DBWriter(finance_db.db_path, finance_db.read_only, batch_size=transaction_batch_size) as writer:
+        for i in range(num_tickers):
+            symbol = '%s%05d' % (prefix, i)
+            ticker_data = synthetic_ticker_data(symbol, rng, daily_index, minutely_sessions, finance_db.schema_version,
+                                                price_decimals)
+            written = writer.write_ticker(ticker_data)
+            for table in rowcounts:
+                rowcounts[table] += written[table]
+            if (i + 1) % 50 == 0:
+                print('%d of %d synthetic tickers written' % (i + 1, num_tickers))
+    elapsed = time.perf_counter() - start
+
+    total_rows = sum(rowcounts.values())
+    size_mb = os.path.getsize(finance_db.db_path) / 1024 ** 2
+    print('Generated synthetic db:', finance_db.db_path)
+    print('Rows written:', rowcounts)
+    print('%.1f s, %.0f rows/s, %.1f MB' % (elapsed, total_rows / elapsed, size_mb))
+    return finance_db.db_path, rowcounts
+
+
+if __name__ == '__main__':
+    generate_synthetic_db('synthetic_finance.db', num_tickers=100, years=10, minutely_days=30)
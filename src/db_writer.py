@@ -0,0 +1,309 @@
+import os
+import sqlite3
+
+from src.db_adjust import readjust_for_actions
+from src.db_archive import MinutelyArchive
+from src.db_engine import ConnectionPool
+from src.db_parquet import ParquetStore
+from src.db_partitions import MinutelyPartitions
+from src.db_schema import detect_schema
+
+
+class DBWriter:
+    """
+    Bulk writer for FinanceDB: one connection (and one per minutely partition) with the BULK_LOAD_PRAGMAS profile,
+    cached INSERT statements, a savepoint per ticker and a commit every batch_size tickers. Use
+
+    with DBWriter(file, read_only, batch_size=16) as writer:
+        writer.write_ticker(ticker_data)
+    """
+
+    BULK_LOAD_PRAGMAS = {'journal_mode': 'WAL',
+                         'synchronous': 'NORMAL',
+                         'cache_size': -262144}  # negative: size in KiB, i.e. 256 MiB
+
+    def __init__(self, db_filename, read_only, batch_size=16, bulk_load=True, journal_table=None):
+        self.db_filename = db_filename
+        self.read_only = read_only
+        self.batch_size = batch_size
+        self.bulk_load = bulk_load and not read_only
+        self.table_columns = {}
+        self.insert_statements = {}
+        self.tickers_in_transaction = 0
+        self.restore_pragmas = {}
+        self.journal_table = journal_table  # table recording the written (ticker, table) units, in their savepoint
+        self.ticker_ids = {}  # ticker -> security_id
+        self.partition_connections = {}  # partition key -> (connection, pragmas to restore), opened on first use
+        self.in_ticker_savepoint = False
+        self.partitions_in_savepoint = set()  # partitions written by the ticker being written
+        self.written_since = {}  # ticker -> {price table: earliest date written}, to append to the parquet backend
+        self.readjusted_tickers = set()  # tickers to re-export whole to the parquet backend
+
+    def connect(self, db_filename):
+        """
+        Connection in autocommit mode (transactions are explicit) with the bulk-load profile, and the settings to
+        restore before closing it
+        """
+        connection = sqlite3.connect(db_filename, isolation_level=None)
+        connection.execute("PRAGMA foreign_keys = 1")
+        if self.read_only:
+            connection.execute("PRAGMA query_only = ON")
+        restore_pragmas = {}
+        if self.bulk_load:
+            for pragma, value in self.BULK_LOAD_PRAGMAS.items():
+                restore_pragmas[pragma] = connection.execute("PRAGMA %s" % pragma).fetchone()[0]
+                connection.execute("PRAGMA %s = %s" % (pragma, value))
+        return connection, restore_pragmas
+
+    @staticmethod
+    def close(connection, restore_pragmas, commit):
+        connection.execute("COMMIT" if commit else "ROLLBACK")
+        for pragma, value in restore_pragmas.items():
+            connection.execute("PRAGMA %s = %s" % (pragma, value))
+        connection.close()
+
+    def __enter__(self):
+        self.connection, self.restore_pragmas = self.connect(self.db_filename)
+        self.cursor = self.connection.cursor()
+        self.ticker_column = 'security_id' if 'security_id' in self.columns('price_daily') else 'security_ticker'
+        schema = detect_schema(self.cursor)
+        self.partitions = None if schema is None else MinutelyPartitions.detect(self.cursor, self.db_filename, schema)
+        self.parquet = ParquetStore.detect(self.cursor, self.db_filename)
+        self.archive = None if schema is None else MinutelyArchive.detect(self.cursor, schema)
+        if self.journal_table is not None:
+            self.cursor.execute("CREATE TABLE IF NOT EXISTS %s (security_ticker TEXT, unit TEXT, "
+                                "PRIMARY KEY (security_ticker, unit))" % self.journal_table)
+        self.cursor.execute("BEGIN")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            print(exc_type, exc_value)
+        for connection, restore_pragmas in self.partition_connections.values():
+            self.close(connection, restore_pragmas, exc_type is None)
+        self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        if exc_type is None and self.parquet is not None:
+            self.export_parquet()
+        if self.restore_pragmas:
+            ConnectionPool.release(self.db_filename)  # leaving WAL needs the only open connection
+        for pragma, value in self.restore_pragmas.items():
+            self.connection.execute("PRAGMA %s = %s" % (pragma, value))
+        self.connection.close()
+        return
+
+    def export_parquet(self):
+        """
+        Appends the price rows written since the earliest written date of each ticker to its parquet files, and
+        re-exports the readjusted tickers whole
+        """
+        keys = {ticker: ticker for ticker in set(self.written_since) | self.readjusted_tickers}
+        if self.ticker_column == 'security_id':  # tickers rolled back before getting a security_id have no rows
+            keys = {ticker: self.ticker_ids[ticker] for ticker in keys if ticker in self.ticker_ids}
+        readjusted = {key: ticker for ticker, key in keys.items() if ticker in self.readjusted_tickers}
+        if readjusted:
+            self.parquet.export_tickers(self.cursor, readjusted, self.partitions)
+        appended = {key: ticker for ticker, key in keys.items() if key not in readjusted}
+        if appended:
+            self.parquet.export_tickers(self.cursor, appended, self.partitions,
+                                        since={key: self.written_since[ticker] for key, ticker in appended.items()})
+
+    def columns(self, table):
+        """
+        Column names of table, read once with PRAGMA table_info and cached
+        """
+        if table not in self.table_columns:
+            self.cursor.execute("PRAGMA table_info(%s)" % table)
+            self.table_columns[table] = [row[1] for row in self.cursor.fetchall()]
+        return self.table_columns[table]
+
+    def insert_statement(self, table, conflict='IGNORE'):
+        key = (table, conflict)
+        if key not in self.insert_statements:
+            wildcards = ','.join(['?'] * len(self.columns(table)))
+            self.insert_statements[key] = "INSERT OR %s INTO %s VALUES (%s)" % (conflict, table, wildcards)
+        return self.insert_statements[key]
+
+    def insert(self, table, rows, conflict='IGNORE'):
+        """
+        Inserts an iterable of row tuples into table within the current transaction, returns the rowcount
+        """
+        self.cursor.executemany(self.insert_statement(table, conflict), rows)
+        return max(self.cursor.rowcount, 0)
+
+    def partition_cursor(self, key):
+        """
+        Cursor on the partition file key (created if needed), inside the current transaction and ticker savepoint
+        """
+        if key not in self.partition_connections:
+            os.makedirs(self.partitions.directory, exist_ok=True)
+            connection, restore_pragmas = self.connect(self.partitions.path(key))
+            self.partitions.create_table(connection.cursor())
+            connection.execute("BEGIN")
+            self.partition_connections[key] = (connection, restore_pragmas)
+        cursor = self.partition_connections[key][0].cursor()
+        if self.in_ticker_savepoint and key not in self.partitions_in_savepoint:
+            cursor.execute("SAVEPOINT ticker")
+            self.partitions_in_savepoint.add(key)
+        return cursor
+
+    def insert_partitioned(self, rows, conflict='IGNORE'):
+        """
+        Inserts price_minutely rows into the partition file of their date
+        """
+        partition_rows = {}
+        for row in rows:
+            partition_rows.setdefault(self.partitions.key(row[0]), []).append(row)
+        rowcount = 0
+        for key, key_rows in partition_rows.items():
+            cursor = self.partition_cursor(key)
+            cursor.executemany(self.insert_statement('price_minutely', conflict), key_rows)
+            rowcount += max(cursor.rowcount, 0)
+        return rowcount
+
+    def end_savepoints(self, rollback=False):
+        """
+        Releases (after rolling back, if rollback) the ticker savepoint in the partitions written by the ticker
+        """
+        for key in self.partitions_in_savepoint:
+            connection = self.partition_connections[key][0]
+            if rollback:
+                connection.execute("ROLLBACK TO ticker")
+            connection.execute("RELEASE ticker")
+        self.partitions_in_savepoint = set()
+        self.in_ticker_savepoint = False
+
+    def security_id(self, ticker):
+        if ticker not in self.ticker_ids:
+            self.cursor.execute("SELECT security_id FROM security WHERE ticker=?", (ticker,))
+            row = self.cursor.fetchone()
+            if row is None:
+                raise KeyError("%s is not in the security table" % ticker)
+            self.ticker_ids[ticker] = row[0]
+        return self.ticker_ids[ticker]
+
+    def ticker_key(self, ticker):
+        """
+        Value of ticker_column identifying ticker in the price and actions tables
+        """
+        return self.security_id(ticker) if self.ticker_column == 'security_id' else ticker
+
+    def insert_security(self, security_row):
+        """
+        Inserts or updates the security row (tuple starting with the ticker). With integer security ids the row is
+        updated in place, so its security_id (referenced by the price tables) is kept.
+        """
+        if self.ticker_column == 'security_ticker':
+            return self.insert('security', [security_row], conflict='REPLACE')
+        columns = self.columns('security')[1:]  # without security_id
+        self.cursor.execute("INSERT INTO security (%s) VALUES (%s) ON CONFLICT(ticker) DO UPDATE SET %s"
+                            % (','.join(columns), ','.join(['?'] * len(columns)),
+                               ','.join('%s=excluded.%s' % (column, column) for column in columns[1:])),
+                            security_row)
+        return max(self.cursor.rowcount, 0)
+
+    def insert_timeseries(self, table, ticker, rows, conflict='IGNORE'):
+        """
+        Inserts rows (date, ..., ticker) of one ticker into price_daily, price_minutely or actions
+        """
+        if table != 'actions' and self.parquet is not None:
+            rows = list(rows)
+            if rows:
+                first = min(row[0] for row in rows)
+                since = self.written_since.setdefault(ticker, {})
+                since[table] = min(first, since.get(table, first))
+        if self.ticker_column == 'security_id':
+            security_id = self.security_id(ticker)
+            rows = (row[:-1] + (security_id,) for row in rows)
+        if table == 'price_minutely' and self.partitions is not None:
+            return self.insert_partitioned(rows, conflict)
+        return self.insert(table, rows, conflict)
+
+    def write_ticker(self, ticker_data, conflict='IGNORE', adjust_ohlcv=False):
+        """
+        Inserts the output of FinanceDB.fetch_ticker_data (or fetch_ticker_update) in one savepoint, re-adjusting
+        the older stored prices for its new_actions if any
+
+        Returns
+            rowcounts (dict) : table name -> number of rows written
+        """
+        rowcounts = {}
+        symbol = ticker_data['symbol']
+        self.cursor.execute("SAVEPOINT ticker")
+        self.in_ticker_savepoint = True
+        try:
+            if 'exchange' in ticker_data:
+                rowcounts['exchange'] = self.insert('exchange', [ticker_data['exchange']])
+            if 'security' in ticker_data:
+                rowcounts['security'] = self.insert_security(ticker_data['security'])
+            if 'price_daily' in ticker_data:
+                rowcounts['price_daily'] = self.insert_timeseries('price_daily', symbol, ticker_data['price_daily'],
+                                                                  conflict)
+            if 'price_minutely' in ticker_data:
+                rowcounts['price_minutely'] = 0
+                for minutely_data in ticker_data['price_minutely']:
+                    rowcounts['price_minutely'] += self.insert_timeseries('price_minutely', symbol, minutely_data,
+                                                                          conflict)
+            if 'actions' in ticker_data:
+                rowcounts['actions'] = self.insert_timeseries('actions', symbol, ticker_data['actions'])
+            if ticker_data.get('new_actions') is not None and not ticker_data['new_actions'].empty:
+                adjusted = self.readjust(symbol, ticker_data['new_actions'], ticker_data['stale_before'],
+                                         ohlcv=adjust_ohlcv)
+                for table, rowcount in adjusted.items():
+                    rowcounts[table + '_adjusted'] = rowcount
+            if self.journal_table is not None:
+                units = [unit for unit in ['security', 'price_daily', 'price_minutely', 'actions']
+                         if unit in ticker_data]
+                self.cursor.executemany("INSERT OR IGNORE INTO %s VALUES (?,?)" % self.journal_table,
+                                        [(symbol, unit) for unit in units])
+        except Exception:
+            self.end_savepoints(rollback=True)
+            self.cursor.execute("ROLLBACK TO ticker")
+            self.cursor.execute("RELEASE ticker")
+            self.ticker_ids.pop(symbol, None)  # its security row may have been rolled back
+            raise
+        self.end_savepoints()
+        self.cursor.execute("RELEASE ticker")
+
+        self.tickers_in_transaction += 1
+        if self.tickers_in_transaction >= self.batch_size:
+            self.commit()
+        return rowcounts
+
+    def readjust(self, ticker, actions_df, stale_before, ohlcv=False):
+        """
+        Re-adjusts the stored prices of ticker for actions_df within the current transaction, see
+        db_adjust.readjust_for_actions
+        """
+        if actions_df.empty:
+            return {}
+        self.readjusted_tickers.add(ticker)
+        if self.archive is not None and 'price_minutely' in stale_before:
+            # archived days are immutable, the affected ones go back to price_minutely
+            self.archive.restore(self.cursor, self.ticker_key(ticker),
+                                 min(stale_before['price_minutely'], max(actions_df['date'])))
+        return readjust_for_actions(self.cursor, self.ticker_key(ticker), actions_df, stale_before, ohlcv=ohlcv,
+                                    ticker_column=self.ticker_column,
+                                    minutely_cursors=self.stale_partition_cursors(actions_df, stale_before))
+
+    def stale_partition_cursors(self, actions_df, stale_before):
+        """
+        Cursors on the partitions holding minutely rows to re-adjust for actions_df (see
+        db_adjust.readjust_for_actions), None if price_minutely is not partitioned
+        """
+        if self.partitions is None or 'price_minutely' not in stale_before:
+            return None
+        end = min(stale_before['price_minutely'], max(actions_df['date']))
+        return [self.partition_cursor(key) for key in self.partitions.overlapping(None, end)]
+
+    def commit(self):
+        """
+        Commits the current transaction and starts the next one
+        """
+        # partitions first: a crash in between leaves minutely rows the next load re-inserts or ignores
+        for connection, _ in self.partition_connections.values():
+            connection.execute("COMMIT")
+        self.cursor.execute("COMMIT")
+        for connection, _ in self.partition_connections.values():
+            connection.execute("BEGIN")
+        self.cursor.execute("BEGIN")
+        self.tickers_in_transaction = 0
@@ -97,13 +97,32 @@ def postprocess_db_timedata_per_ticker(df):
     - Removes 'adjusted_close' and 'security_ticker'
     - The index of the returned dataframe will be <class 'pandas._libs.tslibs.timestamps.Timestamp'>
         - Note: that class inherits from datetime.datetime
+    - Schema v2 databases already return a timezone-aware DatetimeIndex; it is only converted to DB_ASSUMED_TZ
     """
-    df.drop(columns=['adjusted_close', 'security_ticker'], inplace=True)
+    df.drop(columns=['adjusted_close', 'security_ticker'], inplace=True, errors='ignore')
+    if isinstance(df.index, pd.DatetimeIndex):
+        df.index = df.index.tz_convert(DB_ASSUMED_TZ)
+        return df
     df.set_index(pd.DatetimeIndex(df['date']), inplace=True)
     df.index = df.index.tz_localize(DB_ASSUMED_TZ)
     return df
 
 
+def load_timeseries(finance_db, ticker, interval='days', start=None, end=None):
+    """ Fetches the postprocessed OHLCV rows of ticker with dates in [start, end) for plot_timeseries_fancy,
+    reading only that window from the database
+
+    Inputs:
+    - start, end: datetime.datetime objects or strings, naive ones are exchange wall time (None for unbounded)
+    """
+    columns = ['open', 'high', 'low', 'close', 'volume']
+    if interval == 'days':
+        df = finance_db.get_daily_per_ticker(ticker, start=start, end=end, columns=columns)
+    else:
+        df = finance_db.get_minutely_per_ticker(ticker, start=start, end=end, columns=columns)
+    return postprocess_db_timedata_per_ticker(df)
+
+
 if __name__ == '__main__':
 
     # specify which database and instantiate the FinanceDB class
@@ -115,13 +134,11 @@ if __name__ == '__main__':
     ticker = 'MSFT'  # e.g. 'AAPL', 'MSFT', 'CADUSD=X', 'BTC-USD'
 
     # plot daily data
-    df = finance_db.get_daily_per_ticker(ticker)
-    df = postprocess_db_timedata_per_ticker(df)
-    plot_timeseries_fancy(df, ticker, interval='days', start='2020-01-01', end='2021-11-21')
+    df = load_timeseries(finance_db, ticker, interval='days', start='2020-01-01', end='2021-11-21')
+    plot_timeseries_fancy(df, ticker, interval='days')
 
     # plot minutely data data
-    df = finance_db.get_minutely_per_ticker(ticker)
-    df = postprocess_db_timedata_per_ticker(df)
-    minutely_start = df.index.max() - timedelta(days=10)
-    minutely_end = df.index.max() - timedelta(days=8)
-    plot_timeseries_fancy(df, ticker, interval='minutes', start=minutely_start, end=minutely_end)
+    latest = finance_db.high_water_marks('price_minutely')[ticker]
+    df = load_timeseries(finance_db, ticker, interval='minutes', start=latest - timedelta(days=10),
+                         end=latest - timedelta(days=8))
+    plot_timeseries_fancy(df, ticker, interval='minutes')
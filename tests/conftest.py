@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.db_class import FinanceDB
+from src.db_migrate import archive_minutely
+from src.db_scheduler import RequestScheduler
+from src.db_sources import ReplaySource
+
+TICKERS = ['AAA', 'BBB']
+LAYOUTS = {'plain': {},
+           'partitioned': {'minutely_partitions': 'month'},
+           'archived': {},  # plain, then db_migrate.archive_minutely
+           'parquet': {'price_backend': 'parquet'}}
+
+
+@pytest.fixture
+def make_db(tmp_path):
+    """
+    Factory of FinanceDB instances on a fresh file in tmp_path, loaded with TICKERS from a synthetic ReplaySource
+    (no network) in one of LAYOUTS
+    """
+    def make(layout='plain', tickers=TICKERS):
+        source = ReplaySource(synthetic_years=2)
+        scheduler = RequestScheduler(rate=1000.0, max_rate=1000.0, burst=1000, backoff_base=0.0)
+        db_path = str(tmp_path / ('%s.db' % layout))
+        finance_db = FinanceDB(db_path, source=source, scheduler=scheduler, **LAYOUTS[layout])
+        report = finance_db.add_tickers(tickers, workers=2)
+        assert all(error is None for error in report.values()), report
+        if layout == 'archived':
+            archive_minutely(db_path, vacuum=False)
+            finance_db = FinanceDB(db_path, source=source, scheduler=scheduler)
+            assert finance_db.archive is not None
+        return finance_db
+
+    return make
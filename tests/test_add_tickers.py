@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import TICKERS
+from src import db_class
+from src.db_class import FinanceDB
+from src.db_scheduler import RequestScheduler
+from src.db_sources import ReplaySource
+from src.db_writer import DBWriter
+
+
+class FailingDownloadSource(ReplaySource):
+    def download(self, symbols, **download_kwargs):
+        raise IOError("batch download unavailable")
+
+
+@pytest.mark.parametrize('missing', [[], ['CCC']])
+def test_failed_daily_batch_falls_back_per_ticker(tmp_path, missing):
+    source = FailingDownloadSource(synthetic=not missing)
+    if missing:
+        source.payloads = {ticker: ReplaySource().payload(ticker) for ticker in TICKERS}
+    scheduler = RequestScheduler(rate=1000.0, max_rate=1000.0, burst=1000, backoff_base=0.0, max_retries=0)
+    finance_db = FinanceDB(str(tmp_path / 'batched.db'), source=source, scheduler=scheduler)
+    report = finance_db.add_tickers(TICKERS + missing, workers=2, daily_batch_size=2)
+    assert [report[ticker] for ticker in TICKERS] == [None, None]
+    for ticker in TICKERS:
+        assert len(finance_db.get_daily_per_ticker(ticker)) == 252 * 10
+    for ticker in missing:
+        assert 'daily batch download failed, OSError: batch download unavailable' in report[ticker]
+
+
+def test_add_ticker_without_bulk_load(make_db, monkeypatch):
+    finance_db = make_db(tickers=TICKERS[:1])
+    bulk_loads = []
+
+    class RecordingWriter(DBWriter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            bulk_loads.append(self.bulk_load)
+
+    monkeypatch.setattr(db_class, 'DBWriter', RecordingWriter)
+    finance_db.add_ticker(TICKERS[1])
+    assert bulk_loads == [False]
+    assert len(finance_db.get_daily_per_ticker(TICKERS[1])) > 0
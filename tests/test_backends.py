@@ -0,0 +1,41 @@
+import pytest
+
+from conftest import LAYOUTS, TICKERS
+from src.db_class import FinanceDB
+from src.db_default import DB_FROZEN_VARIANTS
+from src.db_integrity import file_md5
+
+TABLES = ['price_daily', 'price_minutely']
+
+
+@pytest.fixture
+def layouts(make_db, monkeypatch):
+    """
+    The same replayed tickers in every layout of LAYOUTS, and read through the column cache of a frozen copy
+    """
+    finance_dbs = {layout: make_db(layout) for layout in LAYOUTS}
+    db_path = finance_dbs['plain'].db_path
+    finance_dbs['plain'].close()
+    monkeypatch.setitem(DB_FROZEN_VARIANTS, 'test', {'tickers': TICKERS, 'db_filename': db_path,
+                                                     'md5sum': file_md5(db_path)})
+    finance_dbs['column_cache'] = FinanceDB(db_path, column_cache=True)
+    return finance_dbs
+
+
+def windows(finance_db, table, ticker):
+    dates = finance_db.ticker_rows(table, ticker, columns=[])['date'].tolist()
+    first, middle, last = dates[len(dates) // 4], dates[len(dates) // 2], dates[-1]
+    return [(None, None), (first, None), (None, middle), (first, middle), (middle, last)]
+
+
+def test_ticker_rows_match_across_backends(layouts):
+    reference = layouts['plain']
+    for table in TABLES:
+        for ticker in TICKERS:
+            for start, end in windows(reference, table, ticker):
+                for columns, limit in [(None, None), (['close'], None), (None, 100)]:
+                    expected = reference.ticker_rows(table, ticker, start, end, columns, limit)
+                    assert len(expected) > 0
+                    for layout, finance_db in layouts.items():
+                        df = finance_db.ticker_rows(table, ticker, start, end, columns, limit)
+                        assert df.equals(expected), (layout, table, ticker, start, end, columns, limit)
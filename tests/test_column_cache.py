@@ -0,0 +1,16 @@
+import os
+
+import pandas as pd
+
+from src.db_column_cache import ColumnCache
+
+
+def test_build_over_interrupted_build(tmp_path):
+    cache = ColumnCache(str(tmp_path / 'frozen.db'), 'md5sum')
+    stale_ticker_dir = cache.ticker_dir('price_daily', 'AAA', '%s.%d.tmp' % (cache.directory, os.getpid()))
+    os.makedirs(stale_ticker_dir)
+    df = pd.DataFrame({'date': ['2024-01-02 00:00:00', '2024-01-03 00:00:00'], 'close': [1.0, 2.0],
+                       'security_ticker': ['AAA', 'AAA']})
+    assert cache.build([('price_daily', 'AAA', df)]) == []
+    assert cache.is_built()
+    assert cache.columns('price_daily', 'AAA')['close'].tolist() == [1.0, 2.0]
@@ -0,0 +1,27 @@
+import os
+import shutil
+
+from conftest import TICKERS
+from src.db_class import FinanceDB
+
+
+def test_recreate_db_at_same_path(make_db):
+    finance_db = make_db(tickers=TICKERS[:1])
+    db_path = finance_db.db_path
+    assert finance_db.get_present_tickers() == TICKERS[:1]  # leaves an idle pooled connection to the file
+    os.remove(db_path)
+    recreated = FinanceDB(db_path, source=finance_db.source, scheduler=finance_db.scheduler)
+    assert os.path.isfile(db_path)
+    recreated.add_ticker(TICKERS[1])
+    assert recreated.get_present_tickers() == [TICKERS[1]]
+
+
+def test_replace_db_at_same_path(make_db, tmp_path):
+    finance_db = make_db(tickers=TICKERS[:1])
+    db_path = finance_db.db_path
+    assert finance_db.get_present_tickers() == TICKERS[:1]
+    other = FinanceDB(str(tmp_path / 'other.db'), source=finance_db.source, scheduler=finance_db.scheduler)
+    other.add_ticker(TICKERS[1])
+    shutil.copy(other.db_path, db_path + '.tmp')
+    os.replace(db_path + '.tmp', db_path)
+    assert finance_db.get_present_tickers() == [TICKERS[1]]
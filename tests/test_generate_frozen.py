@@ -0,0 +1,52 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import TICKERS
+from src.db_generate_frozen import generate_frozen_db
+from src.db_integrity import file_md5
+from src.db_scheduler import RequestScheduler
+from src.db_sources import ReplaySource
+
+# builds TICKERS into sys.argv[1] and kills the process while downloading the second ticker, after the first
+# DBWriter switched the db to WAL
+CRASHING_BUILD = """
+import os
+import sys
+from src.db_generate_frozen import generate_frozen_db
+from src.db_scheduler import RequestScheduler
+from src.db_sources import ReplaySource
+
+
+class CrashingSource(ReplaySource):
+    def info(self, symbol):
+        if symbol == %r:
+            os._exit(1)
+        return super().info(symbol)
+
+
+generate_frozen_db(%r, sys.argv[1], workers=1, source=CrashingSource(synthetic_years=2),
+                   scheduler=RequestScheduler(rate=1000.0, max_rate=1000.0, burst=1000, backoff_base=0.0))
+""" % (TICKERS[1], TICKERS)
+
+
+def test_resume_after_kill(tmp_path):
+    db_path = str(tmp_path / 'frozen.db')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    crashed = subprocess.run([sys.executable, '-c', CRASHING_BUILD, db_path], cwd=root, capture_output=True)
+    assert crashed.returncode == 1, crashed.stderr
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    connection.close()
+
+    scheduler = RequestScheduler(rate=1000.0, max_rate=1000.0, burst=1000, backoff_base=0.0)
+    path, checksum = generate_frozen_db(TICKERS, db_path, workers=2, source=ReplaySource(synthetic_years=2),
+                                        scheduler=scheduler)
+    assert path == db_path and checksum is not None
+    assert not os.path.exists(db_path + '-wal')
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == 'delete'
+    assert connection.execute("SELECT COUNT(DISTINCT security_ticker) FROM price_daily").fetchone()[0] == 2
+    connection.close()
+    assert file_md5(db_path) == checksum
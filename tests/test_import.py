@@ -0,0 +1,64 @@
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+from src.db_class import FinanceDB
+from src.db_import import import_legacy
+
+LEGACY_JR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'local_jr', 'financial_db',
+                         'first.db')
+DATES = ['2021-12-%02d' % day for day in [1, 2, 3, 6, 7]]
+
+
+def write_local_ms(path):
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE tickers (symbol TEXT, longName TEXT, exchange TEXT, currency TEXT, "
+                       "quoteType TEXT, market TEXT)")
+    connection.execute("INSERT INTO tickers VALUES ('AAA', 'AAA Inc.', 'NMS', 'USD', 'EQUITY', 'us_market')")
+    connection.execute("CREATE TABLE AAA_days (date TEXT, open REAL, high REAL, low REAL, close REAL, volume INTEGER)")
+    connection.executemany("INSERT INTO AAA_days VALUES (?,?,?,?,?,?)",
+                           [(date, 10.0 + i, 11.0 + i, 9.0 + i, 10.5 + i, 1000 * i) for i, date in enumerate(DATES)])
+    connection.execute("CREATE TABLE AAA_actions (date TEXT, dividend REAL, split REAL)")
+    connection.execute("INSERT INTO AAA_actions VALUES ('2021-12-03', 0.0, 2.0)")
+    connection.commit()
+    connection.close()
+
+
+def write_local_tz(path):
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE daily_info (Year INTEGER, Month INTEGER, Day INTEGER, Open REAL, High REAL, '
+                       'Low REAL, Close REAL, Volume INTEGER, Dividends REAL, "Stock Splits" REAL, Ticker TEXT)')
+    connection.executemany("INSERT INTO daily_info VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                           [(2021, 12, int(date[-2:]), 10.0, 11.0, 9.0, 10.5 + i, 1000, 0.1 if i == 2 else 0.0,
+                             0.0, 'BBB') for i, date in enumerate(DATES)])
+    connection.commit()
+    connection.close()
+
+
+@pytest.mark.parametrize('layout, writer, ticker', [('local_ms', write_local_ms, 'AAA'),
+                                                    ('local_tz', write_local_tz, 'BBB')])
+def test_import_adjusted_close(tmp_path, layout, writer, ticker):
+    legacy_path = str(tmp_path / 'legacy.db')
+    writer(legacy_path)
+    db_path = str(tmp_path / 'imported.db')
+    rowcounts = import_legacy(db_path, legacy_path)
+    assert rowcounts['price_daily'] == len(DATES) and rowcounts['actions'] == 1
+    finance_db = FinanceDB(db_path)
+    daily = finance_db.get_daily_per_ticker(ticker)
+    assert daily['date'].tolist() == [date + ' 00:00:00' for date in DATES]
+    # legacy closes are yfinance history() closes, already adjusted
+    assert daily['adjusted_close'].equals(daily['close'])
+    assert not finance_db.get_panel([ticker], field='adjusted_close').isna().any().any()
+
+
+def test_import_local_jr(tmp_path):
+    db_path = str(tmp_path / 'imported.db')
+    rowcounts = import_legacy(db_path, LEGACY_JR, conflict='REPLACE')
+    assert rowcounts['price_daily'] == 19360
+    finance_db = FinanceDB(db_path)
+    daily = finance_db.get_table('price_daily')
+    assert len(daily) == 19360
+    assert daily['volume'].map(lambda volume: isinstance(volume, int)).all()
+    assert np.isfinite(daily['adjusted_close'].to_numpy(dtype=float)).all()
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from conftest import TICKERS
+from src.db_class import FinanceDB
+from src.db_scheduler import RequestScheduler
+from src.db_sources import ReplaySource
+
+
+class TwoExchangeSource(ReplaySource):
+    """
+    TICKERS[1] trades on a london exchange, the same bars as it would have in New York
+    """
+
+    def synthetic_payload(self, symbol):
+        payload = super().synthetic_payload(symbol)
+        if symbol == TICKERS[1]:
+            payload['info'].update(exchange='LSY', exchangeTimezoneName='Europe/London',
+                                   exchangeTimezoneShortName='GMT')
+            for key in ['daily', 'minutely', 'actions']:
+                payload[key] = payload[key].tz_convert('Europe/London')
+        return payload
+
+
+@pytest.mark.parametrize('schema_version', [1, 2])
+def test_panel_windows_per_ticker(tmp_path, schema_version):
+    scheduler = RequestScheduler(rate=1000.0, max_rate=1000.0, burst=1000, backoff_base=0.0)
+    finance_db = FinanceDB(str(tmp_path / 'panel.db'), source=TwoExchangeSource(synthetic_years=2),
+                           scheduler=scheduler, schema_version=schema_version)
+    finance_db.add_tickers(TICKERS, workers=2)
+    # a session of the replayed minutely bars
+    day = pd.bdate_range(end=pd.Timestamp.today().normalize() - pd.Timedelta(days=1), periods=10)[0].date().isoformat()
+    start, end = day + ' 11:00:00', day + ' 15:00:00'
+    if schema_version == 1:  # naive bounds are compared to the stored wall times as is, aware ones per ticker
+        start, end = start + '-04:00', end + '-04:00'
+    panel = finance_db.get_panel(TICKERS, 'close', start, end, how='outer', interval='minutes')
+    for ticker in TICKERS:
+        expected = finance_db.ticker_rows('price_minutely', ticker, start, end, columns=['close'])['close']
+        assert len(expected) > 0, ticker
+        assert panel[ticker].dropna().tolist() == expected.tolist(), ticker
@@ -0,0 +1,67 @@
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import TICKERS
+from src import db_parquet
+
+TABLES = ['price_daily', 'price_minutely']
+
+
+def assert_parquet_matches_sqlite(finance_db):
+    for table in TABLES:
+        for ticker in TICKERS:
+            expected = finance_db.dataframe_from_query("SELECT * FROM %s WHERE %s=? ORDER BY date"
+                                                       % (table, finance_db.ticker_column), (ticker,))
+            df = finance_db.parquet.read(table, [ticker])
+            pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+
+def part_contents(finance_db):
+    contents = {}
+    for table in TABLES:
+        for ticker in TICKERS:
+            for path in finance_db.parquet.parts(table, ticker):
+                with open(path, 'rb') as f:
+                    contents[path] = f.read()
+    return contents
+
+
+def test_update_appends_parts(make_db, monkeypatch):
+    monkeypatch.setattr(db_parquet, 'PARQUET_PART_ROWS', 1000)
+    finance_db = make_db('parquet')
+    before = part_contents(finance_db)
+    assert len(finance_db.parquet.parts('price_minutely', TICKERS[0])) > 2
+    finance_db.update(workers=2)
+    assert_parquet_matches_sqlite(finance_db)
+    after = part_contents(finance_db)
+    # the update replaces the rows from the start of the latest stored day: the older files are kept as they are
+    for table in TABLES:
+        for ticker in TICKERS:
+            ticker_dir = finance_db.parquet.ticker_dir(table, ticker)
+            paths = sorted(path for path in before if os.path.dirname(path) == ticker_dir)
+            kept = [path for path in paths if path in after]
+            assert kept == paths[:len(kept)] and len(kept) >= len(paths) - 2, (table, ticker)
+            assert all(after[path] == before[path] for path in kept), (table, ticker)
+
+
+def test_small_parts_merged(make_db, monkeypatch):
+    monkeypatch.setattr(db_parquet, 'PARQUET_MAX_SMALL_PARTS', 2)
+    finance_db = make_db('parquet')
+    for _ in range(4):
+        finance_db.update(workers=2)
+        # the full export, the merged older rows and the rows of the last update
+        assert len(finance_db.parquet.parts('price_daily', TICKERS[0])) <= 3
+    assert_parquet_matches_sqlite(finance_db)
+
+
+@pytest.mark.parametrize('ohlcv', [False, True])
+def test_readjust_exports_whole_ticker(make_db, ohlcv):
+    finance_db = make_db('parquet')
+    finance_db.update(workers=2)
+    split = pd.DataFrame({'date': ['2100-01-04 00:00:00'], 'dividends': [0.0], 'stock_splits': [2.0],
+                          'security_ticker': [TICKERS[0]]})
+    finance_db.readjust_for_actions(TICKERS[0], split, ohlcv=ohlcv)
+    assert len(finance_db.parquet.parts('price_daily', TICKERS[0])) == 1
+    assert_parquet_matches_sqlite(finance_db)
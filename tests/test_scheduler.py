@@ -0,0 +1,11 @@
+import pandas as pd
+
+from src.db_scheduler import RequestScheduler
+
+
+def test_empty_response_retried():
+    responses = [pd.DataFrame(), pd.DataFrame({'Close': [1.0]})]
+    scheduler = RequestScheduler(rate=1000.0, burst=1000, backoff_base=0.0)
+    assert len(scheduler.call(responses.pop, 0, empty_retries=1)) == 1
+    assert scheduler.stats['empty'] == 1
+    assert scheduler.call(lambda: pd.DataFrame(), empty_retries=0).empty
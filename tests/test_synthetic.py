@@ -0,0 +1,16 @@
+import numpy as np
+import pandas as pd
+
+from src.db_synthetic import synthetic_ticker_data
+
+
+def test_adjusted_close_continuous_across_splits():
+    rng = np.random.default_rng(0)
+    daily_index = pd.bdate_range(end='2024-06-28', periods=252 * 20, tz='America/New_York')
+    for i in range(10):
+        ticker_data = synthetic_ticker_data('SYN%05d' % i, rng, daily_index, daily_index[-1:].tz_localize(None))
+        daily = pd.DataFrame(list(ticker_data['price_daily']),
+                             columns=['date', 'open', 'high', 'low', 'close', 'adjusted_close', 'volume', 'ticker'])
+        ratio = (daily['adjusted_close'] / daily['close']).to_numpy()
+        # only dividends (at most 1% of the price) move adjusted_close away from close, splits do not
+        assert np.all(np.abs(np.diff(np.log(ratio))) < 0.011)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import LAYOUTS, TICKERS
+from src.db_class import DBCursor
+
+
+def stored_prices(finance_db):
+    return {(table, ticker): finance_db.ticker_rows(table, ticker)
+            for table in ['price_daily', 'price_minutely'] for ticker in TICKERS}
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_update_round_trip(make_db, layout):
+    finance_db = make_db(layout)
+    before = stored_prices(finance_db)
+    report = finance_db.update(workers=2)
+    assert all(isinstance(outcome, dict) for outcome in report.values()), report
+    for key, df in stored_prices(finance_db).items():
+        # replayed bars are identical, so the stored rows are unchanged and new sessions appended
+        assert df.iloc[:len(before[key])].equals(before[key]), key
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_readjust_without_actions(make_db, layout):
+    finance_db = make_db(layout)
+    before = stored_prices(finance_db)
+    no_actions = pd.DataFrame(columns=['date', 'dividends', 'stock_splits', 'security_ticker'])
+    assert finance_db.readjust_for_actions(TICKERS[0], no_actions) == {}
+    for key, df in stored_prices(finance_db).items():
+        assert df.equals(before[key]), key
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_update_without_stored_actions(make_db, layout):
+    # e.g. after an empty actions response: the missing actions are stored, the prices are not re-adjusted for them
+    finance_db = make_db(layout)
+    with DBCursor(finance_db.db_path, finance_db.read_only) as cursor:
+        cursor.execute("DELETE FROM actions")
+    before = stored_prices(finance_db)
+    report = finance_db.update(workers=2)
+    assert all(outcome['actions'] == 4 and 'price_daily_adjusted' not in outcome for outcome in report.values())
+    for key, df in stored_prices(finance_db).items():
+        assert df.iloc[:len(before[key])].equals(before[key]), key
+
+
+def test_readjust_split_and_dividend_on_one_date(make_db):
+    finance_db = make_db()
+    before = finance_db.get_daily_per_ticker(TICKERS[0])
+    last_close = before['close'].iloc[-1]
+    actions = pd.DataFrame({'date': ['2100-01-04 00:00:00'], 'dividends': [0.5], 'stock_splits': [2.0],
+                            'security_ticker': [TICKERS[0]]})
+    finance_db.readjust_for_actions(TICKERS[0], actions)
+    after = finance_db.get_daily_per_ticker(TICKERS[0])
+    # the dividend of 0.5 is paid on the post-split close last_close / 2
+    expected = before['adjusted_close'] * 0.5 * (1 - 0.5 / (last_close / 2))
+    assert np.allclose(after['adjusted_close'], expected)
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+def test_readjust_split(make_db, layout):
+    finance_db = make_db(layout)
+    before = stored_prices(finance_db)
+    split = pd.DataFrame({'date': ['2100-01-04 00:00:00'], 'dividends': [0.0], 'stock_splits': [2.0],
+                          'security_ticker': [TICKERS[0]]})
+    rowcounts = finance_db.readjust_for_actions(TICKERS[0], split, ohlcv=True)
+    assert rowcounts == {table: len(before[(table, TICKERS[0])]) for table in ['price_daily', 'price_minutely']}
+    for (table, ticker), df in stored_prices(finance_db).items():
+        factor = 0.5 if ticker == TICKERS[0] else 1.0
+        for column in ['open', 'close', 'adjusted_close']:
+            assert np.allclose(df[column], before[(table, ticker)][column] * factor), (table, ticker, column)
+        assert np.allclose(df['volume'], before[(table, ticker)]['volume'] / factor, atol=1)